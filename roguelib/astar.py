@@ -10,8 +10,11 @@ import grid
 
 # some of these types are deprecated: https://www.python.org/dev/peps/pep-0585/
 from typing import Protocol, Iterator, Tuple, TypeVar, Optional
+from array import array
 import collections
 import heapq
+import time
+import weakref
 T = TypeVar('T')
 
 Location = TypeVar('Location')
@@ -67,13 +70,26 @@ def heuristic(a: GridLocation, b: GridLocation) -> float:
     return abs(x1 - x2) + abs(y1 - y2)
 
 
-def a_star_search(cost_dict, impassable_list, graph: grid.Grid,  start: Location, goal: Location, max_length=100):
-    frontier = PriorityQueue()
+def chebyshev(a: GridLocation, b: GridLocation) -> float:
+    ''' Chebyshev distance: a diagonal step here costs the same as a straight
+    one.  Exact on an open grid of cost-1 tiles, and never an overestimate
+    while every tile costs >= 1 '''
+    return max(abs(a[0] - b[0]), abs(a[1] - b[1]))
+
+
+def a_star_search(cost_dict, impassable_list, graph: grid.Grid,  start: Location, goal: Location, max_length=100,
+                  queue=PriorityQueue, heuristic=heuristic):
+    ''' queue: PriorityQueue or one of the queues.py classes (e.g. queues.BucketQueue for integer costs)
+        heuristic: (loc, goal) -> float, e.g. chebyshev or a landmarks.Landmarks '''
+    frontier = queue()
     frontier.put(start, 0)
     came_from: dict[Location, Optional[Location]] = {}
     cost_so_far: dict[Location, float] = {}
     came_from[start] = None
     cost_so_far[start] = 0
+    # optional - pass impassable_list to prune those tiles from the table
+    index, costs, count = graph.adjacency(cost_dict).views()
+    width, slots = graph.width, grid.Adjacency.SLOTS
     
     while not frontier.empty():
         current: Location = frontier.get()
@@ -81,11 +97,10 @@ def a_star_search(cost_dict, impassable_list, graph: grid.Grid,  start: Location
         if current == goal:
             break
 
-        for next_i in graph.neighbors(current):
-            tile = graph.get_tile(next_i)
-            # optional - don't consider paths in impassable list
-            #if tile in impassable_list: continue
-            cost = cost_dict.get(tile, 1.0)
+        i = current[0] * width + current[1]
+        for k in range(i * slots, i * slots + count[i]):
+            next_i = divmod(index[k], width)
+            cost = costs[k]
             new_cost = cost_so_far[current] + cost
             if new_cost > max_length: continue
             if next_i not in cost_so_far or new_cost < cost_so_far[next_i]:
@@ -96,6 +111,244 @@ def a_star_search(cost_dict, impassable_list, graph: grid.Grid,  start: Location
     return came_from, cost_so_far
 
 
+class GridAStar:
+    ''' A* over flat cell indices (y * width + x) with reusable buffers
+
+    cost-so-far, parent and last-pushed priority live in flat arrays that are
+    allocated once per grid.  Rather than clearing them between searches
+    each entry carries the generation that wrote it, and anything stamped
+    with an older generation reads as unvisited.
+
+    Expansion order, heuristic and tie-breaking match a_star_search, so the
+    returned paths are the same.
+
+    The buffers take about 28 bytes per cell of the grid whatever the search
+    reaches, and the grid's adjacency table is dense for small ArrayGrids
+    only; on anything else a_star_search walks just what it reaches.
+    '''
+
+    def __init__(self, graph: grid.Grid):
+        self.graph = graph
+        n = graph.height * graph.width
+        self.cost_so_far = array('d', bytes(8 * n))
+        self.came_from = array('l', bytes(array('l').itemsize * n))
+        self.priority = array('d', bytes(8 * n))
+        self.stamp = array('L', bytes(array('L').itemsize * n))
+        self.generation = 0
+
+    def search(self, cost_dict, impassable_list, start: GridLocation, goal: GridLocation,
+               max_length=100, heuristic=None) -> list[GridLocation]:
+        ''' Path from start (exclusive) to goal (inclusive), [] if there is none
+
+        heuristic: flat per-cell estimates of the cost to goal (e.g.
+        landmarks.Landmarks.table(goal)) instead of Manhattan distance
+        '''
+        graph = self.graph
+        width, slots = graph.width, grid.Adjacency.SLOTS
+        # like a_star_search, impassable_list is not used to prune the table
+        index, costs, count = graph.adjacency(cost_dict).views()
+        cost_so_far, came_from = self.cost_so_far, self.came_from
+        priority, stamp = self.priority, self.stamp
+        self.generation += 1
+        gen = self.generation
+
+        start_i = start[0] * width + start[1]
+        goal_i = goal[0] * width + goal[1]
+        gy, gx = goal
+        stamp[start_i] = gen
+        cost_so_far[start_i] = 0.0
+        came_from[start_i] = -1
+        priority[start_i] = 0.0
+        frontier = [(0.0, start_i)]
+        pop, push = heapq.heappop, heapq.heappush
+
+        found = False
+        while frontier:
+            f, current = pop(frontier)
+            if current == goal_i:
+                found = True
+                break
+            # stale duplicate of a node that was re-pushed with a better cost
+            if f != priority[current]:
+                continue
+            base = cost_so_far[current]
+            k = current * slots
+            for k in range(k, k + count[current]):
+                next_i = index[k]
+                new_cost = base + costs[k]
+                if new_cost > max_length: continue
+                if stamp[next_i] != gen or new_cost < cost_so_far[next_i]:
+                    stamp[next_i] = gen
+                    cost_so_far[next_i] = new_cost
+                    came_from[next_i] = current
+                    if heuristic is None:
+                        ny, nx = divmod(next_i, width)
+                        f = new_cost + abs(ny - gy) + abs(nx - gx)
+                    else:
+                        f = new_cost + heuristic[next_i]
+                    priority[next_i] = f
+                    push(frontier, (f, next_i))
+
+        if not found or goal_i == start_i:
+            return []
+        path = []
+        current = goal_i
+        while current != start_i:
+            path.append(divmod(current, width))
+            current = came_from[current]
+        path.reverse()
+        return path
+
+
+_engines = weakref.WeakKeyDictionary()
+
+def a_star_path(cost_dict, impassable_list, graph: grid.Grid, start: Location, goal: Location,
+                max_length=100) -> list[Location]:
+    ''' a_star_search + reconstruct_path in one call, on a per-grid GridAStar
+
+    Grids without a dense adjacency table (see GridAStar) go through
+    a_star_search itself.
+    '''
+    if not isinstance(graph, grid.ArrayGrid) or graph.height * graph.width > graph.DENSE_ADJACENCY:
+        came_from, _ = a_star_search(cost_dict, impassable_list, graph, start, goal, max_length)
+        return reconstruct_path(came_from, start, goal)
+    engine = _engines.get(graph)
+    if engine is None:
+        engine = _engines[graph] = GridAStar(graph)
+    return engine.search(cost_dict, impassable_list, start, goal, max_length)
+
+
+class BudgetedSearch:
+    ''' A* that can be run a slice at a time
+
+    Each call to run() expands at most max_expansions cells and/or stops at
+    a time.perf_counter() deadline, then returns; the next call carries on
+    with the same frontier.  Unlike a_star_search, tiles in impassable_list
+    are never entered, so an unreachable goal only floods the region around
+    the start.  While the search is unfinished (or the goal is unreachable)
+    path() gives the best partial path: the one ending at the reached cell
+    with the lowest Manhattan heuristic, ties going to the cheaper cell and
+    then to the one reached first.  old.astar's best_path_so_far made the
+    same kind of choice, but over expanded cells only, by Chebyshev
+    distance, with ties left to heap order.
+
+    If the grid is written to between slices the search starts over.
+
+    Usage::
+
+        search = BudgetedSearch(cost_dict, impassable_list, G, start, goal)
+        if not search.run(max_expansions=500):
+            ...  # try again next tick, or settle for search.path()
+        path = search.path()
+    '''
+
+    # how many expansions between looks at the clock
+    CLOCK_EVERY = 64
+
+    def __init__(self, cost_dict, impassable_list, graph: grid.Grid, start: GridLocation,
+                 goal: GridLocation, max_length=100):
+        self.cost_dict = cost_dict
+        self.impassable_list = tuple(impassable_list)
+        self.graph = graph
+        self.start = start
+        self.goal = goal
+        self.max_length = max_length
+        self.restart()
+
+    def restart(self) -> None:
+        graph = self.graph
+        width = graph.width
+        self.version = graph.version
+        self.start_i = self.start[0] * width + self.start[1]
+        self.goal_i = self.goal[0] * width + self.goal[1]
+        self.frontier = [(0.0, self.start_i)]
+        self.cost_so_far = {self.start_i: 0.0}
+        self.came_from = {self.start_i: -1}
+        self.priority = {self.start_i: 0.0}
+        self.best = (heuristic(self.start, self.goal), 0.0, self.start_i)
+        self.expanded = 0
+        self.done = False
+        self.found = False
+
+    def run(self, max_expansions: Optional[int] = None, deadline: Optional[float] = None) -> bool:
+        ''' Search until done or out of budget; True once the search has finished '''
+        if self.version != self.graph.version:
+            self.restart()
+        if self.done:
+            return True
+        graph = self.graph
+        width, slots = graph.width, grid.Adjacency.SLOTS
+        index, costs, count = graph.adjacency(self.cost_dict, self.impassable_list).views()
+        frontier, cost_so_far = self.frontier, self.cost_so_far
+        came_from, priority = self.came_from, self.priority
+        goal_i, max_length = self.goal_i, self.max_length
+        gy, gx = self.goal
+        best = self.best
+        pop, push = heapq.heappop, heapq.heappush
+        clock = time.perf_counter
+        budget = max_expansions if max_expansions is not None else -1
+        ticks = 0
+
+        while frontier:
+            if budget == 0:
+                break
+            if deadline is not None:
+                ticks += 1
+                if ticks == self.CLOCK_EVERY:
+                    ticks = 0
+                    if clock() >= deadline:
+                        break
+            f, current = pop(frontier)
+            if current == goal_i:
+                self.found = True
+                frontier.clear()
+                break
+            if f != priority[current]:
+                continue
+            budget -= 1
+            self.expanded += 1
+            base = cost_so_far[current]
+            k = current * slots
+            for k in range(k, k + count[current]):
+                next_i = index[k]
+                new_cost = base + costs[k]
+                if new_cost > max_length: continue
+                if next_i not in cost_so_far or new_cost < cost_so_far[next_i]:
+                    cost_so_far[next_i] = new_cost
+                    came_from[next_i] = current
+                    ny, nx = divmod(next_i, width)
+                    h = abs(ny - gy) + abs(nx - gx)
+                    f = new_cost + h
+                    priority[next_i] = f
+                    push(frontier, (f, next_i))
+                    if (h, new_cost) < best[:2]:
+                        best = (h, new_cost, next_i)
+
+        self.best = best
+        self.done = not frontier
+        return self.done
+
+    def path(self) -> list[GridLocation]:
+        ''' Path to goal if found, else to the closest cell reached so far (start exclusive) '''
+        width = self.graph.width
+        current = self.goal_i if self.found else self.best[2]
+        path = []
+        while current != self.start_i:
+            path.append(divmod(current, width))
+            current = self.came_from[current]
+        path.reverse()
+        return path
+
+
+def budgeted_path(cost_dict, impassable_list, graph: grid.Grid, start: GridLocation, goal: GridLocation,
+                  max_length=100, max_expansions: Optional[int] = None,
+                  deadline: Optional[float] = None) -> Tuple[list[GridLocation], bool]:
+    ''' One-shot BudgetedSearch: (path, complete), path is partial when complete is False '''
+    search = BudgetedSearch(cost_dict, impassable_list, graph, start, goal, max_length)
+    search.run(max_expansions, deadline)
+    return search.path(), search.found
+
+
 if __name__ == '__main__':
     start, goal = (1, 4), (8, 3)
 
@@ -114,3 +367,12 @@ if __name__ == '__main__':
         G[p] = '*'
     print (G)
     
+
+    assert a_star_path(cost_dict, impassable_list, G, start, goal) == path
+
+    search = BudgetedSearch(cost_dict, impassable_list, G, start, goal)
+    ticks = 1
+    while not search.run(max_expansions=10):
+        print (f'tick {ticks}: best so far {search.path()}')
+        ticks += 1
+    print (f'tick {ticks}: found {search.found}, {search.path()}')
@@ -0,0 +1,158 @@
+"batch.py - Solve many path queries on one grid in a process pool."
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import astar
+import grid
+from grid import GridLocation
+
+# (start, goal, cost_dict) or (start, goal, cost_dict, impassable_list)
+Query = Tuple
+
+
+#------------------------------
+# Worker side
+#------------------------------
+# per-process state: the attached segment, the grid wrapped around it and
+# one GridAStar engine, kept for as long as the generation doesn't change
+_worker: dict = {}
+
+
+def _attach(name: str, shape: Tuple[int, int], palette: List[str], generation: int) -> astar.GridAStar:
+    state = _worker
+    if state.get("generation") == generation:
+        return state["engine"]
+    if "shm" not in state:
+        # each pool serves one BatchPathfinder, so a worker only ever sees one segment
+        state["shm"] = shared_memory.SharedMemory(name=name)
+    tiles = np.ndarray(shape, dtype=np.uint8, buffer=state["shm"].buf)
+    G = grid.ArrayGrid.from_array(tiles, grid.Palette(palette))
+    state["engine"] = astar.GridAStar(G)
+    state["generation"] = generation
+    return state["engine"]
+
+
+def _solve(header, chunk) -> List[List[GridLocation]]:
+    name, shape, palette, generation, profiles, max_length = header
+    engine = _attach(name, shape, palette, generation)
+    return [
+        engine.search(profiles[p][0], profiles[p][1], start, goal, max_length)
+        for start, goal, p in chunk
+    ]
+
+
+#------------------------------
+# Caller side
+#------------------------------
+class BatchPathfinder:
+    ''' Answers lists of path queries against one grid, in parallel
+
+    The grid's tile codes live in a shared memory segment that every worker
+    maps once, so a batch only sends the queries themselves (and each
+    distinct cost profile once).  Workers build their adjacency tables from
+    the shared tiles and keep them between batches; when the grid has been
+    written to, the next batch copies the tiles over again and workers
+    rebuild.
+
+    workers=0 answers in this process, which is the serial baseline.
+
+    Usage::
+
+        with BatchPathfinder(D.grid, workers=4) as batch:
+            paths = batch.solve([(m.loc, pc.loc, m.cost_dict) for m in monsters])
+    '''
+
+    def __init__(self, graph: grid.ArrayGrid, workers: Optional[int] = None, max_length=999):
+        self.graph = graph
+        self.max_length = max_length
+        self.workers = workers
+        self.shape = (graph.height, graph.width)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(graph.height * graph.width, 1))
+        self.tiles = np.ndarray(self.shape, dtype=np.uint8, buffer=self.shm.buf)
+        self.pool = ProcessPoolExecutor(workers) if workers != 0 else None
+        self.generation = 0
+        self.version = None
+        self.engine = astar.GridAStar(graph)
+
+    def _sync(self) -> None:
+        G = self.graph
+        if self.version != G.version:
+            self.tiles[:] = G.tiles
+            self.palette = list(G.palette.tiles)
+            self.version = G.version
+            self.generation += 1
+
+    def solve(self, queries: Iterable[Query], chunks_per_worker: int = 4) -> List[List[GridLocation]]:
+        ''' Paths for each query, in order (start exclusive, goal inclusive, [] if none) '''
+        queries = list(queries)
+        if self.pool is None:
+            return [
+                self.engine.search(q[2], q[3] if len(q) > 3 else (), q[0], q[1], self.max_length)
+                for q in queries
+            ]
+        self._sync()
+
+        profiles, profile_index, jobs = [], {}, []
+        for q in queries:
+            cost_dict, impassable = q[2], tuple(q[3]) if len(q) > 3 else ()
+            key = (tuple(sorted(cost_dict.items())), impassable)
+            if key not in profile_index:
+                profile_index[key] = len(profiles)
+                profiles.append((cost_dict, impassable))
+            jobs.append((q[0], q[1], profile_index[key]))
+
+        header = (self.shm.name, self.shape, self.palette, self.generation, profiles, self.max_length)
+        n = max(1, len(jobs) // (chunks_per_worker * (self.workers or os.cpu_count() or 1)))
+        chunks = [jobs[i : i + n] for i in range(0, len(jobs), n)]
+        paths = []
+        for result in self.pool.map(_solve, [header] * len(chunks), chunks):
+            paths.extend(result)
+        return paths
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if self.shm is not None:
+            del self.tiles
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def __enter__(self) -> "BatchPathfinder":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def solve_batch(graph: grid.ArrayGrid, queries: Sequence[Query], workers: Optional[int] = None,
+                max_length=999) -> List[List[GridLocation]]:
+    ''' One-off BatchPathfinder; keep one around instead when solving every turn '''
+    with BatchPathfinder(graph, workers, max_length) as batch:
+        return batch.solve(queries)
+
+
+if __name__ == "__main__":
+    import random
+    import time
+    from dungeon_gen import DungeonGenerator
+
+    random.seed(0)
+    D = DungeonGenerator(width=160, height=100, num_rooms=32)
+    ys, xs = D.grid.layer("passable").nonzero()
+    cells = list(zip(ys.tolist(), xs.tolist()))
+    cost_dict = {".": 1.0, "#": 99, "+": 0}
+    queries = [(random.choice(cells), random.choice(cells), cost_dict) for _ in range(100)]
+
+    serial = solve_batch(D.grid, queries, workers=0)
+    with BatchPathfinder(D.grid, workers=2) as batch:
+        t0 = time.perf_counter()
+        paths = batch.solve(queries)
+        print(f"{len(queries)} queries on 2 workers in {time.perf_counter() - t0:.3f}s,"
+              f" same as serial: {paths == serial}")
@@ -0,0 +1,765 @@
+"benchmark.py - Timing harness for the pathfinding and FOV engines."
+
+import os
+import random
+import sys
+import time
+from typing import Callable, List
+
+import numpy as np
+
+import astar
+import batch
+import dijkstra
+import dstar
+import dungeon_gen
+import fov
+import fovalgos
+import fovcache
+import hpa
+import jps
+import landmarks
+import lightmap
+import pathcache
+import queues
+import tilememory
+from grid import GridLocation
+
+MONSTER_COSTS = {".": 1.0, "#": 99, "+": 0}
+
+
+def make_dungeon(width: int, height: int, num_rooms: int, seed: int):
+    ''' Seeded DungeonGenerator '''
+    random.seed(seed)
+    return dungeon_gen.DungeonGenerator(width=width, height=height, num_rooms=num_rooms)
+
+
+def floor_cells(G) -> List[GridLocation]:
+    ys, xs = G.layer("passable").nonzero()
+    return list(zip(ys.tolist(), xs.tolist()))
+
+
+def random_pairs(G, n: int, seed: int):
+    rng = random.Random(seed)
+    cells = floor_cells(G)
+    return [(rng.choice(cells), rng.choice(cells)) for _ in range(n)]
+
+
+def best_of(fn: Callable, repeat: int) -> float:
+    ''' Best wall time of repeat calls '''
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def bench_astar(args):
+    ''' a_star_search + reconstruct_path vs GridAStar on the same queries '''
+    D = make_dungeon(args.width, args.height, args.num_rooms, args.seed)
+    G = D.grid
+    pairs = random_pairs(G, args.queries, args.seed)
+
+    def dict_engine():
+        return [
+            astar.reconstruct_path(
+                astar.a_star_search(MONSTER_COSTS, [], G, s, g, max_length=999)[0], s, g
+            )
+            for s, g in pairs
+        ]
+
+    def flat_engine():
+        return [astar.a_star_path(MONSTER_COSTS, [], G, s, g, max_length=999) for s, g in pairs]
+
+    # warm the adjacency table and engine buffers before timing
+    same = dict_engine() == flat_engine()
+    t_dict = best_of(dict_engine, args.repeat)
+    t_flat = best_of(flat_engine, args.repeat)
+    print(f"{args.width}x{args.height}, {args.queries} queries, paths identical: {same}")
+    print(f"  a_star_search : {1000 * t_dict / args.queries:8.3f} ms/query")
+    print(f"  GridAStar     : {1000 * t_flat / args.queries:8.3f} ms/query  ({t_dict / t_flat:.1f}x)")
+
+
+def bench_chase(args):
+    ''' One step for every monster: A* per monster vs one shared DistanceMap '''
+    D = make_dungeon(args.width, args.height, args.num_rooms, args.seed)
+    G = D.grid
+    rng = random.Random(args.seed)
+    cells = floor_cells(G)
+    target = rng.choice(cells)
+    monsters = [rng.choice(cells) for _ in range(args.monsters)]
+
+    def per_monster():
+        return [astar.a_star_path(MONSTER_COSTS, [], G, m, target, max_length=999)[:1] for m in monsters]
+
+    def shared():
+        chase = dijkstra.DistanceMap(G, MONSTER_COSTS, max_distance=999).compute([target])
+        return [chase.next_step(m) for m in monsters]
+
+    per_monster()
+    t_astar = best_of(per_monster, args.repeat)
+    t_map = best_of(shared, args.repeat)
+    print(f"{args.width}x{args.height}, {args.monsters} monsters chasing one target")
+    print(f"  A* per monster : {1000 * t_astar:9.1f} ms/turn")
+    print(f"  DistanceMap    : {1000 * t_map:9.1f} ms/turn  ({t_astar / t_map:.1f}x)")
+
+
+def bench_jps(args):
+    ''' A* vs JPS vs JPS+ with walls impassable and uniform floor cost '''
+    D = make_dungeon(args.width, args.height, args.num_rooms, args.seed)
+    G = D.grid
+    pairs = random_pairs(G, args.queries, args.seed)
+    cost_dict, impassable = {".": 1.0, "+": 1.0, "#": 99}, ["#"]
+
+    def run(fn, **kw):
+        return [fn(cost_dict, impassable, G, s, g, max_length=10**9, **kw)[1].get(g) for s, g in pairs]
+
+    # warm JPS+ tables; report their build time separately
+    t0 = time.perf_counter()
+    costs_plus = run(jps.jump_point_search, plus=True)
+    t_build = time.perf_counter() - t0
+    costs_jps = run(jps.jump_point_search)
+    costs_astar = [dijkstra.DistanceMap(G, cost_dict, impassable).compute([g])[s] for s, g in pairs]
+    t_astar = best_of(lambda: run(astar.a_star_search), args.repeat)
+    t_jps = best_of(lambda: run(jps.jump_point_search), args.repeat)
+    t_plus = best_of(lambda: run(jps.jump_point_search, plus=True), args.repeat)
+    optimal = costs_jps == costs_plus == costs_astar
+    print(f"{args.width}x{args.height}, {args.queries} queries, JPS costs optimal: {optimal}")
+    print(f"  a_star_search : {1000 * t_astar / args.queries:8.3f} ms/query")
+    print(f"  JPS           : {1000 * t_jps / args.queries:8.3f} ms/query  ({t_astar / t_jps:.1f}x)")
+    print(f"  JPS+          : {1000 * t_plus / args.queries:8.3f} ms/query  ({t_astar / t_plus:.1f}x)"
+          f"  tables ~{1000 * t_build:.0f} ms once")
+
+
+def bench_hpa(args):
+    ''' Cell-by-cell A* vs RoomGraph queries between random floor cells '''
+    D = make_dungeon(args.width, args.height, args.num_rooms, args.seed)
+    G = D.grid
+    pairs = random_pairs(G, args.queries, args.seed)
+    t0 = time.perf_counter()
+    rooms = hpa.RoomGraph.from_dungeon(D)
+    t_build = time.perf_counter() - t0
+    t_astar = best_of(lambda: [astar.a_star_path(MONSTER_COSTS, [], G, s, g, max_length=10**9)
+                               for s, g in pairs], args.repeat)
+    t_hpa = best_of(lambda: [rooms.path(s, g) for s, g in pairs], args.repeat)
+    print(f"{args.width}x{args.height}, {len(D.rooms)} rooms, {rooms.stats()}, built in {1000 * t_build:.0f} ms")
+    print(f"  GridAStar : {1000 * t_astar / args.queries:8.3f} ms/query")
+    print(f"  RoomGraph : {1000 * t_hpa / args.queries:8.3f} ms/query  ({t_astar / t_hpa:.1f}x)")
+
+
+def bench_cache(args):
+    ''' Monsters re-plan every turn while the target wanders: A* vs PathCache '''
+    D = make_dungeon(args.width, args.height, args.num_rooms, args.seed)
+    G = D.grid
+    rng = random.Random(args.seed)
+    cells = floor_cells(G)
+    free = set(cells)
+    start_target = rng.choice(cells)
+    start_monsters = [rng.choice(cells) for _ in range(args.monsters)]
+    turns = 20
+    # the target's walk is fixed up front so both runs see the same moves
+    walk = [start_target]
+    for _ in range(turns):
+        y, x = walk[-1]
+        walk.append(rng.choice([c for c in G.neighbors((y, x)) if c in free] or [(y, x)]))
+
+    def chase(plan):
+        monsters = list(start_monsters)
+        for target in walk:
+            for n, m in enumerate(monsters):
+                path = plan(m, target)
+                if len(path) > 1:
+                    monsters[n] = path[0]
+        return monsters
+
+    def fresh(m, target):
+        return astar.a_star_path(MONSTER_COSTS, [], G, m, target, max_length=999)
+
+    cache = pathcache.PathCache(G, max_entries=4 * args.monsters)
+
+    def cached(m, target):
+        return cache.path(MONSTER_COSTS, [], m, target, max_length=999)
+
+    # how much longer the repaired paths are than fresh ones, from the same cells
+    cost = G.cost_layer(MONSTER_COSTS)
+    extra = 0.0
+    monsters = list(start_monsters)
+    for target in walk:
+        for n, m in enumerate(monsters):
+            path, best = cached(m, target), fresh(m, target)
+            extra += sum(cost[c] for c in path) - sum(cost[c] for c in best)
+            if len(path) > 1:
+                monsters[n] = path[0]
+
+    t_astar = best_of(lambda: chase(fresh), args.repeat)
+    t_cache = best_of(lambda: chase(cached), args.repeat)
+    print(f"{args.width}x{args.height}, {args.monsters} monsters, {turns + 1} turns, {cache.stats()}")
+    print(f"  repaired paths cost {extra / (args.monsters * (turns + 1)):.2f} more per query on average")
+    print(f"  GridAStar : {1000 * t_astar / (turns + 1):9.1f} ms/turn")
+    print(f"  PathCache : {1000 * t_cache / (turns + 1):9.1f} ms/turn  ({t_astar / t_cache:.1f}x)")
+
+
+def bench_dstar(args):
+    ''' One agent re-planning every turn toward a wandering target '''
+    D = make_dungeon(args.width, args.height, args.num_rooms, args.seed)
+    G = D.grid
+    rng = random.Random(args.seed)
+    cells = floor_cells(G)
+    free = set(cells)
+    turns = 100
+    chases = []
+    for _ in range(args.queries):
+        walk = [rng.choice(cells)]
+        for _ in range(turns):
+            walk.append(rng.choice([c for c in G.neighbors(walk[-1]) if c in free] or walk[-1:]))
+        chases.append((rng.choice(cells), walk))
+    n = len(chases) * (turns + 1)
+
+    def chase(planner):
+        for me, walk in chases:
+            step = planner(me, walk[0])
+            for target in walk:
+                nxt = step(me, target)
+                if nxt is not None and nxt != target:
+                    me = nxt
+
+    print(f"{args.width}x{args.height}, {len(chases)} chases x {turns + 1} turns")
+    # doors cost 0 in MONSTER_COSTS, which leaves D* Lite without a heuristic
+    profiles = [("walls 99, doors 0", MONSTER_COSTS, ()),
+                ("walls impassable", {".": 1.0, "+": 1.0, "#": 99}, ("#",))]
+    for name, costs, impassable in profiles:
+        planners = []
+
+        def astar_planner(me, target):
+            def step(me, target):
+                path = astar.a_star_path(costs, impassable, G, me, target, max_length=10**9)
+                return path[0] if path else None
+            return step
+
+        def map_planner(me, target):
+            chase_map = dijkstra.DistanceMap(G, costs, impassable)
+            return lambda me, target: chase_map.compute([target]).next_step(me)
+
+        reroot_time = [0.0]
+
+        def dstar_planner(me, target):
+            planner = dstar.DStarLite(G, costs, impassable, me, target)
+            reroot = planner._reroot
+
+            def timed_reroot(new_root):
+                t0 = time.perf_counter()
+                done = reroot(new_root)
+                reroot_time[0] += time.perf_counter() - t0
+                return done
+            planner._reroot = timed_reroot
+            planners.append(planner)
+            return planner.next_step
+
+        t_astar = best_of(lambda: chase(astar_planner), args.repeat)
+        t_map = best_of(lambda: chase(map_planner), args.repeat)
+        t_dstar = best_of(lambda: chase(dstar_planner), args.repeat)
+        expanded = sum(p.total_expanded for p in planners[-len(chases):]) / n
+        print(f" {name}: D* Lite expands {expanded:.0f} cells/turn of {G.width * G.height}")
+        print(f"  GridAStar   : {1000 * t_astar / n:8.3f} ms/turn")
+        print(f"  DistanceMap : {1000 * t_map / n:8.3f} ms/turn  ({t_astar / t_map:.1f}x)")
+        print(f"  DStarLite   : {1000 * t_dstar / n:8.3f} ms/turn  ({t_astar / t_dstar:.1f}x)")
+        print(f"   re-rooting : {1000 * reroot_time[0] / (args.repeat * n):8.3f} ms/turn (every repeat)")
+
+def bench_budget(args):
+    ''' Worst-case latency: unbounded A* vs BudgetedSearch slices, half the goals unreachable '''
+    D = make_dungeon(args.width, args.height, args.num_rooms, args.seed)
+    G = D.grid
+    pairs = random_pairs(G, args.queries, args.seed)
+    # send half the queries into solid rock, e.g. toward a player in a vault
+    rng = random.Random(args.seed)
+    ys, xs = G.mask(["#"]).nonzero()
+    rock = list(zip(ys.tolist(), xs.tolist()))
+    sealed = rng.sample(range(len(pairs)), len(pairs) // 2)
+    for n in sealed:
+        pairs[n] = (pairs[n][0], rng.choice(rock))
+    budget = 1000
+
+    def latencies(fn):
+        times = []
+        for s, g in pairs:
+            t0 = time.perf_counter()
+            fn(s, g)
+            times.append(time.perf_counter() - t0)
+        return times
+
+    # build both adjacency tables outside the timings
+    G.adjacency(MONSTER_COSTS)
+    G.adjacency(MONSTER_COSTS, ["#"])
+    t_astar = latencies(lambda s, g: astar.a_star_path(MONSTER_COSTS, ["#"], G, s, g, max_length=999))
+    slices = []
+
+    def sliced(s, g):
+        search = astar.BudgetedSearch(MONSTER_COSTS, ["#"], G, s, g, max_length=999)
+        search.run(max_expansions=budget)
+        ticks = 1
+        while not search.run(max_expansions=budget):
+            ticks += 1
+        slices.append(ticks if search.found else None)
+
+    t_budget = latencies(lambda s, g: astar.budgeted_path(MONSTER_COSTS, ["#"], G, s, g, max_length=999,
+                                                          max_expansions=budget))
+    latencies(sliced)
+    done = [t for t in slices if t is not None]
+    print(f"{args.width}x{args.height}, {len(pairs)} queries, {len(sealed)} goals in rock")
+    print(f"  GridAStar            : mean {1000 * sum(t_astar) / len(pairs):7.2f} ms, worst {1000 * max(t_astar):7.2f} ms")
+    print(f"  BudgetedSearch {budget:5d} : mean {1000 * sum(t_budget) / len(pairs):7.2f} ms, "
+          f"worst {1000 * max(t_budget):7.2f} ms per slice")
+    print(f"  resumed to the end   : {len(done)} paths found in {sum(done) / len(done):.1f} slices on average, "
+          f"{max(done)} at most")
+
+
+def bench_queues(args):
+    ''' astar.PriorityQueue vs the queues.py classes in a_star_search and DistanceMap '''
+    D = make_dungeon(args.width, args.height, args.num_rooms, args.seed)
+    G = D.grid
+    pairs = random_pairs(G, args.queries, args.seed)
+    targets = [g for _, g in pairs[:10]]
+    print(f"{args.width}x{args.height}, MONSTER_COSTS (integers)")
+
+    print(f"  a_star_search, {len(pairs)} queries")
+    # RadixHeap needs monotone priorities, a_star_search's heuristic is not consistent
+    base = None
+    for Q in (astar.PriorityQueue, queues.BucketQueue, queues.IndexedHeap):
+        def run():
+            return [astar.a_star_search(MONSTER_COSTS, [], G, s, g, max_length=10**9, queue=Q)[1][g]
+                    for s, g in pairs]
+        costs = run()
+        t = best_of(run, args.repeat)
+        base = base or t
+        print(f"    {Q.__name__:14s}: {1000 * t / len(pairs):8.3f} ms/query  ({base / t:.2f}x)"
+              f"  path cost {sum(costs):.0f}")
+
+    print(f"  DistanceMap.compute, {len(targets)} maps")
+    base, reference = None, None
+    for Q in (None, queues.BucketQueue, queues.RadixHeap, queues.IndexedHeap):
+        def run():
+            return [dijkstra.DistanceMap(G, MONSTER_COSTS, queue=Q).compute([g]).dist for g in targets]
+        maps = run()
+        reference = maps if reference is None else reference
+        same = all((a == b).all() for a, b in zip(maps, reference))
+        t = best_of(run, args.repeat)
+        base = base or t
+        name = Q.__name__ if Q else "heapq (inline)"
+        print(f"    {name:14s}: {1000 * t / len(targets):8.3f} ms/map    ({base / t:.2f}x)  identical: {same}")
+
+
+def bench_alt(args):
+    ''' a_star_search heuristics: cells touched, time and path cost per query '''
+    D = make_dungeon(args.width, args.height, args.num_rooms, args.seed)
+    G = D.grid
+    pairs = random_pairs(G, args.queries, args.seed)
+    # a_star_search walks through impassable tiles, so walls are just expensive here
+    profiles = [("walls 99, doors 0", MONSTER_COSTS, ()),
+                ("walls 99, doors 1", {".": 1.0, "#": 99, "+": 1.0}, ())]
+    print(f"{args.width}x{args.height}, {len(pairs)} queries")
+    for name, costs, impassable in profiles:
+        exact = [dijkstra.DistanceMap(G, costs, impassable).compute([g])[s] for s, g in pairs]
+        print(f" {name}: exact cost {sum(exact):.0f}")
+        heuristics = [("none (Dijkstra)", lambda a, b: 0), ("Manhattan", astar.heuristic),
+                      ("Chebyshev", astar.chebyshev)]
+        for k in (4, 8, 16, 32):
+            L = landmarks.Landmarks.from_dungeon(D, costs, impassable=impassable, k=k)
+            stats = L.stats()
+            heuristics.append((f"ALT k={k:<2d} {stats['bytes'] / 2**20:5.1f} MiB"
+                               f" {1000 * stats['build_seconds']:5.0f} ms", L))
+        for label, h in heuristics:
+            touched, cost = 0, 0.0
+
+            def run():
+                return [astar.a_star_search(costs, impassable, G, s, g, max_length=10**9, heuristic=h)[1]
+                        for s, g in pairs]
+
+            for (s, g), seen in zip(pairs, run()):
+                touched += len(seen)
+                cost += seen.get(g, 0.0)
+            t = best_of(run, args.repeat)
+            print(f"  {label:34s}: {touched / len(pairs):6.0f} cells, {1000 * t / len(pairs):7.2f} ms/query,"
+                  f" cost +{cost - sum(exact):.0f}")
+
+
+def bench_batch(args):
+    ''' Many agents, each with its own goal: serial GridAStar vs BatchPathfinder workers '''
+    D = make_dungeon(args.width, args.height, args.num_rooms, args.seed)
+    G = D.grid
+    pairs = random_pairs(G, args.monsters, args.seed)
+    queries = [(s, g, MONSTER_COSTS) for s, g in pairs]
+    print(f"{args.width}x{args.height}, {len(queries)} agents, {os.cpu_count()} CPUs")
+    if (os.cpu_count() or 1) < 2:
+        print("  (one CPU: workers can only add overhead here, there is no speedup to measure)")
+    serial = None
+    for workers in (0, 1, 2, 4, 8):
+        with batch.BatchPathfinder(G, workers=workers) as B:
+            paths = B.solve(queries)  # warm: pool start-up and adjacency tables
+            t = best_of(lambda: B.solve(queries), args.repeat)
+        if serial is None:
+            serial, base = paths, t
+        label = "serial" if workers == 0 else f"{workers} workers"
+        print(f"  {label:10s}: {1000 * t:8.1f} ms/turn  ({base / t:.2f}x)  same paths: {paths == serial}")
+
+
+def bench_fov(args):
+    ''' FOVMap with a BlocksVision callback vs ArrayFOV on the blocks_vision layer '''
+    D = make_dungeon(args.width, args.height, args.num_rooms, args.seed)
+    G = D.grid
+    H, W = G.height, G.width
+    origins = random.Random(args.seed).sample(floor_cells(G), args.queries)
+    blocks = G.layer("blocks_vision")
+    old = fov.FOVMap(W, H, lambda x, y: not (0 <= x < W and 0 <= y < H) or blocks[y, x])
+    new = fov.ArrayFOV.from_grid(G)
+    print(f"{W}x{H}, {len(origins)} origins")
+    for radius in (2, 4, 8, 16, 30, 60):
+        same = all(
+            {(y, x) for x, y in old.FOVList(x, y, radius)}
+            == set(zip(*(a.tolist() for a in new.compute((y, x), radius).nonzero())))
+            for y, x in origins
+        )
+        t_old = best_of(lambda: [old.FOVList(x, y, radius) for y, x in origins], args.repeat)
+        t_new = best_of(lambda: [new.compute(o, radius) for o in origins], args.repeat)
+        print(f"  radius {radius:2d}: FOVMap {1e6 * t_old / len(origins):8.1f} us, ArrayFOV"
+              f" {1e6 * t_new / len(origins):8.1f} us  ({t_old / t_new:.1f}x)  identical: {same}")
+
+
+def bench_fovdiff(args):
+    ''' Repaint list per step of a walk: set xor of FOVList keys vs FOVMask.diff '''
+    D = make_dungeon(args.width, args.height, args.num_rooms, args.seed)
+    G = D.grid
+    H, W = G.height, G.width
+    rng = random.Random(args.seed)
+    free = set(floor_cells(G))
+    walk = [rng.choice(sorted(free))]
+    for _ in range(args.queries):
+        walk.append(rng.choice([c for c in G.neighbors(walk[-1]) if c in free] or [walk[-1]]))
+    blocks = G.layer("blocks_vision")
+    old = fov.FOVMap(W, H, lambda x, y: not (0 <= x < W and 0 <= y < H) or blocks[y, x])
+    new = fov.ArrayFOV.from_grid(G)
+    print(f"{W}x{H}, {len(walk) - 1} steps, diff and repaint list only (FOV precomputed)")
+    for radius in (2, 8, 30):
+        keys = [old.FOVList(x, y, radius) for y, x in walk]
+        masks = []
+        for loc in walk:
+            new.compute(loc, radius)
+            masks.append(new.mask())
+
+        def with_sets():
+            # ui.main before FOVMask: copy keys into a set, repaint the xor and all of new
+            repaint, seen = 0, set()
+            for k in keys:
+                now = set(k)
+                for _ in seen ^ now:
+                    repaint += 1
+                for _ in now:
+                    repaint += 1
+                seen = now
+            return repaint
+
+        def with_masks():
+            repaint, seen = 0, masks[0]
+            for now in masks:
+                shown, hidden = seen.diff(now)
+                for _ in shown:
+                    repaint += 1
+                for _ in hidden:
+                    repaint += 1
+                seen = now
+            return repaint
+
+        n = len(walk)
+        painted = with_sets() / n, with_masks() / n
+        t_sets = best_of(with_sets, args.repeat)
+        t_masks = best_of(with_masks, args.repeat)
+        print(f"  radius {radius:2d}: sets  {1e6 * t_sets / n:7.1f} us/step, {painted[0]:6.1f} repaints")
+        print(f"             masks {1e6 * t_masks / n:7.1f} us/step, {painted[1]:6.1f} repaints"
+              f"  ({t_sets / t_masks:.1f}x)")
+
+def bench_fovcache(args):
+    ''' A wandering player and mostly idle monsters each look around every turn '''
+    D = make_dungeon(args.width, args.height, args.num_rooms, args.seed)
+    G = D.grid
+    rng = random.Random(args.seed)
+    cells = floor_cells(G)
+    free = set(cells)
+    doors = list(zip(*(a.tolist() for a in G.mask("+").nonzero())))
+    turns, radius = 200, 8
+    # scripted up front so every run sees the same turns: the player walks,
+    # a monster moves one turn in ten, and now and then a door is toggled
+    player = [rng.choice(cells)]
+    monsters = [[rng.choice(cells) for _ in range(args.monsters)]]
+    toggles = []
+    for _ in range(turns):
+        player.append(rng.choice([c for c in G.neighbors(player[-1]) if c in free] or [player[-1]]))
+        moved = []
+        for m in monsters[-1]:
+            if rng.random() < 0.1:
+                m = rng.choice([c for c in G.neighbors(m) if c in free] or [m])
+            moved.append(m)
+        monsters.append(moved)
+        toggles.append(rng.choice(doors) if doors and rng.random() < 0.2 else None)
+
+    def play(look):
+        for t in range(turns):
+            look(player[t])
+            for m in monsters[t]:
+                look(m)
+            if toggles[t]:
+                G[toggles[t]] = "." if G[toggles[t]] == "+" else "+"
+        # leave the doors as they were
+        for door in toggles:
+            if door:
+                G[door] = "+"
+
+    engine = fov.ArrayFOV.from_grid(G)
+
+    def fresh(loc):
+        engine.compute(loc, radius)
+        return engine.mask()
+
+    t_fresh = best_of(lambda: play(fresh), args.repeat)
+    print(f"{G.width}x{G.height}, {args.monsters} monsters, {turns} turns, radius {radius}")
+    print(f"  uncached            : {1000 * t_fresh / turns:7.2f} ms/turn")
+    for size in (64, 256, 1024):
+        cache = fovcache.FOVCache(G, engine, max_entries=size)
+        t = best_of(lambda: play(lambda loc: cache.mask(loc, radius)), args.repeat)
+        stats = cache.stats()
+        print(f"  FOVCache {size:5d}      : {1000 * t / turns:7.2f} ms/turn  ({t_fresh / t:.1f}x)"
+              f"  hit rate {stats['hit_rate']:.2f}, {stats['invalidations']} invalidated,"
+              f" {stats['evictions']} evicted")
+
+
+def bench_los(args):
+    ''' Line of sight for 10k (source, target) pairs: LOSExists vs LineOfSight '''
+    D = make_dungeon(args.width, args.height, args.num_rooms, args.seed)
+    G = D.grid
+    H, W = G.height, G.width
+    rng = random.Random(args.seed)
+    cells = floor_cells(G)
+    # monsters looking at something up to 20 cells away
+    sources, targets = [], []
+    for _ in range(10000):
+        y, x = rng.choice(cells)
+        sources.append((y, x))
+        targets.append((min(max(y + rng.randint(-20, 20), 0), H - 1), min(max(x + rng.randint(-20, 20), 0), W - 1)))
+    blocks = G.layer("blocks_vision")
+    old = fov.FOVMap(W, H, lambda x, y: not (0 <= x < W and 0 <= y < H) or blocks[y, x])
+    los = fov.LineOfSight.from_grid(G)
+
+    def per_pair():
+        return [old.LOSExists(x, y, tx, ty) for (y, x), (ty, tx) in zip(sources, targets)]
+
+    want = np.array(per_pair())
+    exact, rays = los.check(sources, targets, exact=True), los.check(sources, targets)
+    t_old = best_of(per_pair, args.repeat)
+    t_exact = best_of(lambda: los.check(sources, targets, exact=True), args.repeat)
+    t_rays = best_of(lambda: los.check(sources, targets), args.repeat)
+    print(f"{W}x{H}, {len(sources)} pairs, {want.mean():.0%} in sight")
+    print(f"  FOVMap.LOSExists    : {1000 * t_old:8.1f} ms")
+    print(f"  LineOfSight exact   : {1000 * t_exact:8.1f} ms  ({t_old / t_exact:5.1f}x)"
+          f"  agrees with FOVList on {np.mean(exact == want):.2%}")
+    print(f"  LineOfSight rays    : {1000 * t_rays:8.1f} ms  ({t_old / t_rays:5.1f}x)"
+          f"  agrees with FOVList on {np.mean(rays == want):.2%}")
+
+
+def bench_light(args):
+    ''' Monsters carrying torches: rebuild the light map every turn vs LightMap updates '''
+    D = make_dungeon(args.width, args.height, args.num_rooms, args.seed)
+    G = D.grid
+    rng = random.Random(args.seed)
+    cells = floor_cells(G)
+    free = set(cells)
+    doors = list(zip(*(a.tolist() for a in G.mask("+").nonzero())))
+    turns, radius, intensity = 200, 6, 100
+    # scripted as in bench_fovcache: a torch moves one turn in ten and now
+    # and then a door is toggled
+    torches = [[rng.choice(cells) for _ in range(args.monsters)]]
+    toggles = []
+    for _ in range(turns):
+        moved = []
+        for m in torches[-1]:
+            if rng.random() < 0.1:
+                m = rng.choice([c for c in G.neighbors(m) if c in free] or [m])
+            moved.append(m)
+        torches.append(moved)
+        toggles.append(rng.choice(doors) if doors and rng.random() < 0.2 else None)
+
+    def play(turn):
+        for t in range(turns):
+            if toggles[t]:
+                G[toggles[t]] = "." if G[toggles[t]] == "+" else "+"
+            light = turn(t + 1)
+        for door in toggles:
+            if door:
+                G[door] = "+"
+        return light
+
+    def rebuild(t):
+        lights = lightmap.LightMap(G)
+        for loc in torches[t]:
+            lights.add(loc, radius, intensity)
+        return lights.light
+
+    def incremental():
+        lights = lightmap.LightMap(G)
+        keys = [lights.add(loc, radius, intensity) for loc in torches[0]]
+
+        def turn(t):
+            for key, loc in zip(keys, torches[t]):
+                lights.move(key, loc)
+            lights.update()
+            return lights.light
+
+        light = play(turn)
+        incremental.recast = lights.stats()["recast"] - len(keys)
+        return light
+
+    same = np.array_equal(play(rebuild), incremental())
+    t_rebuild = best_of(lambda: play(rebuild), args.repeat)
+    t_incremental = best_of(incremental, args.repeat)
+    print(f"{G.width}x{G.height}, {args.monsters} torches, {turns} turns, radius {radius}")
+    print(f"  rebuild every turn  : {1000 * t_rebuild / turns:7.2f} ms/turn")
+    print(f"  LightMap            : {1000 * t_incremental / turns:7.2f} ms/turn  ({t_rebuild / t_incremental:.1f}x)"
+          f"  {incremental.recast / turns:.1f} sources re-cast per turn, same light: {same}")
+
+
+def bench_memory(args):
+    ''' Each monster remembers its FOV every turn: set of cells vs bool array vs TileMemory '''
+    D = make_dungeon(args.width, args.height, args.num_rooms, args.seed)
+    G = D.grid
+    rng = random.Random(args.seed)
+    cells = floor_cells(G)
+    turns, radius = 50, 8
+    view = fov.ArrayFOV.from_grid(G)
+    # one FOV per monster per turn, computed up front
+    views = []
+    for _ in range(turns):
+        for _ in range(args.monsters):
+            view.compute(rng.choice(cells), radius)
+            views.append(view.mask())
+
+    def remember(memories, add):
+        for t in range(turns):
+            for m, mask in enumerate(views[t * args.monsters : (t + 1) * args.monsters]):
+                add(memories[m], mask)
+        return memories
+
+    def add_bool(seen, mask):
+        h, w = mask.bits.shape
+        seen[mask.y : mask.y + h, mask.x : mask.x + w] |= mask.bits
+
+    def run_sets():
+        return remember([set() for _ in range(args.monsters)], lambda seen, mask: seen.update(mask))
+
+    def run_bool():
+        return remember([np.zeros((G.height, G.width), dtype=bool) for _ in range(args.monsters)], add_bool)
+
+    def run_packed():
+        return remember([tilememory.TileMemory.for_grid(G) for _ in range(args.monsters)],
+                        tilememory.TileMemory.remember)
+
+    sets, bools, packed = run_sets(), run_bool(), run_packed()
+    same = all(len(s) == len(p) == b.sum() for s, b, p in zip(sets, bools, packed))
+    # the table plus one (y, x) tuple per cell
+    set_bytes = sum(sys.getsizeof(s) + sys.getsizeof((0, 0)) * len(s) for s in sets)
+    print(f"{G.width}x{G.height}, {args.monsters} memories, {turns} turns, radius {radius}")
+    for name, run, nbytes in (("set of cells", run_sets, set_bytes),
+                              ("bool array", run_bool, sum(b.nbytes for b in bools)),
+                              ("TileMemory", run_packed, sum(p.nbytes for p in packed))):
+        t = best_of(run, args.repeat)
+        print(f"  {name:20s}: {1000 * t / turns:7.2f} ms/turn  {nbytes / 1024:9.0f} kB")
+    print(f"  same cells remembered: {same}")
+
+
+def bench_fovalgos(args):
+    ''' Every fovalgos algorithm across radii and pillar densities: speed and how the views differ '''
+    D = make_dungeon(args.width, args.height, args.num_rooms, args.seed)
+    G = D.grid
+    H, W = G.height, G.width
+    rng = random.Random(args.seed)
+    cells = floor_cells(G)
+    n_origins, n_symmetry = 4 * args.queries, 10
+    print(f"{W}x{H}, {n_origins} origins per map, differences against shadowcast,"
+          f" asymmetry over {n_symmetry} origins")
+    for density in (0.0, 0.05, 0.2):
+        # pillars scattered over the floor of the same dungeon
+        blocks = G.layer("blocks_vision").copy()
+        for y, x in rng.sample(cells, int(density * len(cells))):
+            blocks[y, x] = True
+        origins = rng.sample([(x, y) for y, x in cells if not blocks[y, x]], n_origins)
+        blocked = lambda x, y: not (0 <= x < W and 0 <= y < H) or blocks[y, x]
+        engines = {name: fovalgos.make(name, W, H, blocked) for name in fovalgos.ALGORITHMS}
+        print(f"  pillars on {density:.0%} of the floor")
+        for radius in (4, 8, 16):
+            base = [set(engines["shadowcast"].FOVList(x, y, radius)) for x, y in origins]
+            base_cells = sum(map(len, base))
+            for name, engine in engines.items():
+                # per-origin latency, best of args.repeat passes
+                latency = np.full(n_origins, np.inf)
+                for _ in range(args.repeat):
+                    for n, (x, y) in enumerate(origins):
+                        t0 = time.perf_counter()
+                        engine.FOVList(x, y, radius)
+                        latency[n] = min(latency[n], time.perf_counter() - t0)
+                views = [set(engine.FOVList(x, y, radius)) for x, y in origins]
+                seen = sum(map(len, views))
+                extra = sum(len(v - b) for v, b in zip(views, base))
+                missing = sum(len(b - v) for v, b in zip(views, base))
+                # floor cells an origin sees that do not see it back
+                pairs = one_way = 0
+                for (x, y), view in zip(origins[:n_symmetry], views):
+                    for X, Y in view:
+                        if not blocks[Y, X] and (X, Y) != (x, y):
+                            pairs += 1
+                            one_way += (x, y) not in engine.FOVList(X, Y, radius)
+                p50, p95, p99 = 1e6 * np.percentile(latency, (50, 95, 99))
+                print(f"    r={radius:2d} {name:10s}: p50 {p50:6.1f} us  p95 {p95:6.1f}  p99 {p99:6.1f}"
+                      f"  {seen / latency.sum() / 1e6:5.2f} Mcells/s  {seen / n_origins:6.1f} cells"
+                      f"  +{extra / base_cells:5.1%} -{missing / base_cells:5.1%}"
+                      f"  one-way {one_way / max(pairs, 1):5.1%}")
+
+
+def bench_dungeon(args):
+    ''' DungeonGenerator from 16 to 4096 rooms, on square maps of about 625 cells per room '''
+    for num_rooms in (16, 64, 256, 1024, 4096):
+        side = int(25 * num_rooms ** 0.5)
+        t = best_of(lambda: make_dungeon(side, side, num_rooms, args.seed), args.repeat)
+        D = make_dungeon(side, side, num_rooms, args.seed)
+        print(f"  num_rooms {num_rooms:4d}, {side}x{side}: {len(D.rooms):4d} rooms in {1000 * t:8.1f} ms")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser("")
+    parser.add_argument("--width", default=200, type=int)
+    parser.add_argument("--height", default=200, type=int)
+    parser.add_argument("--num_rooms", default=64, type=int)
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--queries", default=50, type=int)
+    parser.add_argument("--repeat", default=3, type=int)
+    parser.add_argument("--monsters", default=100, type=int)
+    sub = parser.add_subparsers(dest="bench", required=True)
+    sub.add_parser("astar").set_defaults(func=bench_astar)
+    sub.add_parser("chase").set_defaults(func=bench_chase)
+    sub.add_parser("jps").set_defaults(func=bench_jps)
+    sub.add_parser("hpa").set_defaults(func=bench_hpa)
+    sub.add_parser("cache").set_defaults(func=bench_cache)
+    sub.add_parser("dstar").set_defaults(func=bench_dstar)
+    sub.add_parser("budget").set_defaults(func=bench_budget)
+    sub.add_parser("queues").set_defaults(func=bench_queues)
+    sub.add_parser("alt").set_defaults(func=bench_alt)
+    sub.add_parser("batch").set_defaults(func=bench_batch)
+    sub.add_parser("fov").set_defaults(func=bench_fov)
+    sub.add_parser("fovdiff").set_defaults(func=bench_fovdiff)
+    sub.add_parser("fovcache").set_defaults(func=bench_fovcache)
+    sub.add_parser("los").set_defaults(func=bench_los)
+    sub.add_parser("light").set_defaults(func=bench_light)
+    sub.add_parser("memory").set_defaults(func=bench_memory)
+    sub.add_parser("fovalgos").set_defaults(func=bench_fovalgos)
+    sub.add_parser("dungeon").set_defaults(func=bench_dungeon)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,219 @@
+"dijkstra.py - Distance maps (a.k.a. Dijkstra maps) shared by many agents."
+
+import heapq
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+import grid
+from grid import GridLocation
+
+INF = float("inf")
+
+
+class GradientMap:
+    ''' Per-cell values an agent walks downhill on
+
+    Attributes
+    ----------
+    graph : grid.Grid
+        grid the map was built on
+    dist : np.ndarray
+        (height, width) float values, inf where unreachable
+    '''
+
+    def __init__(self, graph: grid.Grid, dist: np.ndarray,
+                 cost_dict: Optional[dict] = None, impassable: Iterable[str] = ()):
+        self.graph = graph
+        self.dist = dist
+        self.cost_dict = cost_dict
+        self.impassable = tuple(impassable)
+
+    def __getitem__(self, loc: GridLocation) -> float:
+        return float(self.dist[loc])
+
+    def next_step(self, loc: GridLocation) -> Optional[GridLocation]:
+        ''' Best neighbor to step onto, or None if loc is already a local minimum
+
+        A step onto y is scored dist[y] + cost of entering y, which is exactly
+        dist[loc] along a cheapest walk.  Looks at no more than eight cells,
+        so any number of agents can share one map for the price of a single
+        search.  Zero-cost tiles make plateaus an agent may stop short of.
+        '''
+        G = self.graph
+        width, slots = G.width, grid.Adjacency.SLOTS
+        index, costs, count = G.adjacency(self.cost_dict, self.impassable).views()
+        dist = memoryview(self.dist.reshape(-1))
+        i = loc[0] * width + loc[1]
+        best, best_i = INF, -1
+        k = i * slots
+        for k in range(k, k + count[i]):
+            score = dist[index[k]] + costs[k]
+            if score < best:
+                best, best_i = score, index[k]
+        if best_i < 0 or not dist[best_i] < dist[i]:
+            return None
+        return divmod(best_i, width)
+
+    def __mul__(self, weight: float) -> "GradientMap":
+        return blend([(self, weight)])
+
+    __rmul__ = __mul__
+
+    def __add__(self, other: "GradientMap") -> "GradientMap":
+        return blend([(self, 1.0), (other, 1.0)])
+
+
+class DistanceMap(GradientMap):
+    ''' Cost of the cheapest walk from each cell to the nearest source
+
+    One multi-source Dijkstra from the target(s) replaces one A* per agent.
+    Moving onto a cell costs that cell's entry in cost_dict (the same cost
+    model as a_star_search), and tiles in impassable are never entered.
+
+    Usage::
+
+        chase = DistanceMap(G, cost_dict).compute([player.loc])
+        step = chase.next_step(monster.loc)
+    '''
+
+    def __init__(self, graph: grid.Grid, cost_dict: Optional[dict] = None,
+                 impassable: Iterable[str] = (), max_distance: float = INF, queue=None):
+        dist = np.full((graph.height, graph.width), INF)
+        GradientMap.__init__(self, graph, dist, cost_dict, impassable)
+        self.max_distance = max_distance
+        # None: inline heapq; otherwise a queues.py class, e.g. queues.RadixHeap
+        self.queue = queue
+        self.sources = {}
+        self.version = None
+
+    def compute(self, sources: Union[Iterable[GridLocation], Dict[GridLocation, float]]) -> "DistanceMap":
+        ''' (Re)build the map
+
+        Parameters
+        ----------
+        sources : Iterable[GridLocation] or Dict[GridLocation, float]
+            goal cells, optionally with a starting value each (goals worth
+            more get lower values)
+        '''
+        if not isinstance(sources, dict):
+            sources = dict.fromkeys(sources, 0.0)
+        G = self.graph
+        width = G.width
+        self.dist.fill(INF)
+        seeds = [(value, loc[0] * width + loc[1]) for loc, value in sources.items()]
+        self._relax(seeds)
+        self.sources = sources
+        self.version = G.version
+        return self
+
+    def _relax(self, seeds: List[Tuple[float, int]]) -> None:
+        G = self.graph
+        slots = grid.Adjacency.SLOTS
+        # neighbors of y are the cells that can step onto y, paying cost[y]
+        index, _, count = G.adjacency(self.cost_dict, self.impassable).views()
+        costs = memoryview(G.cost_layer(self.cost_dict).reshape(-1))
+        dist = memoryview(self.dist.reshape(-1))
+        if self.queue is not None:
+            self._relax_queue(seeds, index, count, costs, dist)
+            return
+        max_distance = self.max_distance
+        pop, push = heapq.heappop, heapq.heappush
+
+        frontier = []
+        for value, i in seeds:
+            if value < dist[i]:
+                dist[i] = value
+                frontier.append((value, i))
+        heapq.heapify(frontier)
+
+        while frontier:
+            d, current = pop(frontier)
+            if d > dist[current]:
+                continue
+            new_cost = d + costs[current]
+            if new_cost > max_distance:
+                continue
+            k = current * slots
+            for k in range(k, k + count[current]):
+                prev = index[k]
+                if new_cost < dist[prev]:
+                    dist[prev] = new_cost
+                    push(frontier, (new_cost, prev))
+
+    def _relax_queue(self, seeds, index, count, costs, dist) -> None:
+        ''' _relax through a decrease-key queue: no stale entries to skip '''
+        slots = grid.Adjacency.SLOTS
+        max_distance = self.max_distance
+        frontier = self.queue()
+        put, get = frontier.put, frontier.get
+        for value, i in seeds:
+            if value < dist[i]:
+                dist[i] = value
+                put(i, value)
+        while not frontier.empty():
+            current = get()
+            new_cost = dist[current] + costs[current]
+            if new_cost > max_distance:
+                continue
+            k = current * slots
+            for k in range(k, k + count[current]):
+                prev = index[k]
+                if new_cost < dist[prev]:
+                    dist[prev] = new_cost
+                    put(prev, new_cost)
+
+    def flee(self, coefficient: float = -1.2) -> "DistanceMap":
+        ''' Map for running away from this map's sources
+
+        The classic recipe: scale the distances by a negative coefficient
+        and settle the result again, so agents head for distant exits
+        instead of cornering themselves.
+        '''
+        G = self.graph
+        width = G.width
+        safety = DistanceMap(G, self.cost_dict, self.impassable)
+        ys, xs = np.nonzero(np.isfinite(self.dist))
+        seeds = (self.dist[ys, xs] * coefficient).tolist()
+        safety._relax(list(zip(seeds, (ys * width + xs).tolist())))
+        safety.version = G.version
+        return safety
+
+
+def blend(weighted: Iterable[Tuple[GradientMap, float]]) -> GradientMap:
+    ''' Weighted sum of maps, e.g. approach the player while seeking items
+
+    Cells unreachable in any of the maps stay unreachable.  Neighbors are
+    taken from the first map's cost profile.
+    '''
+    weighted = list(weighted)
+    first = weighted[0][0]
+    total = np.zeros_like(first.dist)
+    reachable = np.ones(first.dist.shape, dtype=bool)
+    for m, weight in weighted:
+        finite = np.isfinite(m.dist)
+        reachable &= finite
+        total += np.where(finite, m.dist, 0.0) * weight
+    total[~reachable] = INF
+    return GradientMap(first.graph, total, first.cost_dict, first.impassable)
+
+
+if __name__ == "__main__":
+    G = grid.ArrayGrid(9, 20, ".")
+    G[4, 2:18] = "#"
+    G[0:9, 10] = "#"
+    G[2, 10] = "."
+    cost_dict = {".": 1.0, "#": 99}
+
+    chase = DistanceMap(G, cost_dict, impassable=["#"]).compute([(1, 1)])
+    loot = DistanceMap(G, cost_dict, impassable=["#"]).compute({(7, 18): -5.0})
+    ai = blend([(chase, 1.0), (loot, 0.5)])
+
+    for name, m in [("chase", chase), ("flee", chase.flee()), ("chase+loot", ai)]:
+        loc, path = (7, 15), []
+        while len(path) < 40:
+            loc = m.next_step(loc)
+            if loc is None:
+                break
+            path.append(loc)
+        print(f"{name}: {path}")
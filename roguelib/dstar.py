@@ -0,0 +1,338 @@
+"dstar.py - D* Lite replanning for an agent chasing a moving target."
+
+# References
+# ----------
+# Koenig & Likhachev, "D* Lite", AAAI 2002
+# Sun, Yeoh & Koenig, "Moving Target D* Lite", AAMAS 2010
+
+import heapq
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+import grid
+from grid import GridLocation
+
+INF = float("inf")
+# zero-cost tiles (doors) are charged this much instead: with free edges two
+# cells can keep supporting each other's stale g after their real support
+# has gone, and the search tree could contain cycles
+EPSILON = 1e-6
+# the 8 neighbor offsets
+_DIRS = [(dy, dx) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if dy or dx]
+
+
+class DStarLite:
+    ''' One agent's incremental planner toward a target that may move
+
+    This is Moving Target D* Lite.  The search grows forward from the agent,
+    so g[s] - g[root] is the cost of the cheapest walk agent -> s (moving
+    onto a cell costs that cell's cost, as in a_star_search), and the target
+    plays the part of D* Lite's moving start.  Between turns g, rhs, the search tree
+    and the open list are kept, and only what changed is repaired:
+
+    - the target moving only shifts the key modifier km
+    - the agent stepping to a cell of the search tree re-roots it: the
+      subtree below that cell keeps its costs, everything else is dropped
+      and searched again only as far as the target needs
+    - grid writes are read from the grid's change journal; the costs of
+      the cells in each dirty rect are patched, and those cells and their
+      neighbors are updated
+
+    Per turn the work is proportional to the cells dropped, patched and
+    expanded; only reset() (the first plan, or the agent leaving the tree)
+    touches every cell.
+
+    Usage::
+
+        planner = DStarLite(G, cost_dict, impassable, monster.loc, player.loc)
+        ...
+        step = planner.next_step(monster.loc, player.loc)
+
+    Attributes
+    ----------
+    expanded : int
+        cells expanded by the last replan
+    '''
+
+    def __init__(self, graph: grid.Grid, cost_dict: Optional[dict] = None,
+                 impassable: Iterable[str] = (), start: GridLocation = (0, 0),
+                 goal: GridLocation = (0, 0)):
+        self.graph = graph
+        self.cost_dict = cost_dict
+        self.impassable = tuple(impassable)
+        self.start = start
+        self.goal = goal
+        self.total_expanded = 0
+        self.reset()
+
+    def reset(self) -> None:
+        ''' Forget all search state; the next replan starts from scratch '''
+        G = self.graph
+        n = G.height * G.width
+        self.g = np.full(n, INF)
+        self.rhs = np.full(n, INF)
+        # parent of the root and of unreached cells is the sentinel n
+        self.parent = np.full(n + 1, n, dtype=np.int64)
+        # scalar access from Python is much faster through memoryviews
+        self._g, self._rhs = memoryview(self.g), memoryview(self.rhs)
+        self.open = {}
+        self.heap = []
+        self.km = 0.0
+        self.cursor = grid.ChangeCursor(G)
+        self.cost = self._cost_window(0, G.height, 0, G.width).reshape(-1)
+        self.scale = self._min_cost()
+        self.expanded = 0
+        self.root = self._flat(self.start)
+        self.rhs[self.root] = 0.0
+        self._push(self.root)
+
+    def _min_cost(self) -> float:
+        ''' Cheapest cell to enter, so the Chebyshev heuristic stays admissible '''
+        finite = self.cost[self.cost < INF]
+        return float(finite.min()) if finite.size else EPSILON
+
+    def _cost_window(self, y1: int, y2: int, x1: int, x2: int) -> np.ndarray:
+        ''' (y2 - y1, x2 - x1) cost of entering each cell, INF for impassable tiles '''
+        window = self.graph[y1:y2, x1:x2]
+        cost = np.maximum(window.cost_layer(self.cost_dict), EPSILON)
+        if self.impassable:
+            # the table prunes edges into these, but their own entries
+            # are what _update reads to price moving onto them
+            cost = np.where(window.mask(self.impassable), INF, cost)
+        return cost
+
+    def _flat(self, loc: GridLocation) -> int:
+        return loc[0] * self.graph.width + loc[1]
+
+    #------------------------------
+    # D* Lite core
+    #------------------------------
+    def _key(self, i: int) -> Tuple[float, float]:
+        m = min(self._g[i], self._rhs[i])
+        y, x = divmod(i, self.graph.width)
+        gy, gx = self.goal
+        return (m + self.scale * max(abs(y - gy), abs(x - gx)) + self.km, m)
+
+    def _push(self, i: int) -> None:
+        key = self._key(i)
+        self.open[i] = key
+        heapq.heappush(self.heap, (key, i))
+
+    def _top(self):
+        heap, open_ = self.heap, self.open
+        while heap:
+            key, i = heap[0]
+            if open_.get(i) == key:
+                return key, i
+            heapq.heappop(heap)
+        return (INF, INF), -1
+
+    def _state(self):
+        views = self.graph.adjacency(self.cost_dict, self.impassable).views()
+        return views, memoryview(self.cost), self._g, self._rhs, memoryview(self.parent)
+
+    def _queue(self, i: int, g, rhs) -> None:
+        ''' Put i on the open list if it is inconsistent, take it off if not '''
+        if g[i] != rhs[i]:
+            key = self._key(i)
+            if self.open.get(i) != key:
+                self.open[i] = key
+                heapq.heappush(self.heap, (key, i))
+        else:
+            self.open.pop(i, None)
+
+    def _update(self, i: int, views, cost, g, rhs, parent) -> None:
+        ''' Recompute rhs and parent of i from all its neighbors '''
+        index, _, count = views
+        if i != self.root:
+            best, best_j = INF, len(g)
+            k = i * grid.Adjacency.SLOTS
+            for k in range(k, k + count[i]):
+                j = index[k]
+                if g[j] < best:
+                    best, best_j = g[j], j
+            rhs[i] = best + cost[i]
+            parent[i] = best_j
+        self._queue(i, g, rhs)
+
+    def _compute(self) -> None:
+        state = self._state()
+        (index, _, count), cost, g, rhs, parent = state
+        open_ = self.open
+        root = self.root
+        slots = grid.Adjacency.SLOTS
+        t = self._flat(self.goal)
+        expanded = 0
+        while True:
+            k_old, u = self._top()
+            if u < 0 or (k_old >= self._key(t) and rhs[t] == g[t]):
+                break
+            k_new = self._key(u)
+            if k_old < k_new:
+                self._push(u)
+                continue
+            heapq.heappop(self.heap)
+            del open_[u]
+            expanded += 1
+            k = u * slots
+            if g[u] > rhs[u]:
+                # g went down: neighbors can only get cheaper, through u
+                g[u] = rhs[u]
+                for k in range(k, k + count[u]):
+                    j = index[k]
+                    c = g[u] + cost[j]
+                    if c < rhs[j] and j != root:
+                        rhs[j] = c
+                        parent[j] = u
+                        self._queue(j, g, rhs)
+            else:
+                # g went up: only cells hanging off u lose their support
+                g[u] = INF
+                self._update(u, *state)
+                for k in range(k, k + count[u]):
+                    j = index[k]
+                    if parent[j] == u:
+                        self._update(j, *state)
+        self.expanded = expanded
+        self.total_expanded += expanded
+
+    #------------------------------
+    # Change handling
+    #------------------------------
+    def _reroot(self, new_root: int) -> bool:
+        ''' Move the root to a settled cell of the tree; False if there is none
+
+        The cells to drop are found by walking the tree down from the old
+        root, skipping new_root's subtree, so the work is proportional to
+        the cells dropped rather than to the map.
+        '''
+        state = self._state()
+        _, _, g, rhs, parent = state
+        if not (g[new_root] < INF and g[new_root] == rhs[new_root]):
+            return False
+        H, W = self.graph.height, self.graph.width
+        n = len(g)
+        old_root, self.root = self.root, new_root
+        parent[new_root] = n
+        # subtree costs stay measured from the old root: every one of them,
+        # and so every key, is off by the same g[new_root], which changes
+        # no comparison.  The new root simply keeps rhs == g.
+
+        # cells that lost their support but haven't been raised yet have no
+        # parent either; being inconsistent, they are all on the open list
+        stack = [old_root] + [i for i in self.open if parent[i] == n and i != new_root]
+        offsets = [dy * W + dx for dy, dx in _DIRS]
+        dropped = set()
+        while stack:
+            u = stack.pop()
+            if u in dropped:
+                continue
+            dropped.add(u)
+            # children by position: an impassable child is missing from u's table entry
+            y, x = divmod(u, W)
+            if 0 < y < H - 1 and 0 < x < W - 1:
+                for o in offsets:
+                    if parent[u + o] == u:
+                        stack.append(u + o)
+            else:
+                for dy, dx in _DIRS:
+                    cy, cx = y + dy, x + dx
+                    if 0 <= cy < H and 0 <= cx < W and parent[cy * W + cx] == u:
+                        stack.append(cy * W + cx)
+        for i in dropped:
+            g[i] = rhs[i] = INF
+            parent[i] = n
+            self.open.pop(i, None)
+        # only dropped cells next to the subtree can have a finite rhs now
+        for i in dropped:
+            self._update(i, *state)
+        return True
+
+    def _sync_grid(self) -> bool:
+        ''' Patch costs and update cells around grid writes; False if the plan has to be rebuilt '''
+        rects = self.cursor.drain()
+        if rects is None:
+            # journal too short
+            return False
+        if not rects:
+            return True
+        G = self.graph
+        H, W = G.height, G.width
+        cost = self.cost.reshape(H, W)
+        cells = set()
+        for y1, y2, x1, x2 in rects:
+            window = cost[y1:y2, x1:x2] = self._cost_window(y1, y2, x1, x2)
+            if window[window < INF].min(initial=INF) < self.scale:
+                # a cheaper tile broke the heuristic
+                return False
+            for y in range(max(y1 - 1, 0), min(y2 + 1, H)):
+                cells.update(range(y * W + max(x1 - 1, 0), y * W + min(x2 + 1, W)))
+        state = self._state()
+        for i in cells:
+            self._update(i, *state)
+        return True
+
+    def replan(self, start: Optional[GridLocation] = None, goal: Optional[GridLocation] = None) -> None:
+        ''' Bring the plan up to date with new agent/target positions and grid edits '''
+        start = self.start if start is None else start
+        goal = self.goal if goal is None else goal
+        if goal != self.goal:
+            gy, gx = self.goal
+            self.km += self.scale * max(abs(goal[0] - gy), abs(goal[1] - gx))
+            self.goal = goal
+        if not self._sync_grid():
+            self.start = start
+            self.reset()
+        elif start != self.start:
+            self.start = start
+            if not self._reroot(self._flat(start)):
+                self.reset()
+        self._compute()
+
+    #------------------------------
+    # Queries
+    #------------------------------
+    def cost_to_goal(self) -> float:
+        return float(self.g[self._flat(self.goal)] - self.g[self.root])
+
+    def next_step(self, start: Optional[GridLocation] = None,
+                  goal: Optional[GridLocation] = None) -> Optional[GridLocation]:
+        ''' Replan, then the neighbor of start to step onto (None at the goal or if cut off) '''
+        self.replan(start, goal)
+        path = self.path()
+        return path[0] if path else None
+
+    def path(self) -> List[GridLocation]:
+        ''' Search tree branch from start (exclusive) to goal (inclusive) '''
+        width = self.graph.width
+        parent = self.parent
+        i = self._flat(self.goal)
+        if not self.g[i] < INF:
+            return []
+        path = []
+        while i != self.root and len(path) < len(parent):
+            path.append(divmod(i, width))
+            i = int(parent[i])
+        path.reverse()
+        return path
+
+
+if __name__ == "__main__":
+    G = grid.ArrayGrid(12, 30, ".")
+    G[5, 1:29] = "#"
+    cost_dict = {".": 1.0, "#": 99}
+
+    me, you = (1, 3), (9, 20)
+    planner = DStarLite(G, cost_dict, ["#"], me, you)
+    for turn in range(12):
+        if turn == 6:
+            G[5, 20:29] = "."
+        if turn == 8:
+            G[5, 20:29] = "#"
+        step = planner.next_step(me, you)
+        print(f"turn {turn}: {me} -> {you}: cost {planner.cost_to_goal()}, "
+              f"expanded {planner.expanded}, step {step}")
+        if step is not None and step != you:
+            me = step
+        you = (you[0], you[1] - 1 if turn % 3 else you[1])
@@ -1,14 +1,12 @@
 # stdlib
 import random
 import math
-import copy
 from typing import List
 import logging
 
 from typing import Protocol, Iterator, Tuple, TypeVar, Optional, Iterable, List
 
-# anytree
-from anytree import Node, RenderTree, LevelOrderIter, AnyNode
+import numpy as np
 
 # project
 import grid
@@ -53,6 +51,73 @@ class Room:
         return f"{self.y1},{self.y2},{self.x1},{self.x2},{self.height},{self.width}"
 
 
+class BSPTree:
+    """Binary space partition stored as flat arrays, heap-indexed
+
+    Node k has its children at 2k+1 and 2k+2.  Every level of splitting
+    gives each leaf one child (the space carried down unsplit, in the left
+    slot) or two, so after depth levels all leaves sit on the bottom level.
+    The leaves under any node are then one run of bottom slots, and
+    index_leaves() turns that into a (start, stop) range of self.leaves.
+
+    Attributes
+    ----------
+    depth : int
+        number of levels below the root
+    y1, y2, x1, x2 : List[int]
+        space of each slot
+    split : List[Optional[str]]
+        "vertical" / "horizontal" for the two halves of a split, None for
+        the root and carried-down copies
+    present : bytearray
+        1 for slots that hold a node
+    leaves : List[int]
+        bottom slots holding a node, left to right
+    """
+
+    def __init__(self, space: Room, depth: int):
+        self.depth = depth
+        size = 2 ** (depth + 1) - 1
+        self.y1 = [0] * size
+        self.y2 = [0] * size
+        self.x1 = [0] * size
+        self.x2 = [0] * size
+        self.split: List[Optional[str]] = [None] * size
+        self.present = bytearray(size)
+        self.add(0, space.y1, space.y2, space.x1, space.x2, None)
+        self.leaves: List[int] = []
+        self._rank: List[int] = []
+
+    def add(self, k: int, y1: int, y2: int, x1: int, x2: int, split: Optional[str]) -> None:
+        self.y1[k], self.y2[k], self.x1[k], self.x2[k] = y1, y2, x1, x2
+        self.split[k] = split
+        self.present[k] = 1
+
+    def level(self, d: int) -> List[int]:
+        """Slots holding a node on level d, left to right"""
+        first = 2 ** d - 1
+        return [k for k in range(first, 2 * first + 1) if self.present[k]]
+
+    def is_split(self, k: int) -> bool:
+        """Does node k have two children?"""
+        return 2 * k + 2 < len(self.present) and self.present[2 * k + 2] == 1
+
+    def index_leaves(self) -> None:
+        """Fill self.leaves and the per-slot ranks leaf_range() reads"""
+        first = 2 ** self.depth - 1
+        self.leaves = self.level(self.depth)
+        rank = [0]
+        for k in range(first, 2 * first + 1):
+            rank.append(rank[-1] + self.present[k])
+        self._rank = rank
+
+    def leaf_range(self, k: int) -> Tuple[int, int]:
+        """(start, stop) of the leaves under node k in self.leaves"""
+        span = 2 ** (self.depth - ((k + 1).bit_length() - 1))
+        lo = (k + 1) * span - 2 ** self.depth
+        return self._rank[lo], self._rank[lo + span]
+
+
 class DungeonGenerator:
     """Dungeon generatur using BSP Algorithm
 
@@ -74,99 +139,63 @@ class DungeonGenerator:
         '''
         self.width =  width
         self.height = height
-        self.grid = grid.Grid(self.height, self.width, "#")
+        self.grid = grid.ArrayGrid(self.height, self.width, "#")
         self.num_levels = int(math.log2(num_rooms))
+        self.rooms: List[Room] = []
 
         graph = self.make_rooms()
         self.connect_rooms(graph)
 
-    def make_rooms(self):
+    def make_rooms(self) -> BSPTree:
         """Construct rooms using BSP algorithm"""
-        root = Room(2, self.height - 2, 2, self.width - 2)
-
-        graph = AnyNode(id="root", room=root, split=None)
+        tree = BSPTree(Room(2, self.height - 2, 2, self.width - 2), self.num_levels)
 
         # -------------------------------------------------
         # Create a binary tree of divided spaces
         # -------------------------------------------------
-        counter = 0
         for i in range(self.num_levels):
-            for cur_node in graph.leaves:
-                cur_room = cur_node.room
+            for k in tree.level(i):
+                y1, y2, x1, x2 = tree.y1[k], tree.y2[k], tree.x1[k], tree.x2[k]
+                height, width = y2 - y1, x2 - x1
                 split_dir = random.choices(
                     ["vertical", "horizontal"],
-                    weights=[cur_room.height, cur_room.width],
+                    weights=[height, width],
                 )[0]
                 # vertical split: pick a row, make two rooms
                 if split_dir == "vertical":
                     # weighted choice taller rooms
-                    if cur_room.height < 9:
-                        new_room = AnyNode(
-                            id=str(counter),
-                            room=copy.copy(cur_room),
-                            split=None,
-                            parent=cur_node,
-                        )
-                        counter += 1
+                    if height < 9:
+                        tree.add(2 * k + 1, y1, y2, x1, x2, None)
                     else:
-                        row = random.randint(cur_room.y1 + 4, cur_room.y2 - 4)
-                        new_room = AnyNode(
-                            id=str(counter),
-                            room=Room(cur_room.y1, row - 1, cur_room.x1, cur_room.x2),
-                            split="vertical",
-                            parent=cur_node,
-                        )
-                        counter += 1
-                        new_room = AnyNode(
-                            id=str(counter),
-                            room=Room(row + 1, cur_room.y2, cur_room.x1, cur_room.x2),
-                            split="vertical",
-                            parent=cur_node,
-                        )
-                        counter += 1
+                        row = random.randint(y1 + 4, y2 - 4)
+                        tree.add(2 * k + 1, y1, row - 1, x1, x2, "vertical")
+                        tree.add(2 * k + 2, row + 1, y2, x1, x2, "vertical")
                 # horizontal split: pick a column, make two rooms
                 else:
                     # weighted choice wider rooms
-                    if cur_room.width < 9:
-                        new_room = AnyNode(
-                            id=str(counter),
-                            room=copy.copy(cur_room),
-                            split=None,
-                            parent=cur_node,
-                        )
-                        counter += 1
+                    if width < 9:
+                        tree.add(2 * k + 1, y1, y2, x1, x2, None)
                     else:
-                        col = random.randint(cur_room.x1 + 4, cur_room.x2 - 4)
-                        new_room = AnyNode(
-                            id=str(counter),
-                            room=Room(cur_room.y1, cur_room.y2, cur_room.x1, col - 1),
-                            split="horizontal",
-                            parent=cur_node,
-                        )
-                        counter += 1
-                        new_room = AnyNode(
-                            id=str(counter),
-                            room=Room(cur_room.y1, cur_room.y2, col + 1, cur_room.x2),
-                            split="horizontal",
-                            parent=cur_node,
-                        )
-                        counter += 1
+                        col = random.randint(x1 + 4, x2 - 4)
+                        tree.add(2 * k + 1, y1, y2, x1, col - 1, "horizontal")
+                        tree.add(2 * k + 2, y1, y2, col + 1, x2, "horizontal")
+        tree.index_leaves()
 
         # -------------------------------------------
         # For each space, construct a room
         # -------------------------------------------
-        for leaf in graph.leaves:
-            room = leaf.room
-            w = random.randint(2, room.width - 1)
-            h = random.randint(2, room.height - 1)
-            x1 = random.randint(room.x1 + 1, room.x2 - w)
+        for k in tree.leaves:
+            w = random.randint(2, tree.x2[k] - tree.x1[k] - 1)
+            h = random.randint(2, tree.y2[k] - tree.y1[k] - 1)
+            x1 = random.randint(tree.x1[k] + 1, tree.x2[k] - w)
             x2 = x1 + w
-            y1 = random.randint(room.y1 + 1, room.y2 - h)
+            y1 = random.randint(tree.y1[k] + 1, tree.y2[k] - h)
             y2 = y1 + h
-            leaf.room = Room(y1, y2, x1, x2)
-            room = leaf.room
-            self.grid[room.y1 : room.y2, room.x1 : room.x2] = "."  # leaf.id[0]
-        return graph
+            room = Room(y1, y2, x1, x2)
+            self.grid[room.y1 : room.y2, room.x1 : room.x2] = "."
+            # self.rooms[n] is the room in leaf tree.leaves[n]
+            self.rooms.append(room)
+        return tree
 
     def calc_control_points(self, room):
         """Get control points for a room"""
@@ -235,7 +264,31 @@ class DungeonGenerator:
             return True
         return False
 
-    def connect_rooms(self, graph) -> None:
+    def closest_rooms(self, pts: np.ndarray, left: Tuple[int, int], right: Tuple[int, int]) -> Tuple[int, int]:
+        """Indices of the closest pair of rooms, one from each range
+
+        pts is the (num_rooms, 4, 2) array of control points.  Pairs are
+        compared by their closest control points, and ties go to the first
+        pair in (left, right) order, as find_min_distance does per pair.
+        """
+        a = pts[left[0] : left[1]]
+        b = pts[right[0] : right[1]]
+        best, best_pair = None, None
+        # a block of left rooms at a time, so the distance table stays small
+        step = max(1, (1 << 20) // (16 * len(b)))
+        for start in range(0, len(a), step):
+            block = a[start : start + step]
+            # squared distance of every control point pair: (block, 4, b, 4)
+            dy = block[:, :, None, None, 0] - b[None, None, :, :, 0]
+            dx = block[:, :, None, None, 1] - b[None, None, :, :, 1]
+            dist = (dy * dy + dx * dx).min(axis=(1, 3))
+            i = int(dist.argmin())
+            if best is None or dist.flat[i] < best:
+                best = dist.flat[i]
+                best_pair = (left[0] + start + i // len(b), right[0] + i % len(b))
+        return best_pair
+
+    def connect_rooms(self, graph: BSPTree) -> None:
         """Connect rooms sotred in a sparse binary graph
 
         Returns
@@ -243,56 +296,56 @@ class DungeonGenerator:
         None
         """
         ctr = 0
+        pts = np.array(
+            [self.calc_control_points(room) for room in self.rooms], dtype=np.int64
+        ).reshape(-1, 4, 2)
 
         # ----------------------------------------------
         # Iterate over levels of the graph
         # ----------------------------------------------
-        for node in LevelOrderIter(graph):
+        for level in range(graph.depth):
+            for node in graph.level(level):
 
-            # -----------------------------------------------
-            # If there is more than one child, connect them
-            # -----------------------------------------------
-            if len(node.children) == 2:
+                # -----------------------------------------------
+                # If there is more than one child, connect them
+                # -----------------------------------------------
+                if not graph.is_split(node):
+                    continue
 
                 # ----------------------------------------------------
                 # Find the closest leaves from left set and right set
                 # ----------------------------------------------------
-                min_dist = 999999
-                for idx, leaf1 in enumerate(node.children[0].leaves):
-                    for idx2, leaf2 in enumerate(node.children[1].leaves):
-                        pts1 = self.calc_control_points(leaf1.room)
-                        pts2 = self.calc_control_points(leaf2.room)
-                        left, right, dist = self.find_min_distance(pts1, pts2)
-                        if dist < min_dist:
-                            n1 = leaf1
-                            n2 = leaf2
-                            min_dist = dist
+                i1, i2 = self.closest_rooms(
+                    pts, graph.leaf_range(2 * node + 1), graph.leaf_range(2 * node + 2)
+                )
+                n1 = self.rooms[i1]
+                n2 = self.rooms[i2]
 
                 # ------------------------------------------------------
                 #  if the xs or ys intersect, connect directly
                 # ------------------------------------------------------
                 intersection_y, intersection_x = self.calc_intersection(
-                    n1.room, n2.room
+                    n1, n2
                 )
                 if len(intersection_y):
                     y1 = y2 = random.choice(intersection_y)
-                    if self.is_left(n1.room, n2.room):
-                        x1 = n1.room.x2
-                        x2 = n2.room.x1 - 1
+                    if self.is_left(n1, n2):
+                        x1 = n1.x2
+                        x2 = n2.x1 - 1
                         corridor = self.calc_line_segment(x1, x2, y1, y2)
                     else:
-                        x1 = n1.room.x1 - 1
-                        x2 = n2.room.x2
+                        x1 = n1.x1 - 1
+                        x2 = n2.x2
                         corridor = self.calc_line_segment(x1, x2, y1, y2)
                 elif len(intersection_x):
                     x1 = x2 = random.choice(intersection_x)
-                    if self.is_above(n1.room, n2.room):
-                        y1 = n1.room.y2
-                        y2 = n2.room.y1 - 1
+                    if self.is_above(n1, n2):
+                        y1 = n1.y2
+                        y2 = n2.y1 - 1
                         corridor = self.calc_line_segment(x1, x2, y1, y2)
                     else:
-                        y1 = n1.room.y1 - 1
-                        y2 = n2.room.y2
+                        y1 = n1.y1 - 1
+                        y2 = n2.y2
                         corridor = self.calc_line_segment(x1, x2, y1, y2)
 
                 else:  # no intersection
@@ -300,8 +353,8 @@ class DungeonGenerator:
                     # -------------------------------------------------
                     # Find shortest path between room control points
                     # -------------------------------------------------
-                    pts1 = self.calc_control_points(n1.room)
-                    pts2 = self.calc_control_points(n2.room)
+                    pts1 = self.calc_control_points(n1)
+                    pts2 = self.calc_control_points(n2)
                     left, right, _ = self.find_min_distance(pts1, pts2)
 
                     sides = ["U", "D", "L", "R"]
@@ -1,7 +1,64 @@
 "fov.py - Field-of-view calculation for Pyro."
 
 #from util import *
-from math import sqrt
+from bisect import bisect_left
+from math import ceil, isqrt, sqrt
+
+import numpy as np
+
+#------------------------------
+# Shared tables
+#------------------------------
+# Cell i of octant row j spans the slopes (r_slope, l_slope).  The rows are
+# grown to the largest radius asked for so far and shared by every FOVMap
+# and ArrayFOV in the process; they are never shrunk, and take about
+# 70 * radius**2 bytes (0.7 MB at radius 100, 70 MB at 1000).  Row limits
+# and disc masks are kept for the TABLE_CACHE radii built most recently.
+TABLE_CACHE = 64
+_slopes = []    # row j -> [(l_slope, r_slope) for i in 0..j+1]
+_lslopes = []   # row j -> [l_slope ...]
+_rslopes = []   # row j -> [r_slope ...]
+_limits = {}
+_discs = {}
+
+
+def _evict(cache: dict) -> None:
+    # dicts keep insertion order, so the first key is the oldest
+    while len(cache) >= TABLE_CACHE:
+        del cache[next(iter(cache))]
+
+
+def slope_table(radius: int) -> list:
+    ''' The shared (l_slope, r_slope) rows, grown to cover rows 0..radius '''
+    for j in range(len(_slopes), radius + 1):
+        l_slopes = [(i + 0.5) / (j - 0.5) for i in range(j + 2)]
+        r_slopes = [(i - 0.5) / (j + 0.5) for i in range(j + 2)]
+        _lslopes.append(l_slopes)
+        _rslopes.append(r_slopes)
+        _slopes.append(list(zip(l_slopes, r_slopes)))
+    return _slopes
+
+
+def row_limits(radius: int) -> list:
+    ''' Per octant row j, how many cells i are within radius: i*i + j*j <= (radius + 0.5)**2 '''
+    limit = _limits.get(radius)
+    if limit is None:
+        _evict(_limits)
+        # the same test in integers: i*i + j*j <= radius*(radius+1)
+        limit = _limits[radius] = [isqrt(radius * radius + radius - j * j) + 1
+                                   for j in range(radius + 1)]
+    return limit
+
+
+def disc(radius: int) -> np.ndarray:
+    ''' (2r+1, 2r+1) read-only bool mask of offsets within radius, centre at [r, r] '''
+    mask = _discs.get(radius)
+    if mask is None:
+        _evict(_discs)
+        d = np.arange(-radius, radius + 1)
+        mask = _discs[radius] = d[:, None] ** 2 + d[None, :] ** 2 <= radius * radius + radius
+        mask.flags.writeable = False
+    return mask
 
 
 class FOVMap(object):
@@ -20,26 +77,18 @@ class FOVMap(object):
         self.Blocked = blocked_function
         self.width, self.height = width, height
         self.lit_now, self.was_lit = {}, {}
-        # precalculate an octant's worth of l_slopes and r_slopes:
-        self.slopes = []
-        for j in range(82):
-            self.slopes.append([])
-            for i in range(j+2):
-                l_slope = (i+0.5) / (j-0.5)
-                r_slope = (i-0.5) / (j+0.5)
-                self.slopes[j].append((l_slope, r_slope))
+        self.fov_list = {}
+        # an octant's worth of l_slopes and r_slopes, shared and grown on demand:
+        self.slopes = _slopes
 
     def Ball(self, x, y, radius, ignore_walls=False):
-        radius_squared = (radius + 0.5) ** 2
         if 0 or ignore_walls:
-            f = {}
             sx, ex = max(0, x-radius), min(self.width-1, x+radius)
             sy, ey = max(0, y-radius), min(self.height-1, y+radius)
-            for i in range(sx, ex+1):
-                for j in range(sy, ey+1):
-                    if (x - i) ** 2 + (y - j) ** 2 <= radius_squared:
-                        f[(i, j)] = True
-            return f.keys()
+            window = disc(radius)[sy-(y-radius):ey-(y-radius)+1, sx-(x-radius):ex-(x-radius)+1]
+            # transposed so the keys come out x-major, as they always have
+            i, j = window.T.nonzero()
+            return dict.fromkeys(zip((i + sx).tolist(), (j + sy).tolist()), True).keys()
         else:
             return self.FOVList(x, y, radius)
 
@@ -94,6 +143,7 @@ class FOVMap(object):
 
     def FOVList(self, x, y, radius):
         "Return a list of squares that are in view from (x, y) within the given radius."
+        slope_table(radius)
         self.fov_list = {}
         self.fov_list[(x, y)] = True
         for oct in range(8):
@@ -102,7 +152,8 @@ class FOVMap(object):
                           self.mult[2][oct], self.mult[3][oct])
         return self.fov_list.keys()
 
-    def GetOctant(self, dx, dy):
+    @staticmethod
+    def GetOctant(dx, dy):
         "Return which octant the given offset lies in."
         # Octants: 0=NNW, 1=WNW, 2=ENE, 3=NNE, 4=SSE, 5=ESE, 6=WSW, 7=SSW
         if dx == dy == 0:
@@ -151,11 +202,14 @@ class FOVMap(object):
         if dx == dy == 0:
             return True
         oct = self.GetOctant(dx, dy)
-        self.fov_list = {}
-        self.cast_fov(x1, y1, 1, 1.0, 0.0, distance,
+        slope_table(distance)
+        fov_list, self.fov_list = self.fov_list, {}
+        self.cast_fov(x1, y1, 1, 0.0, 1.0, distance,
                       self.mult[0][oct], self.mult[1][oct],
                       self.mult[2][oct], self.mult[3][oct])
-        return (x2,y2) in self.fov_list
+        # leave the last FOVList() result alone
+        fov_list, self.fov_list = self.fov_list, fov_list
+        return (x2,y2) in fov_list
 
     def SetLit(self, x, y=None):
         if y is None:
@@ -168,5 +222,393 @@ class FOVMap(object):
     def UnlightAll(self):
         self.lit_now = {}
 
+
+#------------------------------
+# Visibility bitmaps
+#------------------------------
+class FOVMask:
+    ''' A set of cells, stored as a bool array over its bounding box
+
+    The set operators (| & ^ -) line both masks up on the union of their
+    boxes and combine them with one array op each, so diffing two fields of
+    view is a handful of vectorized ops rather than a hash per cell.
+    Iterating yields (y, x) cells in row-major order.
+
+    Usage::
+
+        view.compute(PC.loc, 8)
+        new = view.mask()
+        shown, hidden = old.diff(new)
+        for loc in hidden: ...
+
+    Attributes
+    ----------
+    bits : np.ndarray
+        (h, w) bool
+    y, x : int
+        map cell of bits[0, 0]
+    '''
+    __slots__ = ("bits", "y", "x")
+
+    def __init__(self, bits: np.ndarray, y: int = 0, x: int = 0):
+        self.bits = bits
+        self.y, self.x = y, x
+
+    @classmethod
+    def from_cells(cls, cells) -> "FOVMask":
+        ''' Mask of an iterable of (y, x) cells '''
+        cells = np.array(list(cells), dtype=np.int64).reshape(-1, 2)
+        if not len(cells):
+            return cls(np.zeros((0, 0), dtype=bool))
+        y, x = cells.min(axis=0).tolist()
+        h, w = (cells.max(axis=0) + 1).tolist()
+        bits = np.zeros((h - y, w - x), dtype=bool)
+        bits[cells[:, 0] - y, cells[:, 1] - x] = True
+        return cls(bits, y, x)
+
+    @property
+    def box(self):
+        ''' (y1, y2, x1, x2), half open '''
+        h, w = self.bits.shape
+        return self.y, self.y + h, self.x, self.x + w
+
+    def _pair(self, other: "FOVMask"):
+        ''' Both masks' bits over the union of their boxes, and its corner '''
+        if self.bits.shape == other.bits.shape and (self.y, self.x) == (other.y, other.x):
+            return self.bits, other.bits, self.y, self.x
+        boxes = [m.box for m in (self, other) if m.bits.size]
+        if not boxes:
+            return self.bits, self.bits, 0, 0
+        y1, x1 = min(b[0] for b in boxes), min(b[2] for b in boxes)
+        y2, x2 = max(b[1] for b in boxes), max(b[3] for b in boxes)
+        out = []
+        for m in (self, other):
+            bits = np.zeros((y2 - y1, x2 - x1), dtype=bool)
+            if m.bits.size:
+                my1, my2, mx1, mx2 = m.box
+                bits[my1 - y1 : my2 - y1, mx1 - x1 : mx2 - x1] = m.bits
+            out.append(bits)
+        return out[0], out[1], y1, x1
+
+    def __or__(self, other: "FOVMask") -> "FOVMask":
+        a, b, y, x = self._pair(other)
+        return FOVMask(a | b, y, x)
+
+    def __and__(self, other: "FOVMask") -> "FOVMask":
+        a, b, y, x = self._pair(other)
+        return FOVMask(a & b, y, x)
+
+    def __xor__(self, other: "FOVMask") -> "FOVMask":
+        a, b, y, x = self._pair(other)
+        return FOVMask(a ^ b, y, x)
+
+    def __sub__(self, other: "FOVMask") -> "FOVMask":
+        a, b, y, x = self._pair(other)
+        return FOVMask(a & ~b, y, x)
+
+    def diff(self, new: "FOVMask"):
+        ''' (shown, hidden): cells only in new, and cells only in self '''
+        # each result lives in its own mask's box; only the overlap is compared
+        shown, hidden = new.bits.copy(), self.bits.copy()
+        y1, y2 = max(self.y, new.y), min(self.y + self.bits.shape[0], new.y + new.bits.shape[0])
+        x1, x2 = max(self.x, new.x), min(self.x + self.bits.shape[1], new.x + new.bits.shape[1])
+        if y1 < y2 and x1 < x2:
+            mine = (slice(y1 - self.y, y2 - self.y), slice(x1 - self.x, x2 - self.x))
+            theirs = (slice(y1 - new.y, y2 - new.y), slice(x1 - new.x, x2 - new.x))
+            both = self.bits[mine] & new.bits[theirs]
+            shown[theirs] ^= both
+            hidden[mine] ^= both
+        return FOVMask(shown, new.y, new.x), FOVMask(hidden, self.y, self.x)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, FOVMask):
+            return NotImplemented
+        a, b, _, _ = self._pair(other)
+        return bool(np.array_equal(a, b))
+
+    __hash__ = None
+
+    def __contains__(self, loc) -> bool:
+        y, x = loc[0] - self.y, loc[1] - self.x
+        h, w = self.bits.shape
+        return 0 <= y < h and 0 <= x < w and bool(self.bits[y, x])
+
+    def __iter__(self):
+        # flatnonzero is several times quicker than a 2-D nonzero on small boxes
+        ys, xs = np.divmod(np.flatnonzero(self.bits), self.bits.shape[1] or 1)
+        return zip((ys + self.y).tolist(), (xs + self.x).tolist())
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.bits))
+
+    def __bool__(self) -> bool:
+        return bool(self.bits.any())
+
+    def __repr__(self):
+        return f"FOVMask({len(self)} cells in {self.box})"
+
+
+#------------------------------
+# Array-based shadowcasting
+#------------------------------
+class ArrayFOV:
+    ''' FOVMap's recursive shadowcasting over an opacity array
+
+    Opacity is read straight from a buffer of height * width bytes (a
+    NumPy bool/uint8 array or bytes; nonzero blocks sight), and visibility
+    is written into one bitmap that is cleared and reused by every call.
+    Cells are addressed by flat index, so each octant is just a pair of
+    index steps and a scanned cell costs one buffer read.
+
+    Inside the map the result is exactly FOVMap.FOVList's; anything past
+    the map edge counts as opaque.
+
+    Usage::
+
+        view = ArrayFOV.from_grid(G)
+        visible = view.compute(PC.loc, radius=8)
+        if visible[y, x]: ...
+
+    Attributes
+    ----------
+    visible : np.ndarray
+        (height, width) bool, cells seen by the last compute()
+    box : Rect
+        (y1, y2, x1, x2) bounding box of the last compute(); visible is
+        False everywhere outside it
+    '''
+
+    def __init__(self, opacity, width: int, height: int):
+        self.width, self.height = width, height
+        self.set_opacity(opacity)
+        self.visible = np.zeros((height, width), dtype=bool)
+        self._vis = memoryview(self.visible).cast("B")
+        self.box = (0, 0, 0, 0)
+
+    @classmethod
+    def from_grid(cls, G) -> "ArrayFOV":
+        ''' Engine on G's blocks_vision layer, which G keeps current across writes '''
+        return cls(G.layer("blocks_vision"), G.width, G.height)
+
+    def set_opacity(self, opacity) -> None:
+        ''' Read opacity from a new buffer; contiguous bool/uint8 arrays are used in place '''
+        if isinstance(opacity, np.ndarray):
+            arr = opacity
+        else:
+            arr = np.frombuffer(opacity, dtype=np.uint8)
+        if arr.dtype.itemsize != 1 or not arr.flags.c_contiguous:
+            # a copy, so later edits to opacity are not seen
+            arr = np.ascontiguousarray(arr != 0)
+        self.opacity = arr.reshape(self.height, self.width).view(np.uint8)
+        self._op = memoryview(self.opacity).cast("B", (self.height * self.width,))
+
+    def mask(self) -> FOVMask:
+        ''' The last compute() as a FOVMask over its bounding box (a copy) '''
+        y1, y2, x1, x2 = self.box
+        return FOVMask(self.visible[y1:y2, x1:x2].copy(), y1, x1)
+
+    def compute(self, origin, radius: int) -> np.ndarray:
+        ''' Cells visible from origin (y, x) within radius, as the visible bitmap '''
+        y, x = origin
+        H, W = self.height, self.width
+        by1, by2, bx1, bx2 = self.box
+        self.visible[by1:by2, bx1:bx2] = False
+        if not (0 <= y < H and 0 <= x < W):
+            self.box = (0, 0, 0, 0)
+            return self.visible
+        y1, y2 = max(y - radius, 0), min(y + radius + 1, H)
+        x1, x2 = max(x - radius, 0), min(x + radius + 1, W)
+        self.box = (y1, y2, x1, x2)
+        slope_table(radius)
+
+        if y1 == y - radius and x1 == x - radius and y2 == y + radius + 1 and x2 == x + radius + 1:
+            self._octants(self._op, self._vis, y * W + x, W, radius)
+            return self.visible
+
+        # the disc crosses the map edge: cast in a window with opaque margins
+        size = 2 * radius + 1
+        oy, ox = y - radius, x - radius
+        window = np.ones((size, size), dtype=np.uint8)
+        window[y1 - oy : y2 - oy, x1 - ox : x2 - ox] = self.opacity[y1:y2, x1:x2]
+        seen = np.zeros((size, size), dtype=bool)
+        self._octants(memoryview(window).cast("B", (size * size,)),
+                      memoryview(seen).cast("B", (size * size,)), radius * size + radius, size, radius)
+        self.visible[y1:y2, x1:x2] = seen[y1 - oy : y2 - oy, x1 - ox : x2 - ox]
+        return self.visible
+
+    def _octants(self, op, vis, c: int, stride: int, radius: int) -> None:
+        vis[c] = 1
+        limit = row_limits(radius)
+        mult = FOVMap.mult
+        for oct in range(8):
+            xx, xy, yx, yy = mult[0][oct], mult[1][oct], mult[2][oct], mult[3][oct]
+            self._cast(op, vis, c, radius, limit, -(xx + yx * stride), -(xy + yy * stride))
+
+    def _cast(self, op, vis, c: int, radius: int, limit, di: int, dj: int) -> None:
+        ''' One octant; cell i of row j is at flat index c + i*di + j*dj '''
+        lslopes, rslopes = _lslopes, _rslopes
+        casts = [(1, 0.0, 1.0)]
+        while casts:
+            row, start, end = casts.pop()
+            for j in range(row, radius + 1):
+                ls, rs = lslopes[j], rslopes[j]
+                # the cells the beam touches: l_slope >= start and r_slope < end
+                lo, hi = bisect_left(ls, start), bisect_left(rs, end)
+                p = c + j * dj + lo * di
+                lit = limit[j]
+                if j == radius:
+                    # last row: only lighting matters
+                    for p in range(p, p + (min(hi, lit) - lo) * di, di):
+                        vis[p] = 1
+                    break
+                blocked = False
+                for i in range(lo, hi):
+                    if i < lit:
+                        vis[p] = 1
+                    if op[p]:
+                        if not blocked:
+                            # light passing before this run goes on as a child beam
+                            if start < rs[i]:
+                                casts.append((j + 1, start, rs[i]))
+                            blocked = True
+                        new_start = ls[i]
+                    elif blocked:
+                        start = new_start
+                        blocked = False
+                    p += di
+                if blocked:
+                    break
+
+
+#------------------------------
+# Line of sight
+#------------------------------
+class LineOfSight:
+    ''' Line-of-sight tests in bulk, for (source, target) pairs as arrays
+
+    Two ways to answer:
+
+    - check(): Bresenham rays for every pair at once in NumPy.  A target
+      is seen if no opaque cell lies strictly between the two ends (the
+      target itself may be a wall).  The rays are symmetric, but
+      shadowcasting is not, so this agrees with FOVList on most but not
+      all pairs.
+    - check(..., exact=True): the target is seen iff FOVList from the
+      source with radius ceil(distance) contains it.  One octant is cast
+      per pair, and beams that cannot reach the target are dropped as
+      soon as they are spawned.
+
+    Usage::
+
+        los = LineOfSight.from_grid(G)
+        seen = los.check([m.loc for m in monsters], [PC.loc] * len(monsters))
+
+    Pairs are (y, x); targets off the map are never seen.
+    '''
+    # elements per ray block, to bound the (pairs, steps) temporaries
+    BLOCK = 1 << 20
+
+    def __init__(self, opacity, width: int, height: int):
+        # ArrayFOV's opacity handling, and its caster for pairs near the edge
+        self.fov = ArrayFOV(opacity, width, height)
+        self.width, self.height = width, height
+
+    @classmethod
+    def from_grid(cls, G) -> "LineOfSight":
+        return cls(G.layer("blocks_vision"), G.width, G.height)
+
+    def check(self, sources, targets, exact: bool = False) -> np.ndarray:
+        ''' Bool array, one per pair: can sources[n] see targets[n]? '''
+        sources = np.asarray(sources, dtype=np.int64).reshape(-1, 2)
+        targets = np.asarray(targets, dtype=np.int64).reshape(-1, 2)
+        H, W = self.height, self.width
+        inside = (((sources >= 0) & (sources < (H, W))).all(axis=1)
+                  & ((targets >= 0) & (targets < (H, W))).all(axis=1))
+        seen = np.zeros(len(sources), dtype=bool)
+        which = np.flatnonzero(inside)
+        if exact:
+            for n, s, t in zip(which.tolist(), sources[which].tolist(), targets[which].tolist()):
+                seen[n] = self._shadowcast(s, t)
+        else:
+            seen[which] = self._rays(sources[which], targets[which])
+        return seen
+
+    def _rays(self, sources: np.ndarray, targets: np.ndarray) -> np.ndarray:
+        op = self.fov.opacity.reshape(-1)
+        d = targets - sources
+        steps = np.abs(d).max(axis=1)
+        clear = np.ones(len(sources), dtype=bool)
+        # similar lengths together, so little of each block is padding
+        order = np.argsort(steps, kind="stable")
+        per_block = max(self.BLOCK // max(int(steps.max(initial=0)), 1), 1)
+        for start in range(0, len(order), per_block):
+            rows = order[start : start + per_block]
+            n = steps[rows][:, None]
+            k = np.arange(1, max(int(n.max()), 1))[None, :]
+            # the cell on step k, rounded to nearest: floor((2*k*d + n) / (2*n))
+            twice = 2 * np.maximum(n, 1)
+            y = sources[rows, 0:1] + (2 * k * d[rows, 0:1] + n) // twice
+            x = sources[rows, 1:2] + (2 * k * d[rows, 1:2] + n) // twice
+            # steps past the far end fall off the ray; clip them onto the map
+            cells = np.clip(y * self.width + x, 0, len(op) - 1)
+            clear[rows] = ~(op[cells].astype(bool) & (k < n)).any(axis=1)
+        return clear
+
+    def _shadowcast(self, source, target) -> bool:
+        ''' FOVList(source, ceil(distance)) contains target '''
+        (y, x), (ty, tx) = source, target
+        dx, dy = tx - x, ty - y
+        if dx == dy == 0:
+            return True
+        radius = int(ceil(sqrt(dx * dx + dy * dy)))
+        slope_table(radius)
+        H, W = self.height, self.width
+        if not (radius <= y < H - radius and radius <= x < W - radius):
+            # the octant may run off the map: let ArrayFOV cast in a window
+            return bool(self.fov.compute(source, radius)[ty, tx])
+        oct = FOVMap.GetOctant(dx, dy)
+        mult = FOVMap.mult
+        xx, xy, yx, yy = mult[0][oct], mult[1][oct], mult[2][oct], mult[3][oct]
+        # the octant maps (i, j) to dx = -(i*xx + j*xy), dy = -(i*yx + j*yy)
+        ti, tj = -(xx * dx + yx * dy), -(xy * dx + yy * dy)
+        return _reaches(self.fov._op, y * W + x, -(xx + yx * W), -(xy + yy * W), ti, tj)
+
+
+def _reaches(op, c: int, di: int, dj: int, ti: int, tj: int) -> bool:
+    ''' Does ArrayFOV._cast's octant light cell (ti, tj), radius permitting? '''
+    lslopes, rslopes = _lslopes, _rslopes
+    # a beam (start, end) touches the target at row tj iff start <= l_t and
+    # r_t < end; a beam's sub-beams only ever narrow, so one that fails
+    # either bound is dropped as soon as it appears
+    l_t, r_t = lslopes[tj][ti], rslopes[tj][ti]
+    casts = [(1, 0.0, 1.0)]
+    while casts:
+        row, start, end = casts.pop()
+        for j in range(row, tj):
+            if start > l_t:
+                break
+            ls, rs = lslopes[j], rslopes[j]
+            lo, hi = bisect_left(ls, start), bisect_left(rs, end)
+            p = c + j * dj + lo * di
+            blocked = False
+            for i in range(lo, hi):
+                if op[p]:
+                    if not blocked:
+                        if start < rs[i] and r_t < rs[i]:
+                            casts.append((j + 1, start, rs[i]))
+                        blocked = True
+                    new_start = ls[i]
+                elif blocked:
+                    start = new_start
+                    blocked = False
+                p += di
+            if blocked:
+                break
+        else:
+            if start <= l_t and r_t < end:
+                return True
+    return False
+
+
 if __name__ == "__main__":
     pass
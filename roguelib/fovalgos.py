@@ -0,0 +1,378 @@
+"fovalgos.py - Interchangeable field-of-view algorithms, looked up by name."
+
+# Every algorithm is a FOVMap subclass built as cls(width, height, blocked)
+# where blocked(x, y) -> bool, and answers FOVList(x, y, radius) with the
+# (x, y) cells in view, origin included, within FOVMap's radius test
+# i*i + j*j <= (radius + 0.5)**2.  Ball, Lit/SetLit and LOSExists carry over.
+# The new algorithms never call blocked() off the map: outside cells are
+# opaque and never in view.
+#
+# `python benchmark.py fovalgos` prints how fast each one is, what it sees
+# that shadowcast does not and the other way round, and how symmetric it is.
+#
+# References
+# ----------
+# Albert Ford, "Symmetric Shadowcasting", 2021
+# Jonathon Duerig, "Precise Permissive Field of View", RogueBasin, 2007
+
+from math import ceil, sqrt
+from typing import Callable, Dict, List, Tuple, Type
+
+import fov
+
+ALGORITHMS: Dict[str, Type[fov.FOVMap]] = {}
+
+
+def register(name: str) -> Callable[[type], type]:
+    ''' Class decorator adding an algorithm to ALGORITHMS '''
+    def add(cls: type) -> type:
+        ALGORITHMS[name] = cls
+        return cls
+    return add
+
+
+def make(name: str, width: int, height: int, blocked_function) -> fov.FOVMap:
+    try:
+        cls = ALGORITHMS[name]
+    except KeyError:
+        raise ValueError(f"unknown FOV algorithm {name!r}, expected one of {sorted(ALGORITHMS)}") from None
+    return cls(width, height, blocked_function)
+
+
+register("shadowcast")(fov.FOVMap)
+
+
+class FOVAlgorithm(fov.FOVMap):
+    ''' Base for algorithms that replace FOVList as a whole '''
+
+    def LOSExists(self, x1, y1, x2, y2):
+        "Is (x2, y2) in the FOVList from (x1, y1)?"
+        distance = int(ceil(sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2)))
+        # leave the last FOVList() result alone
+        fov_list = self.fov_list
+        seen = (x2, y2) in self.FOVList(x1, y1, distance)
+        self.fov_list = fov_list
+        return seen
+
+
+#------------------------------
+# Symmetric shadowcasting
+#------------------------------
+@register("symmetric")
+class SymmetricFOV(FOVAlgorithm):
+    ''' Shadowcasting in which A sees B exactly when B sees A
+
+    Rows are scanned per quadrant as in Ford's algorithm.  A floor cell is
+    in view only if its centre lies inside the beam, so the result is
+    symmetric; walls are in view if the beam touches them at all, so room
+    walls still show.  Slopes are kept as integer fractions, which makes
+    the centre test exact.
+    '''
+    # (dx, dy) per unit of depth, (dx, dy) per unit of column
+    quadrants = (((0, -1), (1, 0)), ((0, 1), (1, 0)), ((1, 0), (0, 1)), ((-1, 0), (0, 1)))
+
+    def FOVList(self, x, y, radius):
+        "Return a list of squares that are in view from (x, y) within the given radius."
+        self.fov_list = {(x, y): True}
+        for quadrant in self.quadrants:
+            self.scan_quadrant(x, y, radius, quadrant)
+        return self.fov_list.keys()
+
+    def scan_quadrant(self, x, y, radius, quadrant):
+        (ddx, ddy), (cdx, cdy) = quadrant
+        W, H = self.width, self.height
+        blocked_at, fov_list = self.Blocked, self.fov_list
+        reach = radius * radius + radius
+        # rows still to scan: (depth, start slope sn/sd, end slope en/ed)
+        rows = [(1, -1, 1, 1, 1)]
+        while rows:
+            depth, sn, sd, en, ed = rows.pop()
+            if depth > radius:
+                continue
+            # columns whose centres round into [start, end]
+            lo = (2 * depth * sn + sd) // (2 * sd)
+            hi = -((ed - 2 * depth * en) // (2 * ed))
+            prev = None
+            for col in range(lo, hi + 1):
+                X = x + depth * ddx + col * cdx
+                Y = y + depth * ddy + col * cdy
+                inside = 0 <= X < W and 0 <= Y < H
+                wall = not inside or bool(blocked_at(X, Y))
+                if inside and col * col + depth * depth <= reach and (
+                        wall or (col * sd >= depth * sn and col * ed <= depth * en)):
+                    fov_list[(X, Y)] = True
+                if prev is not None:
+                    if prev and not wall:
+                        # past a run of walls: the beam restarts at this cell's left edge
+                        sn, sd = 2 * col - 1, 2 * depth
+                    elif not prev and wall:
+                        # the open run ends here; scan the next row up to this wall
+                        rows.append((depth + 1, sn, sd, 2 * col - 1, 2 * depth))
+                prev = wall
+            if prev is False:
+                rows.append((depth + 1, sn, sd, en, ed))
+
+
+#------------------------------
+# Precise permissive
+#------------------------------
+class _Line:
+    __slots__ = ("xi", "yi", "xf", "yf")
+
+    def __init__(self, xi, yi, xf, yf):
+        self.xi, self.yi, self.xf, self.yf = xi, yi, xf, yf
+
+    def copy(self) -> "_Line":
+        return _Line(self.xi, self.yi, self.xf, self.yf)
+
+    def relative_slope(self, x, y) -> int:
+        ''' > 0 if (x, y) is below the line, < 0 above, 0 on it '''
+        return (self.yf - self.yi) * (self.xf - x) - (self.xf - self.xi) * (self.yf - y)
+
+    def collinear_with(self, other: "_Line") -> bool:
+        return self.relative_slope(other.xi, other.yi) == 0 == self.relative_slope(other.xf, other.yf)
+
+
+class _View:
+    __slots__ = ("shallow", "steep", "shallow_bumps", "steep_bumps")
+
+    def __init__(self, shallow: _Line, steep: _Line, shallow_bumps=None, steep_bumps=None):
+        self.shallow, self.steep = shallow, steep
+        # linked lists of (x, y, parent) corners the lines were bent around
+        self.shallow_bumps, self.steep_bumps = shallow_bumps, steep_bumps
+
+    def copy(self) -> "_View":
+        return _View(self.shallow.copy(), self.steep.copy(), self.shallow_bumps, self.steep_bumps)
+
+
+@register("permissive")
+class PermissiveFOV(FOVAlgorithm):
+    ''' Precise permissive FOV: a cell is in view if any line from anywhere in
+    the origin's square reaches anywhere in the cell's square
+
+    Walls that share an edge are one solid block, and lines only have to
+    stay out of the inside of the blocks, so they may graze a corner or slip
+    between two walls that touch diagonally.
+    Symmetric, and sees everything shadowcast does except the odd cell
+    shadowcast lights past a wall in the same row, which no line reaches.
+    Each quadrant keeps a list of views, wedges between a shallow and a
+    steep line, which walls bend or split; cells are visited in order of
+    x + y.
+    '''
+
+    def FOVList(self, x, y, radius):
+        "Return a list of squares that are in view from (x, y) within the given radius."
+        self.fov_list = {(x, y): True}
+        left, right = min(x, radius), min(self.width - 1 - x, radius)
+        up, down = min(y, radius), min(self.height - 1 - y, radius)
+        for dx, dy, extent_x, extent_y in ((1, 1, right, down), (1, -1, right, up),
+                                           (-1, -1, left, up), (-1, 1, left, down)):
+            self.scan_quadrant(x, y, radius, dx, dy, extent_x, extent_y)
+        return self.fov_list.keys()
+
+    def scan_quadrant(self, x, y, radius, dx, dy, extent_x, extent_y):
+        blocked_at, fov_list = self.Blocked, self.fov_list
+        reach = radius * radius + radius
+        # coordinates are scaled by K so a wall's corners can be moved by
+        # 1 / K; that is too little to change any other decision on the
+        # lattice, but lets lines graze the corners
+        K = 4 * (extent_x + extent_y + 1) ** 2
+        origin = ((0, K), (K, 0))
+        # the far ends lie past the last row and column, so no corner on an
+        # axis sits on the first lines
+        views: List[_View] = [_View(_Line(0, K, (extent_x + 2) * K, 0),
+                                    _Line(K, 0, 0, (extent_y + 2) * K))]
+        for i in range(1, extent_x + extent_y + 1):
+            if not views:
+                break
+            v = 0
+            for j in range(max(0, i - extent_x), min(i, extent_y) + 1):
+                if v >= len(views):
+                    break
+                # cell (i - j, j), by its top-left and bottom-right corners; a
+                # view that only touches a corner still sees the cell
+                cx, cy = i - j, j
+                x1, y1, x2, y2 = cx * K, cy * K, (cx + 1) * K, (cy + 1) * K
+                # relative_slope inlined, this is the hot loop
+                while v < len(views):
+                    line = views[v].steep
+                    if (line.yf - line.yi) * (line.xf - x2) - (line.xf - line.xi) * (line.yf - y1) <= 0:
+                        break
+                    v += 1
+                else:
+                    continue
+                line = views[v].shallow
+                if (line.yf - line.yi) * (line.xf - x1) - (line.xf - line.xi) * (line.yf - y2) < 0:
+                    continue
+                X, Y = x + cx * dx, y + cy * dy
+                if cx * cx + cy * cy <= reach:
+                    fov_list[(X, Y)] = True
+                if not blocked_at(X, Y):
+                    continue
+                # the wall's corners, moved in on sides that face floor and
+                # out on sides that face another wall, so lines may graze
+                # the block but not run along the edge between two walls
+                left = x1 - 1 if blocked_at(X - dx, Y) else x1 + 1
+                top = y2 + 1 if blocked_at(X, Y + dy) else y2 - 1
+                right = x2 + 1 if blocked_at(X + dx, Y) else x2 - 1
+                bottom = y1 - 1 if blocked_at(X, Y - dy) else y1 + 1
+                while v < len(views) and views[v].steep.relative_slope(right, bottom) >= 0:
+                    v += 1
+                if v == len(views) or views[v].shallow.relative_slope(left, top) <= 0:
+                    continue
+                view = views[v]
+                above_shallow = view.shallow.relative_slope(right, bottom) < 0
+                below_steep = view.steep.relative_slope(left, top) > 0
+                if above_shallow and below_steep:
+                    # the wall fills the view
+                    del views[v]
+                elif above_shallow:
+                    self._shallow_bump(view, left, top)
+                    self._check(views, v, origin)
+                elif below_steep:
+                    self._steep_bump(view, right, bottom)
+                    self._check(views, v, origin)
+                else:
+                    # the wall splits the view in two
+                    views.insert(v, view.copy())
+                    self._steep_bump(views[v], right, bottom)
+                    steep = v + 1
+                    if not self._check(views, v, origin):
+                        steep -= 1
+                    else:
+                        v += 1
+                    self._shallow_bump(views[steep], left, top)
+                    self._check(views, steep, origin)
+
+    @staticmethod
+    def _shallow_bump(view: _View, x, y) -> None:
+        view.shallow.xf, view.shallow.yf = x, y
+        view.shallow_bumps = (x, y, view.shallow_bumps)
+        bump = view.steep_bumps
+        while bump is not None:
+            if view.shallow.relative_slope(bump[0], bump[1]) < 0:
+                view.shallow.xi, view.shallow.yi = bump[0], bump[1]
+            bump = bump[2]
+
+    @staticmethod
+    def _steep_bump(view: _View, x, y) -> None:
+        view.steep.xf, view.steep.yf = x, y
+        view.steep_bumps = (x, y, view.steep_bumps)
+        bump = view.shallow_bumps
+        while bump is not None:
+            if view.steep.relative_slope(bump[0], bump[1]) > 0:
+                view.steep.xi, view.steep.yi = bump[0], bump[1]
+            bump = bump[2]
+
+    @staticmethod
+    def _check(views: List[_View], v: int, origin) -> bool:
+        ''' Drop views[v] if it has closed to a line through a corner of the origin '''
+        shallow, steep = views[v].shallow, views[v].steep
+        if shallow.collinear_with(steep) and any(shallow.relative_slope(*corner) == 0
+                                                 for corner in origin):
+            del views[v]
+            return False
+        return True
+
+
+#------------------------------
+# Precomputed rays
+#------------------------------
+_ray_tables: Dict[int, Tuple[list, list, list]] = {}
+
+
+def ray_table(radius: int) -> Tuple[list, list, list]:
+    ''' Rays from (0, 0) covering every cell of the radius disc, merged into one walk
+
+    The rays are Bresenham-style lines to the cells of the disc, farthest
+    first, skipping cells an earlier ray already goes through.  They are
+    merged into a tree on their common prefixes and flattened depth first.
+    Returns (dx, dy, skip) lists: entry n is the offset (dx[n], dy[n]), and
+    if that cell is opaque the walk jumps to skip[n], past every ray that
+    goes through it.
+    '''
+    table = _ray_tables.get(radius)
+    if table is not None:
+        return table
+    ys, xs = fov.disc(radius).nonzero()
+    targets = sorted(zip((xs - radius).tolist(), (ys - radius).tolist()),
+                     key=lambda d: -(d[0] ** 2 + d[1] ** 2))
+    tree: dict = {}
+    # longest rays first; a cell one of them already passes through gets no ray of its own
+    covered = set()
+    for dx, dy in targets:
+        if (dx, dy) in covered:
+            continue
+        steps = max(abs(dx), abs(dy))
+        node = tree
+        for k in range(1, steps + 1):
+            # round half away from the origin, so the line is the same mirrored
+            step = ((2 * abs(dx) * k + steps) // (2 * steps) * (1 if dx >= 0 else -1),
+                    (2 * abs(dy) * k + steps) // (2 * steps) * (1 if dy >= 0 else -1))
+            covered.add(step)
+            node = node.setdefault(step, {})
+    xs, ys, skip = [], [], []
+    # iterative depth-first flatten
+    stack = [(None, tree, False)]
+    while stack:
+        step, children, done = stack.pop()
+        if done:
+            skip[step] = len(xs)
+            continue
+        if step is not None:
+            n = len(xs)
+            xs.append(step[0])
+            ys.append(step[1])
+            skip.append(0)
+            stack.append((n, None, True))
+        for child in sorted(children, reverse=True):
+            stack.append((child, children[child], False))
+    table = _ray_tables[radius] = (xs, ys, skip)
+    return table
+
+
+@register("raytable")
+class RayTableFOV(FOVAlgorithm):
+    ''' Rays cast to every cell of the disc, from a table shared per radius
+
+    One pass over the flattened ray tree: each cell reached is in view, and
+    an opaque cell skips the rays behind it, so a cell seen by several rays
+    is only visited once per branch.  The cheapest per call and the
+    coarsest: the view depends on where the lines happen to round, it is
+    not symmetric, and corners of wide rooms can be missed.
+    '''
+
+    def FOVList(self, x, y, radius):
+        "Return a list of squares that are in view from (x, y) within the given radius."
+        xs, ys, skip = ray_table(radius)
+        W, H = self.width, self.height
+        blocked_at = self.Blocked
+        fov_list = self.fov_list = {(x, y): True}
+        n, end = 0, len(xs)
+        while n < end:
+            X, Y = x + xs[n], y + ys[n]
+            if not (0 <= X < W and 0 <= Y < H):
+                n = skip[n]
+                continue
+            fov_list[(X, Y)] = True
+            n = skip[n] if blocked_at(X, Y) else n + 1
+        return fov_list.keys()
+
+
+if __name__ == "__main__":
+    import random
+    from dungeon_gen import DungeonGenerator
+
+    random.seed(0)
+    D = DungeonGenerator(width=80, height=40, num_rooms=12)
+    blocks = D.grid.layer("blocks_vision")
+    ys, xs = D.grid.layer("passable").nonzero()
+    y, x = int(ys[len(ys) // 2]), int(xs[len(xs) // 2])
+    views = {}
+    for name in ALGORITHMS:
+        engine = make(name, D.grid.width, D.grid.height,
+                      lambda X, Y: not (0 <= X < D.grid.width and 0 <= Y < D.grid.height) or blocks[Y, X])
+        views[name] = set(engine.FOVList(x, y, 8))
+    for name, seen in views.items():
+        print(f"{name:10s}: {len(seen):4d} cells, {len(seen - views['shadowcast']):3d} not in shadowcast,"
+              f" {len(views['shadowcast'] - seen):3d} missing")
@@ -0,0 +1,139 @@
+"fovcache.py - LRU cache of field-of-view results, invalidated by the cells that change."
+
+from collections import OrderedDict
+from typing import Optional
+
+import fov
+import grid
+from grid import GridLocation
+
+
+class FOVCache:
+    ''' FOV results on one grid keyed by (origin, radius), kept across grid writes
+
+    Every lookup first brings the cache up to the grid's version: the
+    journal's dirty rects since the last lookup are checked against each
+    entry, and only entries whose disc (FOVMap's (radius + 0.5)**2 test)
+    reaches into a dirty rect are dropped.  The rest carry over to the new
+    version unchanged, since shadowcasting never reads a cell outside the
+    disc.  If the journal no longer reaches back, everything is dropped.
+
+    The engine is a FOVMap (FOVList, Ball) or an ArrayFOV (mask); results
+    are shared between callers and must not be modified.
+    Ball(..., ignore_walls=True) does not depend on the grid and goes
+    straight to the engine.
+
+    Usage::
+
+        cache = FOVCache(G, fov.ArrayFOV.from_grid(G))
+        visible = cache.mask(PC.loc, 8)
+        print(cache.stats())
+    '''
+
+    def __init__(self, graph: grid.Grid, engine, max_entries: int = 256):
+        self.graph = graph
+        self.engine = engine
+        self.max_entries = max_entries
+        # (kind, (y, x), radius) -> result
+        self.entries: "OrderedDict[tuple, object]" = OrderedDict()
+        self.version = graph.version
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    #------------------------------
+    # Lookups
+    #------------------------------
+    def FOVList(self, x: int, y: int, radius: int):
+        ''' FOVMap.FOVList(x, y, radius): (x, y) keys '''
+        key = ("list", (y, x), radius)
+        found = self._get(key)
+        if found is None:
+            found = self._store(key, self.engine.FOVList(x, y, radius))
+        return found
+
+    def Ball(self, x: int, y: int, radius: int, ignore_walls: bool = False):
+        ''' FOVMap.Ball(x, y, radius, ignore_walls) '''
+        if ignore_walls:
+            return self.engine.Ball(x, y, radius, ignore_walls=True)
+        return self.FOVList(x, y, radius)
+
+    def mask(self, origin: GridLocation, radius: int) -> fov.FOVMask:
+        ''' ArrayFOV.compute(origin, radius) as a FOVMask '''
+        key = ("mask", tuple(origin), radius)
+        found = self._get(key)
+        if found is None:
+            self.engine.compute(origin, radius)
+            found = self._store(key, self.engine.mask())
+        return found
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": len(self.entries),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    #------------------------------
+    # Internals
+    #------------------------------
+    def _get(self, key: tuple) -> Optional[object]:
+        if self.version != self.graph.version:
+            self._sync()
+        found = self.entries.get(key)
+        if found is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return found
+
+    def _store(self, key: tuple, result):
+        self.entries[key] = result
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return result
+
+    def _sync(self) -> None:
+        ''' Drop the entries whose disc reaches a cell written since self.version '''
+        rects = self.graph.changes_since(self.version)
+        self.version = self.graph.version
+        if rects is None:
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+            return
+        stale = []
+        for key in self.entries:
+            _, (y, x), radius = key
+            reach = radius * radius + radius
+            for y1, y2, x1, x2 in rects:
+                # offset from the origin to the nearest cell of the rect
+                dy = max(y1 - y, 0, y - (y2 - 1))
+                dx = max(x1 - x, 0, x - (x2 - 1))
+                if dy * dy + dx * dx <= reach:
+                    stale.append(key)
+                    break
+        for key in stale:
+            del self.entries[key]
+        self.invalidations += len(stale)
+
+
+if __name__ == "__main__":
+    G = grid.ArrayGrid(20, 40, ".")
+    G[10, 5:35] = "#"
+    cache = FOVCache(G, fov.ArrayFOV.from_grid(G))
+
+    walk = [(5, 10), (5, 11), (5, 12), (5, 11), (5, 10), (15, 30), (5, 10)]
+    for loc in walk:
+        print(f"{loc}: {len(cache.mask(loc, 6))} cells")
+    # far from (5, 10) and (5, 11), so only the entries near (15, 30) go
+    G[17, 30] = "#"
+    for loc in walk:
+        cache.mask(loc, 6)
+    print(cache.stats())
@@ -1,16 +1,119 @@
-from typing import Protocol, Iterator, Tuple, TypeVar, Optional, Iterable
+from typing import Protocol, Iterator, Tuple, TypeVar, Optional, Iterable, List
+from collections import OrderedDict, deque
+import weakref
+
+import numpy as np
+
 T = TypeVar('T')
 
 Location = TypeVar('Location')
 GridLocation = Tuple[int, int]
+# (y1, y2, x1, x2), half open
+Rect = Tuple[int, int, int, int]
+
+
+class TileType:
+    ''' Semantic properties of a tile character
+
+    Attributes
+    ----------
+    passable : bool
+        can actors walk onto this tile
+    blocks_vision : bool
+        does this tile stop line of sight
+    cost : float
+        default cost of moving onto this tile
+    '''
+    def __init__(self, passable: bool = True, blocks_vision: bool = False, cost: float = 1.0):
+        self.passable = passable
+        self.blocks_vision = blocks_vision
+        self.cost = cost
+
+    def __repr__(self):
+        return f"TileType(passable={self.passable}, blocks_vision={self.blocks_vision}, cost={self.cost})"
+
+
+# Tiles produced by DungeonGenerator
+DEFAULT_TILE_TYPES = {
+    '#' : TileType(passable=False, blocks_vision=True, cost=99.0),
+    '.' : TileType(),
+    ' ' : TileType(),
+    '+' : TileType(blocks_vision=True),
+}
+
+# Anything missing from the table
+UNKNOWN_TILE_TYPE = TileType(passable=False)
+
+
+class Journal:
+    ''' Monotonic version counter plus a bounded log of dirty rectangles
+
+    Every write to a grid bumps version and records the rectangle it touched.
+    Consumers remember the version they last synced at and ask for the
+    changes since then, usually through a ChangeCursor.
+    '''
+    MAX_ENTRIES = 4096
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.version = 0
+        self.entries = deque(maxlen=max_entries)
+        # newest version that has fallen off the log
+        self.floor = 0
+
+    def record(self, rect: Rect) -> None:
+        if len(self.entries) == self.entries.maxlen:
+            self.floor = self.entries[0][0]
+        self.version += 1
+        self.entries.append((self.version, rect))
+
+    def changes_since(self, version: int) -> Optional[List[Rect]]:
+        ''' Rects written after version, or None if the log no longer reaches back that far '''
+        if version < self.floor:
+            return None
+        if version >= self.version:
+            return []
+        return [rect for v, rect in self.entries if v > version]
+
+
+class ChangeCursor:
+    ''' One consumer's position in a grid's change journal
+
+    Usage::
+
+        cursor = ChangeCursor(G)
+        ...
+        rects = cursor.drain()
+        if rects is None:
+            # too far behind, rebuild everything
+    '''
+    def __init__(self, G: 'Grid'):
+        self.grid = G
+        self.version = G.version
+
+    def drain(self) -> Optional[List[Rect]]:
+        ''' Rects changed since the last drain (None means everything) '''
+        rects = self.grid.changes_since(self.version)
+        self.version = self.grid.version
+        return rects
+
+
+def _adjacency_key(cost_dict: Optional[dict], impassable: Iterable[str], default: float) -> tuple:
+    return (tuple(sorted(cost_dict.items())) if cost_dict is not None else None,
+            frozenset(impassable), default)
+
 
 class Grid:
+    tile_types = DEFAULT_TILE_TYPES
+    # adjacency tables kept per grid, least recently used dropped first
+    ADJACENCY_CACHE = 8
+
     def __init__(self, height: int, width: int, val : str = '#' ):
         self.height : int = height
         self.width : int = width
         self.data = []
         for i in range(height):
             self.data.append([val] * width)
+        self.journal = Journal()
     def __setitem__(self, row_col, val : str):
         row, col = row_col
         if isinstance(row, slice):
@@ -26,6 +129,9 @@ class Grid:
                     self.data[row][c] = val
             else:
                 self.data[row][col] = val
+        rows = (row.start, row.stop) if isinstance(row, slice) else (row, row + 1)
+        cols = (col.start, col.stop) if isinstance(col, slice) else (col, col + 1)
+        self.journal.record(rows + cols)
     def __getitem__(self, row_col):
         ''' NOTE: Base interface to allow slices, etc '''
         row, col = row_col
@@ -73,6 +179,15 @@ class Grid:
                     return True
         return False
 
+    @property
+    def version(self) -> int:
+        ''' Bumped by every write '''
+        return self.journal.version
+
+    def changes_since(self, version: int) -> Optional[List[Rect]]:
+        ''' Dirty rects written after version, None if unknown (see Journal) '''
+        return self.journal.changes_since(version)
+
     def in_bounds(self, loc: GridLocation) -> bool:
         ''' Is this loc in the grid? '''
         (y, x) = loc
@@ -84,6 +199,48 @@ class Grid:
 
     def cost(self, loc: GridLocation) -> [bool, float]:
         return 1.0
+
+    def tile_type(self, tile: str) -> TileType:
+        return self.tile_types.get(tile, UNKNOWN_TILE_TYPE)
+
+    def layer(self, prop: str) -> np.ndarray:
+        ''' (height, width) array of TileType.<prop> for every tile '''
+        return np.array([[getattr(self.tile_type(t), prop) for t in row] for row in self.data])
+
+    def cost_layer(self, cost_dict: Optional[dict] = None, default: float = 1.0) -> np.ndarray:
+        ''' (height, width) float array of move costs
+
+        Costs come from cost_dict (falling back to default) if given, else from
+        the TileType table.
+        '''
+        if cost_dict is None:
+            return self.layer('cost').astype(float)
+        return np.array([[cost_dict.get(t, default) for t in row] for row in self.data], dtype=float)
+
+    def mask(self, vals: Iterable[str]) -> np.ndarray:
+        ''' (height, width) bool array, True where the tile is in vals '''
+        vals = set(vals)
+        return np.array([[t in vals for t in row] for row in self.data], dtype=bool).reshape(self.height, self.width)
+
+    def adjacency(self, cost_dict: Optional[dict] = None, impassable: Iterable[str] = (),
+                  default: float = 1.0) -> 'LazyAdjacency':
+        ''' Flat-index neighbor table for this grid (see LazyAdjacency)
+
+        The last ADJACENCY_CACHE tables asked for are kept.  Each fills in
+        only the cells searches reach and drops the ones around later
+        writes, so a query costs about what walking neighbors() would.
+        '''
+        key = _adjacency_key(cost_dict, impassable, default)
+        cache = self.__dict__.get('_adjacency_tables')
+        if cache is None:
+            cache = self._adjacency_tables = OrderedDict()
+        adj = cache.get(key)
+        if adj is None:
+            adj = cache[key] = LazyAdjacency(self, cost_dict, impassable, default)
+        cache.move_to_end(key)
+        while len(cache) > self.ADJACENCY_CACHE:
+            cache.popitem(last=False)
+        return adj
     
     def neighbors(self, loc: GridLocation) -> Iterator[GridLocation]:
         ''' What are the in-bounds neighbords of this loc? '''
@@ -97,6 +254,647 @@ class Grid:
         return results
 
 
+class Adjacency:
+    ''' Precomputed neighbor table keyed by flat cell index (y * width + x)
+
+    CSR-style layout: the neighbors of cell i are index[start(i) : start(i) + count[i]]
+    and cost[k] is the cost of moving onto index[k].  Every cell owns a fixed
+    block of SLOTS entries (start(i) == i * SLOTS) so refreshing a region never
+    shifts anybody else's entries.  Neighbors are listed in Grid.neighbors order,
+    with out-of-bounds cells and tiles in impassable already pruned.
+
+    The arrays are NumPy; views() hands out memoryviews of them, which index
+    to plain Python numbers and are the fastest way to walk the table from
+    a pure Python inner loop.
+    '''
+    SLOTS = 8
+    # Grid.neighbors order: E, NE, N, NW, W, SW, S, SE
+    DIRS = np.array([(0, 1), (-1, 1), (-1, 0), (-1, -1),
+                     (0, -1), (1, -1), (1, 0), (1, 1)])
+
+    def __init__(self, G: Grid, cost_dict: Optional[dict] = None,
+                 impassable: Iterable[str] = (), default: float = 1.0):
+        self.grid = G
+        self.height, self.width = G.height, G.width
+        self.cost_dict = cost_dict
+        self.impassable = frozenset(impassable)
+        self.default = default
+        n = self.height * self.width
+        self.index = np.full(n * self.SLOTS, -1, dtype=np.int32)
+        self.cost = np.zeros(n * self.SLOTS, dtype=np.float64)
+        self.count = np.zeros(n, dtype=np.uint8)
+        self.refresh(0, self.height, 0, self.width, grow=0)
+
+    def start(self, i: int) -> int:
+        return i * self.SLOTS
+
+    def neighbors(self, i: int) -> list:
+        ''' Flat indices of the neighbors of flat cell i '''
+        s = i * self.SLOTS
+        return self.index[s:s + int(self.count[i])].tolist()
+
+    def views(self):
+        ''' (index, cost, count) as memoryviews for pure Python iteration '''
+        return memoryview(self.index), memoryview(self.cost), memoryview(self.count)
+
+    def refresh(self, y1: int, y2: int, x1: int, x2: int, grow: int = 1) -> None:
+        ''' Rebuild entries for cells in [y1:y2, x1:x2], grown by grow cells
+
+        Changing a tile alters the edges *into* it, which belong to its
+        neighbors, so callers pass the changed rectangle and the default
+        one-cell margin picks those up.
+        '''
+        H, W = self.height, self.width
+        y1, y2 = max(0, y1 - grow), min(H, y2 + grow)
+        x1, x2 = max(0, x1 - grow), min(W, x2 + grow)
+        if y1 >= y2 or x1 >= x2:
+            return
+
+        # source cells, and the 3x3 halo of tiles their neighbors can land on
+        ys, xs = np.mgrid[y1:y2, x1:x2]
+        hy1, hy2 = max(0, y1 - 1), min(H, y2 + 1)
+        hx1, hx2 = max(0, x1 - 1), min(W, x2 + 1)
+        halo = self.grid[hy1:hy2, hx1:hx2]
+        costs = np.asarray(halo.cost_layer(self.cost_dict, self.default))
+        blocked = halo.mask(self.impassable) if self.impassable else None
+
+        ny = ys[..., None] + self.DIRS[:, 0]
+        nx = xs[..., None] + self.DIRS[:, 1]
+        # see "Ugly paths" in Grid.neighbors
+        even = ((ys + xs) % 2 == 0)[..., None]
+        ny = np.where(even, ny[..., ::-1], ny)
+        nx = np.where(even, nx[..., ::-1], nx)
+
+        valid = (0 <= ny) & (ny < H) & (0 <= nx) & (nx < W)
+        ly = np.clip(ny, hy1, hy2 - 1) - hy1
+        lx = np.clip(nx, hx1, hx2 - 1) - hx1
+        if blocked is not None:
+            valid &= ~blocked[ly, lx]
+
+        # pack valid entries to the front of each cell's block, keeping order
+        order = np.argsort(~valid, axis=-1, kind='stable')
+        valid = np.take_along_axis(valid, order, -1)
+        flat = np.take_along_axis(ny * W + nx, order, -1)
+        cost = np.take_along_axis(costs[ly, lx], order, -1)
+        flat[~valid] = -1
+        cost[~valid] = 0.0
+
+        self.index.reshape(H, W, self.SLOTS)[y1:y2, x1:x2] = flat
+        self.cost.reshape(H, W, self.SLOTS)[y1:y2, x1:x2] = cost
+        self.count.reshape(H, W)[y1:y2, x1:x2] = valid.sum(-1)
+
+
+class _Counts(dict):
+    ''' count table of a LazyAdjacency: a missing cell builds its block '''
+    __slots__ = ('build',)
+
+    def __missing__(self, i):
+        return self.build(i)
+
+
+class LazyAdjacency:
+    ''' Adjacency filled in one cell at a time
+
+    Same layout and views() as Adjacency, but index and cost are dicts and a
+    cell's block is built from get_tile the first time its count is read.
+    Every caller reads count[i] before walking i's block, so searches only
+    pay for the cells they reach, and a map nobody searches costs nothing.
+    Used for list-of-lists Grids, ChunkedGrids and large ArrayGrids, where a
+    dense table would be rebuilt per write or would not fit.
+
+    views() first catches up with the grid's journal, dropping the blocks
+    around each dirty rect (or all of them if the journal has lost track).
+    It also drops everything once more than MAX_CELLS blocks are held.
+    '''
+    SLOTS = Adjacency.SLOTS
+    MAX_CELLS = 1 << 17
+
+    def __init__(self, G: Grid, cost_dict: Optional[dict] = None,
+                 impassable: Iterable[str] = (), default: float = 1.0):
+        self.grid = G
+        self.height, self.width = G.height, G.width
+        self.cost_dict = cost_dict
+        self.impassable = frozenset(impassable)
+        self.default = default
+        self.index = {}
+        self.cost = {}
+        self.count = _Counts()
+        self.count.build = self._build
+        self.version = G.version
+        # tile -> cost of moving onto it, None if impassable
+        self._tile_costs = {}
+
+    def _tile_cost(self, tile: str) -> Optional[float]:
+        if tile in self.impassable:
+            cost = None
+        elif self.cost_dict is not None:
+            cost = float(self.cost_dict.get(tile, self.default))
+        else:
+            cost = float(self.grid.tile_type(tile).cost)
+        self._tile_costs[tile] = cost
+        return cost
+
+    def _build(self, i: int) -> int:
+        G, W = self.grid, self.width
+        index, cost, tile_costs = self.index, self.cost, self._tile_costs
+        k = i * self.SLOTS
+        n = 0
+        for loc in G.neighbors(divmod(i, W)):
+            tile = G[loc]
+            c = tile_costs[tile] if tile in tile_costs else self._tile_cost(tile)
+            if c is None:
+                continue
+            index[k + n] = loc[0] * W + loc[1]
+            cost[k + n] = c
+            n += 1
+        self.count[i] = n
+        return n
+
+    def start(self, i: int) -> int:
+        return i * self.SLOTS
+
+    def neighbors(self, i: int) -> list:
+        ''' Flat indices of the neighbors of flat cell i '''
+        s = i * self.SLOTS
+        return [self.index[k] for k in range(s, s + self.count[i])]
+
+    def clear(self) -> None:
+        self.index.clear()
+        self.cost.clear()
+        self.count.clear()
+
+    def refresh(self, y1: int, y2: int, x1: int, x2: int, grow: int = 1) -> None:
+        ''' Drop the blocks of cells in [y1:y2, x1:x2], grown by grow cells '''
+        H, W = self.height, self.width
+        y1, y2 = max(0, y1 - grow), min(H, y2 + grow)
+        x1, x2 = max(0, x1 - grow), min(W, x2 + grow)
+        if y1 >= y2 or x1 >= x2:
+            return
+        count, index, cost = self.count, self.index, self.cost
+        if (y2 - y1) * (x2 - x1) > len(count):
+            cells = [i for i in count if y1 <= i // W < y2 and x1 <= i % W < x2]
+        else:
+            cells = [y * W + x for y in range(y1, y2) for x in range(x1, x2)]
+        for i in cells:
+            n = count.pop(i, 0)
+            for k in range(i * self.SLOTS, i * self.SLOTS + n):
+                del index[k], cost[k]
+
+    def views(self):
+        ''' (index, cost, count), current with the grid '''
+        G = self.grid
+        if self.version != G.version:
+            rects = G.changes_since(self.version)
+            self.version = G.version
+            if rects is None:
+                self.clear()
+            else:
+                for rect in rects:
+                    self.refresh(*rect)
+        if len(self.count) > self.MAX_CELLS:
+            self.clear()
+        return self.index, self.cost, self.count
+
+
+class Palette:
+    ''' Bidirectional mapping between tile characters and integer codes
+
+    A palette is shared by an ArrayGrid and every view sliced from it, so a
+    tile added through one view is immediately decodable through the others.
+    A frozen palette refuses new tiles, for tiles whose codes are stored
+    somewhere the palette can't follow (e.g. a map file mapped with 'r+').
+    '''
+    MAX_TILES = 256
+
+    def __init__(self, tiles: Iterable[str] = (), frozen: bool = False):
+        self.tiles: list = []
+        self.codes: dict = {}
+        self.frozen = False
+        for tile in tiles:
+            self.encode(tile)
+        self.frozen = frozen
+
+    def encode(self, tile: str) -> int:
+        ''' Code for tile, adding it to the palette if it is new '''
+        code = self.codes.get(tile)
+        if code is None:
+            if self.frozen:
+                raise ValueError(f"Palette is frozen, can't add {tile!r}")
+            if len(self.tiles) >= self.MAX_TILES:
+                raise ValueError(f"Palette is full, can't add {tile!r}")
+            code = len(self.tiles)
+            self.tiles.append(tile)
+            self.codes[tile] = code
+        return code
+
+    def decode(self, code: int) -> str:
+        return self.tiles[code]
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def __iter__(self):
+        return iter(self.tiles)
+
+    def __repr__(self):
+        return f"Palette({self.tiles!r})"
+
+
+class ArrayGrid(Grid):
+    ''' Grid storing tiles as uint8 codes into a Palette
+
+    Same interface as Grid, but the tiles live in one contiguous NumPy array
+    (one byte per cell).  Slicing returns an ArrayGrid that is a view onto
+    the same storage rather than a copy, and slice assignment is vectorized.
+
+    Derived layers (layer, cost_layer) are cached on the root grid and patched
+    in place by every write, including writes made through a view, so
+    callers may hold on to the returned arrays.  Views also share the root's
+    Journal, and record dirty rects in root coordinates.
+
+    Attributes
+    ----------
+    tiles : np.ndarray
+        (height, width) array of palette codes
+    palette : Palette
+        tile <-> code mapping, shared with any views
+    '''
+    # above this many cells adjacency() builds tables lazily (see LazyAdjacency)
+    DENSE_ADJACENCY = 1 << 20
+
+    def __init__(self, height: int, width: int, val: str = '#',
+                 palette: Optional[Palette] = None):
+        self.height : int = height
+        self.width : int = width
+        self.palette = palette if palette is not None else Palette()
+        self.tiles = np.full((height, width), self.palette.encode(val), dtype=np.uint8)
+        self._root = self
+        self._chain = ()
+        self._layers = {}
+        self._adjacency = weakref.WeakValueDictionary()
+        self._adjacency_recent = OrderedDict()
+        self.journal = Journal()
+
+    @classmethod
+    def from_array(cls, tiles: np.ndarray, palette: Palette) -> 'ArrayGrid':
+        ''' Wrap an existing code array without copying it '''
+        G = cls.__new__(cls)
+        G.height, G.width = tiles.shape
+        G.palette = palette
+        G.tiles = tiles
+        G._root = G
+        G._chain = ()
+        G._layers = {}
+        G._adjacency = weakref.WeakValueDictionary()
+        G._adjacency_recent = OrderedDict()
+        G.journal = Journal()
+        return G
+
+    @staticmethod
+    def _slice(arr: np.ndarray, row, col) -> np.ndarray:
+        view = arr[row, col]
+        # keep the Grid convention of 1-D slices coming back as a single row
+        if view.ndim == 1:
+            view = view[np.newaxis, :]
+        return view
+
+    def _apply(self, arr: np.ndarray) -> np.ndarray:
+        ''' Take the same view of a root-shaped array that self.tiles is of the root '''
+        for row, col in self._chain:
+            arr = self._slice(arr, row, col)
+        return arr
+
+    def _root_rect(self, row, col):
+        ''' Bounding (y1, y2, x1, x2) in root coordinates of self[row, col] '''
+        root = self._root
+        if not self._chain and not isinstance(row, slice) and not isinstance(col, slice):
+            row, col = row % root.height, col % root.width
+            return row, row + 1, col, col + 1
+        shape = (root.height, root.width)
+        ys = self._apply(np.broadcast_to(np.arange(root.height)[:, None], shape))[row, col]
+        xs = self._apply(np.broadcast_to(np.arange(root.width)[None, :], shape))[row, col]
+        if np.size(ys) == 0:
+            return 0, 0, 0, 0
+        return int(np.min(ys)), int(np.max(ys)) + 1, int(np.min(xs)), int(np.max(xs)) + 1
+
+    @classmethod
+    def from_grid(cls, other: Grid) -> 'ArrayGrid':
+        ''' Convert a list-of-lists Grid '''
+        palette = Palette()
+        tiles = np.array([[palette.encode(t) for t in row] for row in other.data],
+                         dtype=np.uint8).reshape(other.height, other.width)
+        return cls.from_array(tiles, palette)
+
+    def __setitem__(self, row_col, val : str):
+        row, col = row_col
+        code = self.palette.encode(val)
+        self.tiles[row, col] = code
+        root = self._root
+        for key, (lut, layer) in root._layers.items():
+            if code >= len(lut):
+                lut = root._build_lut(key)
+            self._apply(layer)[row, col] = lut[code]
+        rect = self._root_rect(row, col)
+        for adj in list(root._adjacency.values()):
+            adj.refresh(*rect)
+        self.journal.record(rect)
+
+    def __getitem__(self, row_col):
+        ''' Slices return views sharing storage; a single index returns the tile '''
+        row, col = row_col
+        if isinstance(row, slice) or isinstance(col, slice):
+            G = ArrayGrid.from_array(self._slice(self.tiles, row, col), self.palette)
+            G._root = self._root
+            G._chain = self._chain + ((row, col),)
+            G.journal = self.journal
+            return G
+        return self.palette.tiles[self.tiles[row, col]]
+
+    def __str__(self):
+        lut = np.array(self.palette.tiles)
+        return "\n".join(["".join(row) for row in lut[self.tiles]])
+
+    def get_tile(self, loc: GridLocation):
+        ''' Primary means of fetching a tile '''
+        row, col = loc
+        if not self.in_bounds(loc):
+            raise ValueError("Loc out of bounds")
+        return self.palette.tiles[self.tiles[row, col]]
+
+    def contains(self, vals: Iterable[str]) -> bool:
+        ''' Does this grid contain anything in vals?  '''
+        codes = [self.palette.codes[v] for v in vals if v in self.palette.codes]
+        if not codes:
+            return False
+        return bool(np.isin(self.tiles, codes).any())
+
+    def passable(self, loc: GridLocation, passable_list=None) -> bool:
+        ''' Is this loc passable?  Uses the TileType table unless passable_list is given '''
+        if passable_list is not None:
+            return self.get_tile(loc) in passable_list
+        return bool(self.layer('passable')[loc])
+
+    #------------------------------
+    # Cached layers
+    #------------------------------
+    def _build_lut(self, key) -> np.ndarray:
+        ''' (Re)compute the code -> value table for a layer key '''
+        if key[0] == 'cost':
+            _, items, default = key
+            cost_dict = dict(items)
+            lut = np.array([cost_dict.get(t, default) for t in self.palette], dtype=float)
+        else:
+            lut = np.array([getattr(self.tile_type(t), key[1]) for t in self.palette])
+        if key in self._layers:
+            self._layers[key][0] = lut
+        return lut
+
+    def _cached_layer(self, key) -> np.ndarray:
+        root = self._root
+        entry = root._layers.get(key)
+        if entry is None:
+            lut = root._build_lut(key)
+            entry = root._layers[key] = [lut, lut[root.tiles]]
+        return self._apply(entry[1])
+
+    def layer(self, prop: str) -> np.ndarray:
+        ''' (height, width) array of TileType.<prop>, kept current across writes '''
+        return self._cached_layer(('prop', prop))
+
+    def cost_layer(self, cost_dict: Optional[dict] = None, default: float = 1.0) -> np.ndarray:
+        ''' (height, width) float array of move costs, kept current across writes '''
+        if cost_dict is None:
+            return self._cached_layer(('cost', tuple((t, tt.cost) for t, tt in self.tile_types.items()),
+                                       UNKNOWN_TILE_TYPE.cost))
+        return self._cached_layer(('cost', tuple(sorted(cost_dict.items())), default))
+
+    def invalidate_layers(self) -> None:
+        ''' Drop cached layers, e.g. after editing tile_types '''
+        self._root._layers.clear()
+        self._root._adjacency.clear()
+        self._root._adjacency_recent.clear()
+        self._root.__dict__.pop('_adjacency_tables', None)
+
+    def mask(self, vals: Iterable[str]) -> np.ndarray:
+        ''' (height, width) bool array, True where the tile is in vals '''
+        codes = [self.palette.codes[v] for v in vals if v in self.palette.codes]
+        return np.isin(self.tiles, codes)
+
+    def adjacency(self, cost_dict: Optional[dict] = None, impassable: Iterable[str] = (),
+                  default: float = 1.0) -> Adjacency:
+        ''' Cached neighbor table for the root grid, refreshed locally on writes
+
+        The last ADJACENCY_CACHE tables asked for are held; older ones live
+        on (and keep being refreshed) only while a caller still holds them.
+        Grids over DENSE_ADJACENCY cells get a LazyAdjacency instead.
+        '''
+        root = self._root
+        if root.height * root.width > self.DENSE_ADJACENCY:
+            return Grid.adjacency(root, cost_dict, impassable, default)
+        key = _adjacency_key(cost_dict, impassable, default)
+        adj = root._adjacency.get(key)
+        if adj is None:
+            adj = root._adjacency[key] = Adjacency(root, cost_dict, impassable, default)
+        recent = root._adjacency_recent
+        recent[key] = adj
+        recent.move_to_end(key)
+        while len(recent) > self.ADJACENCY_CACHE:
+            recent.popitem(last=False)
+        return adj
+
+
+
+class ChunkedGrid(Grid):
+    ''' Grid split into fixed-size chunks that are allocated on first write
+
+    Untouched chunks cost nothing: reads from them return the fill tile.  With
+    swap_path and max_resident set, the least recently used chunks beyond
+    max_resident are paged out to a memory-mapped file and read straight from
+    it until they are written again.
+
+    Slices return ArrayGrid copies, since a rectangle may span several chunks.
+    Whole-map layers (layer, cost_layer, mask) are refused above MAX_DENSE
+    cells; take them from a slice instead.
+
+    Attributes
+    ----------
+    chunks : OrderedDict
+        (chunk_y, chunk_x) -> resident uint8 array, least recently used first
+    paged : set
+        chunks currently living in the swap file
+    '''
+    # cells above which whole-map layers raise instead of filling every chunk in
+    MAX_DENSE = 1 << 22
+
+    def __init__(self, height: int, width: int, val: str = '#', chunk_size: int = 64,
+                 palette: Optional[Palette] = None, swap_path: Optional[str] = None,
+                 max_resident: Optional[int] = None):
+        self.height : int = height
+        self.width : int = width
+        self.chunk_size = chunk_size
+        self.palette = palette if palette is not None else Palette()
+        self.fill = self.palette.encode(val)
+        self.chunks_y = -(-height // chunk_size)
+        self.chunks_x = -(-width // chunk_size)
+        self.chunks = OrderedDict()
+        self.paged = set()
+        self.swap_path = swap_path
+        self.max_resident = max_resident
+        self._swap = None
+        self.journal = Journal()
+
+    #------------------------------
+    # Chunk management
+    #------------------------------
+    def _chunk(self, key, write: bool = False) -> Optional[np.ndarray]:
+        ''' Storage for chunk key, or None if untouched and not writing '''
+        chunk = self.chunks.get(key)
+        if chunk is not None:
+            self.chunks.move_to_end(key)
+            return chunk
+        if key in self.paged:
+            slot = self._swap[key[0] * self.chunks_x + key[1]]
+            if not write:
+                return slot
+            chunk = np.array(slot)
+            self.paged.discard(key)
+        elif not write:
+            return None
+        else:
+            chunk = np.full((self.chunk_size, self.chunk_size), self.fill, dtype=np.uint8)
+        self.chunks[key] = chunk
+        self._evict()
+        return chunk
+
+    def _evict(self) -> None:
+        if self.swap_path is None or self.max_resident is None:
+            return
+        while len(self.chunks) > self.max_resident:
+            if self._swap is None:
+                cs = self.chunk_size
+                # sparse on disk: only slots that get written take up space
+                self._swap = np.memmap(self.swap_path, dtype=np.uint8, mode='w+',
+                                       shape=(self.chunks_y * self.chunks_x, cs, cs))
+            key, chunk = self.chunks.popitem(last=False)
+            self._swap[key[0] * self.chunks_x + key[1]] = chunk
+            self.paged.add(key)
+
+    def _rect(self, row, col):
+        ''' Normalize an index pair to (y1, y2, x1, x2, sliced) '''
+        sliced = isinstance(row, slice) or isinstance(col, slice)
+        bounds = []
+        for idx, n in ((row, self.height), (col, self.width)):
+            if isinstance(idx, slice):
+                start, stop, step = idx.indices(n)
+                if step != 1:
+                    raise ValueError("ChunkedGrid slices must have step 1")
+                bounds += [start, max(start, stop)]
+            else:
+                if not -n <= idx < n:
+                    raise IndexError("Loc out of bounds")
+                idx %= n
+                bounds += [idx, idx + 1]
+        return (*bounds, sliced)
+
+    def _spans(self, y1: int, y2: int, x1: int, x2: int):
+        ''' Yield (key, chunk slices, output slices) for chunks overlapping a rect '''
+        cs = self.chunk_size
+        for cy in range(y1 // cs, (y2 - 1) // cs + 1):
+            oy1, oy2 = max(y1, cy * cs), min(y2, (cy + 1) * cs)
+            for cx in range(x1 // cs, (x2 - 1) // cs + 1):
+                ox1, ox2 = max(x1, cx * cs), min(x2, (cx + 1) * cs)
+                yield ((cy, cx),
+                       (slice(oy1 - cy * cs, oy2 - cy * cs), slice(ox1 - cx * cs, ox2 - cx * cs)),
+                       (slice(oy1 - y1, oy2 - y1), slice(ox1 - x1, ox2 - x1)))
+
+    def read(self, y1: int, y2: int, x1: int, x2: int) -> np.ndarray:
+        ''' Copy of the codes in [y1:y2, x1:x2] '''
+        out = np.full((y2 - y1, x2 - x1), self.fill, dtype=np.uint8)
+        if y2 > y1 and x2 > x1:
+            for key, src, dst in self._spans(y1, y2, x1, x2):
+                chunk = self._chunk(key)
+                if chunk is not None:
+                    out[dst] = chunk[src]
+        return out
+
+    @property
+    def nbytes(self) -> int:
+        ''' Bytes of resident chunk storage '''
+        return sum(chunk.nbytes for chunk in self.chunks.values())
+
+    #------------------------------
+    # Grid interface
+    #------------------------------
+    def __setitem__(self, row_col, val : str):
+        y1, y2, x1, x2, _ = self._rect(*row_col)
+        code = self.palette.encode(val)
+        if y2 <= y1 or x2 <= x1:
+            return
+        for key, src, _ in self._spans(y1, y2, x1, x2):
+            # painting the fill tile over an untouched chunk is a no-op
+            if code == self.fill and key not in self.chunks and key not in self.paged:
+                continue
+            self._chunk(key, write=True)[src] = code
+        self.journal.record((y1, y2, x1, x2))
+
+    def __getitem__(self, row_col):
+        ''' Slices return ArrayGrid copies; a single index returns the tile '''
+        y1, y2, x1, x2, sliced = self._rect(*row_col)
+        if sliced:
+            arr = self.read(y1, y2, x1, x2)
+            # keep the Grid convention of 1-D slices coming back as a single row
+            if not isinstance(row_col[1], slice):
+                arr = arr.reshape(1, -1)
+            return ArrayGrid.from_array(arr, self.palette)
+        cs = self.chunk_size
+        chunk = self._chunk((y1 // cs, x1 // cs))
+        if chunk is None:
+            return self.palette.tiles[self.fill]
+        return self.palette.tiles[chunk[y1 % cs, x1 % cs]]
+
+    def __str__(self):
+        return str(ArrayGrid.from_array(self.read(0, self.height, 0, self.width), self.palette))
+
+    def get_tile(self, loc: GridLocation):
+        ''' Primary means of fetching a tile '''
+        if not self.in_bounds(loc):
+            raise ValueError("Loc out of bounds")
+        return self[loc]
+
+    def contains(self, vals: Iterable[str]) -> bool:
+        ''' Does this grid contain anything in vals?  '''
+        codes = [self.palette.codes[v] for v in vals if v in self.palette.codes]
+        if not codes:
+            return False
+        if self.fill in codes and len(self.chunks) + len(self.paged) < self.chunks_y * self.chunks_x:
+            return True
+        return any(np.isin(self._chunk(key), codes).any()
+                   for key in list(self.chunks) + list(self.paged))
+
+    def _dense(self) -> np.ndarray:
+        ''' All codes as one array, for the whole-map layers '''
+        if self.height * self.width > self.MAX_DENSE:
+            raise ValueError(f"{self.height}x{self.width} ChunkedGrid is too large for a whole-map "
+                             f"layer; slice a window first, e.g. G[y1:y2, x1:x2].layer(...)")
+        return self.read(0, self.height, 0, self.width)
+
+    def layer(self, prop: str) -> np.ndarray:
+        ''' (height, width) array of TileType.<prop> for every tile (see MAX_DENSE) '''
+        lut = np.array([getattr(self.tile_type(t), prop) for t in self.palette])
+        return lut[self._dense()]
+
+    def cost_layer(self, cost_dict: Optional[dict] = None, default: float = 1.0) -> np.ndarray:
+        ''' (height, width) float array of move costs (see MAX_DENSE) '''
+        if cost_dict is None:
+            return self.layer('cost').astype(float)
+        lut = np.array([cost_dict.get(t, default) for t in self.palette], dtype=float)
+        return lut[self._dense()]
+
+    def mask(self, vals: Iterable[str]) -> np.ndarray:
+        ''' (height, width) bool array, True where the tile is in vals (see MAX_DENSE) '''
+        codes = [self.palette.codes[v] for v in vals if v in self.palette.codes]
+        return np.isin(self._dense(), codes)
+
 if __name__ == "__main__":
     G = Grid(5,6, '#')
     print ('Orig:')
@@ -131,3 +929,25 @@ if __name__ == "__main__":
     print (f'G.neighbors((2,2)) = {list(G.neighbors((2,2)))}')
     
     print (f'G.get_tile((3,3)) = {G.get_tile((3,3))}')
+
+    print ('\nArrayGrid')
+    A = ArrayGrid.from_grid(G)
+    V = A[2:4,2:4]
+    V[0:2,0:2] = 'z'
+    print (A)
+    print (f'A.tiles.nbytes = {A.tiles.nbytes}, palette = {A.palette}')
+    blocks = A.layer('blocks_vision')
+    A[0,1:3] = '.'
+    print (f"A.layer('blocks_vision')[0] after write = {blocks[0]}")
+
+    print ('\nChunkedGrid')
+    C = ChunkedGrid(20000, 20000, '#', chunk_size=64)
+    C[100:104, 100:110] = '.'
+    print (C[99:105, 98:112])
+    print (f'C: {len(C.chunks)} chunks resident, {C.nbytes} bytes')
+
+    print ('\nJournal')
+    cursor = ChangeCursor(A)
+    A[1:3, 1:3][0, 0:2] = '.'
+    A[4, 5] = '+'
+    print (f'A.version = {A.version}, dirty = {cursor.drain()}, then {cursor.drain()}')
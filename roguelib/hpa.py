@@ -0,0 +1,250 @@
+"hpa.py - Hierarchical pathfinding over the rooms and doors of a dungeon."
+
+import heapq
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import grid
+from grid import GridLocation
+
+INF = float("inf")
+
+
+class RoomGraph:
+    ''' HPA*-style abstract graph: doors are nodes, rooms and corridors are clusters
+
+    Doors split the passable cells into regions (rooms, corridors).  At build
+    time every door gets edges to the doors reachable without passing through
+    another door, weighted by the cheapest walk inside the shared region.  A
+    query then only searches the regions around start and goal, runs Dijkstra
+    over the door graph, and refines each hop with a search that is again
+    confined to one region, so its cost scales with room size rather than map
+    size.  Since regions only meet at doors the door graph keeps exact
+    distances, and paths are optimal.
+
+    Grid writes are read from the grid's change journal: only doors whose
+    region search reached a dirty cell (or that sit in one) are searched
+    again.  If the journal no longer covers the last build, everything is.
+
+    Usage::
+
+        rooms = RoomGraph.from_dungeon(D)
+        path = rooms.path(monster.loc, player.loc)
+
+    Attributes
+    ----------
+    doors : List[int]
+        flat index of every door
+    edges : Dict[int, List[Tuple[int, float]]]
+        door -> [(door, cost)] for doors reachable through one region
+    boxes : Dict[int, Tuple[int, int, int, int]]
+        door -> (y1, y2, x1, x2) box, half-open, around the cells its search reached
+    '''
+
+    def __init__(self, graph: grid.Grid, cost_dict: Optional[dict] = None,
+                 impassable: Iterable[str] = ("#",), door: str = "+"):
+        self.graph = graph
+        self.cost_dict = cost_dict
+        self.impassable = tuple(impassable)
+        self.door = door
+        self.rebuilt = 0
+        self.build()
+
+    @classmethod
+    def from_dungeon(cls, dungeon, **kwargs) -> "RoomGraph":
+        ''' Build for a finished DungeonGenerator '''
+        return cls(dungeon.grid, **kwargs)
+
+    def build(self) -> None:
+        ''' (Re)compute doors and door-to-door distances '''
+        G = self.graph
+        self.version = G.version
+        self.adjacency = G.adjacency(self.cost_dict, self.impassable)
+        self.is_door = bytearray(G.mask([self.door]).reshape(-1).astype("u1").tobytes())
+        self.edges: Dict[int, List[Tuple[int, float]]] = {}
+        self.boxes: Dict[int, Tuple[int, int, int, int]] = {}
+        self.doors = [i for i, door in enumerate(self.is_door) if door]
+        for d in self.doors:
+            self._link(d)
+        self.num_edges = sum(len(e) for e in self.edges.values())
+        # refined door -> door hops, filled in as queries need them
+        self.hops: Dict[Tuple[int, int], List[int]] = {}
+
+    def update(self) -> int:
+        ''' Catch up with grid writes; returns how many doors were searched again '''
+        G = self.graph
+        if self.version == G.version:
+            return 0
+        rects = G.changes_since(self.version)
+        if rects is None:
+            self.build()
+            return len(self.doors)
+        self.version = G.version
+        self.adjacency = G.adjacency(self.cost_dict, self.impassable)
+        H, W = G.height, G.width
+        # a write changes the edges into the cell too, which belong to its neighbors
+        rects = [(max(y1 - 1, 0), min(y2 + 1, H), max(x1 - 1, 0), min(x2 + 1, W))
+                 for y1, y2, x1, x2 in rects]
+        stale = {d for d, (y1, y2, x1, x2) in self.boxes.items()
+                 if any(y1 < b2 and b1 < y2 and x1 < c2 and c1 < x2 for b1, b2, c1, c2 in rects)}
+        for y1, y2, x1, x2 in rects:
+            for y in range(y1, y2):
+                for x in range(x1, x2):
+                    i = y * W + x
+                    self.is_door[i] = G[y, x] == self.door
+                    if self.is_door[i]:
+                        stale.add(i)
+        for d in stale:
+            self.edges.pop(d, None)
+            self.boxes.pop(d, None)
+        for d in stale:
+            if self.is_door[d]:
+                self._link(d)
+        self.doors = sorted(self.edges)
+        self.num_edges = sum(len(e) for e in self.edges.values())
+        # a hop is searched from its first door, inside that door's regions
+        self.hops = {hop: cells for hop, cells in self.hops.items() if hop[0] not in stale}
+        self.rebuilt += len(stale)
+        return len(stale)
+
+    def _link(self, d: int) -> None:
+        ''' Edges of door d, and the box its search covered '''
+        width = self.graph.width
+        dist, _ = self._local(d)
+        self.edges[d] = [(e, dist[e]) for e in dist if e != d and self.is_door[e]]
+        ys = [i // width for i in dist]
+        xs = [i % width for i in dist]
+        self.boxes[d] = (min(ys), max(ys) + 1, min(xs), max(xs) + 1)
+
+    #------------------------------
+    # Region-local search
+    #------------------------------
+    def _local(self, seed: int, reverse: bool = False, target: Optional[int] = None):
+        ''' Dijkstra from seed that treats every door but the seed as a dead end
+
+        Forward distances are the cost of walking seed -> cell, reverse ones
+        cell -> seed.  Returns (dist, parent); in a reverse search parent
+        points one step closer to the seed.
+        '''
+        index, costs, count = self.adjacency.views()
+        slots = grid.Adjacency.SLOTS
+        is_door = self.is_door
+        cell_cost = memoryview(self.adjacency.grid.cost_layer(self.cost_dict).reshape(-1))
+        dist = {seed: 0.0}
+        parent = {seed: None}
+        frontier = [(0.0, seed)]
+        pop, push = heapq.heappop, heapq.heappush
+        while frontier:
+            d, current = pop(frontier)
+            if d > dist[current]:
+                continue
+            if current == target:
+                break
+            if is_door[current] and current != seed:
+                continue
+            k = current * slots
+            for k in range(k, k + count[current]):
+                nxt = index[k]
+                new_cost = d + (cell_cost[current] if reverse else costs[k])
+                if new_cost < dist.get(nxt, INF):
+                    dist[nxt] = new_cost
+                    parent[nxt] = current
+                    push(frontier, (new_cost, nxt))
+        return dist, parent
+
+    @staticmethod
+    def _walk(parent, cell: int) -> List[int]:
+        ''' cell, parent[cell], ... up to the root of the search '''
+        cells = []
+        while cell is not None:
+            cells.append(cell)
+            cell = parent[cell]
+        return cells
+
+    #------------------------------
+    # Queries
+    #------------------------------
+    def path(self, start: GridLocation, goal: GridLocation) -> List[GridLocation]:
+        ''' Path from start (exclusive) to goal (inclusive), [] if there is none '''
+        self.update()
+        width = self.graph.width
+        s = start[0] * width + start[1]
+        g = goal[0] * width + goal[1]
+        if s == g:
+            return []
+
+        from_start, start_parent = self._local(s)
+        to_goal, goal_parent = self._local(g, reverse=True)
+
+        # Dijkstra over doors; start and goal join through their own regions
+        best = {s: 0.0}
+        came_from = {s: None}
+        frontier = [(0.0, s)]
+        while frontier:
+            d, node = heapq.heappop(frontier)
+            if d > best[node]:
+                continue
+            if node == g:
+                break
+            if node == s:
+                hops = [(e, c) for e, c in from_start.items() if self.is_door[e] or e == g]
+            else:
+                hops = list(self.edges.get(node, ()))
+                if node in to_goal:
+                    hops.append((g, to_goal[node]))
+            for nxt, cost in hops:
+                if nxt == node:
+                    continue
+                new_cost = d + cost
+                if new_cost < best.get(nxt, INF):
+                    best[nxt] = new_cost
+                    came_from[nxt] = node
+                    heapq.heappush(frontier, (new_cost, nxt))
+        if g not in came_from:
+            return []
+
+        # refine door to door hops into cells
+        nodes = self._walk(came_from, g)[::-1]
+        cells = self._walk(start_parent, nodes[1])[::-1] if nodes[1] in start_parent else [s]
+        for a, b in zip(nodes[1:], nodes[2:]):
+            if b == g and a in goal_parent:
+                hop = self._walk(goal_parent, a)
+            else:
+                hop = self.hops.get((a, b))
+                if hop is None:
+                    _, parent = self._local(a, target=b)
+                    hop = self.hops[(a, b)] = self._walk(parent, b)[::-1]
+            cells.extend(hop[1:])
+        return [divmod(c, width) for c in cells[1:]]
+
+    def stats(self) -> dict:
+        rebuilt, self.rebuilt = self.rebuilt, 0
+        return {"doors": len(self.doors), "edges": self.num_edges, "rebuilt": rebuilt}
+
+
+if __name__ == "__main__":
+    import random
+    import time
+    import dijkstra
+    from dungeon_gen import DungeonGenerator
+
+    random.seed(1)
+    D = DungeonGenerator(width=240, height=120, num_rooms=64)
+    t0 = time.perf_counter()
+    R = RoomGraph.from_dungeon(D)
+    print(f"built {R.stats()} in {time.perf_counter() - t0:.3f}s")
+
+    cells = list(zip(*(c.tolist() for c in D.grid.mask(["."]).nonzero())))
+    for _ in range(5):
+        start, goal = random.choice(cells), random.choice(cells)
+        t0 = time.perf_counter()
+        path = R.path(start, goal)
+        t1 = time.perf_counter()
+        exact = dijkstra.DistanceMap(D.grid, impassable=["#"]).compute([goal])[start]
+        cost = sum(D.grid.cost_layer()[p] for p in path)
+        print(f"{start} -> {goal}: {len(path)} steps, cost {cost} (exact {exact}) in {1000 * (t1 - t0):.1f} ms")
+
+    door = R.doors[0]
+    D.grid[divmod(door, D.grid.width)] = "#"
+    t0 = time.perf_counter()
+    R.update()
+    print(f"walled up a door: {R.stats()} in {1000 * (time.perf_counter() - t0):.1f} ms")
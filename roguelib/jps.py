@@ -0,0 +1,288 @@
+"jps.py - Jump Point Search (and JPS+) for uniform-cost grids."
+
+# References
+# ----------
+# Harabor & Grastien, "Online Graph Pruning for Pathfinding on Grid Maps", 2011
+# Rabin & Silva, "JPS+: An Extreme A* Speed Optimization for Static Uniform
+#   Cost Grids", Game AI Pro 2, 2015
+
+from __future__ import annotations
+
+import heapq
+import weakref
+from array import array
+from typing import Iterable, Optional
+
+import astar
+import grid
+from grid import GridLocation
+
+# (dy, dx) in the same order as Adjacency.DIRS
+DIRS = [(0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1), (1, 0), (1, 1)]
+DIR_INDEX = {d: i for i, d in enumerate(DIRS)}
+
+
+def uniform_cost(graph: grid.Grid, cost_dict, impassable_list) -> Optional[float]:
+    ''' The single cost shared by every enterable tile, or None if costs differ
+
+    ArrayGrid is checked against its palette (every tile ever written), so a
+    tile that has since been painted over can still force the fallback.
+    '''
+    if isinstance(graph, grid.ArrayGrid):
+        tiles = set(graph.palette)
+    else:
+        tiles = {t for row in graph.data for t in row}
+    blocked = set(impassable_list)
+    costs = {cost_dict.get(t, 1.0) for t in tiles if t not in blocked}
+    if len(costs) != 1:
+        return None
+    cost = costs.pop()
+    return cost if cost > 0 else None
+
+
+class _Passability:
+    ''' Free-cell lookup padded with a blocked border, so no bounds checks '''
+
+    def __init__(self, graph: grid.Grid, impassable_list):
+        self.height, self.width = graph.height, graph.width
+        self.stride = self.width + 2
+        blocked = graph.mask(impassable_list) if impassable_list else None
+        free = bytearray(self.stride * (self.height + 2))
+        for y in range(self.height):
+            row = (
+                bytes(self.width * [1])
+                if blocked is None
+                else (~blocked[y]).astype("u1").tobytes()
+            )
+            start = (y + 1) * self.stride + 1
+            free[start : start + self.width] = row
+        self.free = free
+
+    def __call__(self, y: int, x: int) -> bool:
+        return self.free[(y + 1) * self.stride + x + 1] == 1
+
+
+def _successor_dirs(free, y, x, parent_dir):
+    ''' Natural plus forced directions out of (y, x) when arriving along parent_dir '''
+    if parent_dir is None:
+        return DIRS
+    dy, dx = parent_dir
+    if dy and dx:
+        dirs = [(dy, dx), (0, dx), (dy, 0)]
+        if not free(y, x - dx):
+            dirs.append((dy, -dx))
+        if not free(y - dy, x):
+            dirs.append((-dy, dx))
+    elif dx:
+        dirs = [(0, dx)]
+        if not free(y + 1, x):
+            dirs.append((1, dx))
+        if not free(y - 1, x):
+            dirs.append((-1, dx))
+    else:
+        dirs = [(dy, 0)]
+        if not free(y, x + 1):
+            dirs.append((dy, 1))
+        if not free(y, x - 1):
+            dirs.append((dy, -1))
+    return dirs
+
+
+def _forced(free, y, x, dy, dx) -> bool:
+    ''' Does (y, x), reached moving (dy, dx), have a forced neighbor? '''
+    if dy and dx:
+        return (free(y + dy, x - dx) and not free(y, x - dx)) or (
+            free(y - dy, x + dx) and not free(y - dy, x)
+        )
+    if dx:
+        return (free(y + 1, x + dx) and not free(y + 1, x)) or (
+            free(y - 1, x + dx) and not free(y - 1, x)
+        )
+    return (free(y + dy, x + 1) and not free(y, x + 1)) or (
+        free(y + dy, x - 1) and not free(y, x - 1)
+    )
+
+
+def _jump(free, y, x, dy, dx, goal) -> Optional[GridLocation]:
+    ''' Next jump point from (y, x) heading (dy, dx), or None '''
+    while True:
+        y += dy
+        x += dx
+        if not free(y, x):
+            return None
+        if (y, x) == goal or _forced(free, y, x, dy, dx):
+            return (y, x)
+        if dy and dx:
+            if _jump(free, y, x, 0, dx, goal) or _jump(free, y, x, dy, 0, goal):
+                return (y, x)
+
+
+def _fill_path(came_from, cost_so_far, start, goal, step_cost):
+    ''' Rewrite the jump chain start..goal as single steps, for reconstruct_path '''
+    chain = [goal]
+    while chain[-1] != start:
+        chain.append(came_from[chain[-1]])
+    chain.reverse()
+    for a, b in zip(chain, chain[1:]):
+        steps = max(abs(b[0] - a[0]), abs(b[1] - a[1]))
+        dy = (b[0] > a[0]) - (b[0] < a[0])
+        dx = (b[1] > a[1]) - (b[1] < a[1])
+        prev = a
+        for n in range(1, steps + 1):
+            cur = (a[0] + dy * n, a[1] + dx * n)
+            came_from[cur] = prev
+            cost_so_far[cur] = cost_so_far[a] + n * step_cost
+            prev = cur
+
+
+def _search(successors, start, goal, step_cost, max_length):
+    ''' A* over jump points; successors(node, parent_dir) yields (node, steps) '''
+    frontier = [(0.0, start)]
+    came_from = {start: None}
+    cost_so_far = {start: 0.0}
+    direction = {start: None}
+    while frontier:
+        _, current = heapq.heappop(frontier)
+        if current == goal:
+            _fill_path(came_from, cost_so_far, start, goal, step_cost)
+            break
+        base = cost_so_far[current]
+        for nxt, steps in successors(current, direction[current]):
+            new_cost = base + steps * step_cost
+            if new_cost > max_length:
+                continue
+            if nxt not in cost_so_far or new_cost < cost_so_far[nxt]:
+                cost_so_far[nxt] = new_cost
+                came_from[nxt] = current
+                direction[nxt] = (
+                    (nxt[0] > current[0]) - (nxt[0] < current[0]),
+                    (nxt[1] > current[1]) - (nxt[1] < current[1]),
+                )
+                heapq.heappush(frontier, (new_cost + astar.chebyshev(nxt, goal) * step_cost, nxt))
+    return came_from, cost_so_far
+
+
+class JPSPlus:
+    ''' Precomputed jump distances for every cell and direction
+
+    dist[d][y * width + x] > 0 : a jump point that many steps away along d
+    dist[d][y * width + x] <= 0 : -(number of free cells before a wall)
+
+    The tables are only valid for the grid version they were built at;
+    jump_point_search rebuilds them when the grid has changed.
+    '''
+
+    def __init__(self, graph: grid.Grid, impassable_list: Iterable[str]):
+        self.graph = graph
+        self.impassable_list = tuple(impassable_list)
+        self.version = graph.version
+        self.free = _Passability(graph, self.impassable_list)
+        H, W = graph.height, graph.width
+        self.dist = [array("l", bytes(array("l").itemsize * H * W)) for _ in DIRS]
+
+        free = self.free
+        # straight directions first: diagonals look them up
+        order = [d for d in DIRS if not (d[0] and d[1])] + [d for d in DIRS if d[0] and d[1]]
+        for dy, dx in order:
+            table = self.dist[DIR_INDEX[(dy, dx)]]
+            straight_x = self.dist[DIR_INDEX[(0, dx)]] if dx else None
+            straight_y = self.dist[DIR_INDEX[(dy, 0)]] if dy else None
+            ys = range(H - 1, -1, -1) if dy > 0 else range(H)
+            xs = range(W - 1, -1, -1) if dx > 0 else range(W)
+            for y in ys:
+                for x in xs:
+                    ny, nx = y + dy, x + dx
+                    if not free(y, x) or not free(ny, nx):
+                        continue  # 0: wall straight ahead (or we are in one)
+                    n = ny * W + nx
+                    if _forced(free, ny, nx, dy, dx) or (
+                        dy and dx and (straight_x[n] > 0 or straight_y[n] > 0)
+                    ):
+                        table[y * W + x] = 1
+                    else:
+                        ahead = table[n]
+                        table[y * W + x] = ahead + 1 if ahead > 0 else ahead - 1
+
+    def successors(self, goal: GridLocation):
+        W = self.graph.width
+        free = self.free
+        gy, gx = goal
+
+        def expand(node, parent_dir):
+            y, x = node
+            i = y * W + x
+            for dy, dx in _successor_dirs(free, y, x, parent_dir):
+                d = self.dist[DIR_INDEX[(dy, dx)]][i]
+                reach = abs(d)
+                ry, rx = (gy - y) * dy, (gx - x) * dx
+                if dy and dx:
+                    # goal ahead in this quadrant: stop level with it
+                    if ry > 0 and rx > 0 and min(ry, rx) <= reach:
+                        m = min(ry, rx)
+                        yield (y + dy * m, x + dx * m), m
+                        continue
+                elif (dx and gy == y and 0 < rx <= reach) or (dy and gx == x and 0 < ry <= reach):
+                    yield goal, max(rx, ry)
+                    continue
+                if d > 0:
+                    yield (y + dy * d, x + dx * d), d
+
+        return expand
+
+
+_tables = weakref.WeakKeyDictionary()
+
+
+def jump_point_search(cost_dict, impassable_list, graph: grid.Grid, start: GridLocation,
+                      goal: GridLocation, max_length=100, plus: bool = False):
+    ''' Drop-in for astar.a_star_search on uniform-cost grids
+
+    Tiles in impassable_list are walls, every other tile must cost the
+    same; otherwise this just calls a_star_search.  The returned came_from
+    holds single steps along the path to goal, so reconstruct_path works
+    unchanged, but its other entries link jump points rather than
+    neighbors.
+
+    Parameters
+    ----------
+    plus : bool
+        use JPS+ tables, built once per grid and rebuilt after the grid changes
+    '''
+    step_cost = uniform_cost(graph, cost_dict, impassable_list)
+    if step_cost is None:
+        return astar.a_star_search(cost_dict, impassable_list, graph, start, goal, max_length)
+
+    if plus:
+        per_grid = _tables.setdefault(graph, {})
+        key = tuple(impassable_list)
+        tables = per_grid.get(key)
+        if tables is None or tables.version != graph.version:
+            tables = per_grid[key] = JPSPlus(graph, impassable_list)
+        successors = tables.successors(goal)
+    else:
+        free = _Passability(graph, impassable_list)
+
+        def successors(node, parent_dir):
+            for dy, dx in _successor_dirs(free, node[0], node[1], parent_dir):
+                nxt = _jump(free, node[0], node[1], dy, dx, goal)
+                if nxt is not None:
+                    yield nxt, max(abs(nxt[0] - node[0]), abs(nxt[1] - node[1]))
+
+    return _search(successors, start, goal, step_cost, max_length)
+
+
+if __name__ == "__main__":
+    start, goal = (1, 4), (8, 3)
+
+    G = grid.ArrayGrid(12, 12, ".")
+    G[5, 1:11] = "#"
+
+    cost_dict = {".": 1.0, "#": 999}
+    impassable_list = ["#"]
+
+    for plus in (False, True):
+        came_from, cost_so_far = jump_point_search(
+            cost_dict, impassable_list, G, start, goal, plus=plus
+        )
+        path = astar.reconstruct_path(came_from, start=start, goal=goal)
+        print(f"plus={plus}: cost {cost_so_far[goal]}, {path}")
@@ -0,0 +1,156 @@
+"landmarks.py - ALT (A*, landmarks, triangle inequality) heuristics for a finished level."
+
+# References
+# ----------
+# Goldberg & Harrelson, "Computing the Shortest Path: A* Search Meets Graph
+#   Theory", SODA 2005
+
+import time
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+import dijkstra
+import grid
+from grid import GridLocation
+
+INF = float("inf")
+
+
+class Landmarks:
+    ''' Distance tables to K landmark cells, and the ALT heuristic they give
+
+    For a landmark L the triangle inequality bounds the cost of any walk
+    n -> goal from below by
+
+        d(n, L) - d(goal, L)   and   d(L, goal) - d(L, n)
+
+    and the heuristic is the largest bound over all landmarks.  It is
+    admissible and consistent, so A* with it returns cheapest paths, and on
+    walled maps it is far better informed than Manhattan distance.
+
+    Moving onto a cell costs that cell's cost, so distances are not
+    symmetric, but walking a path backwards swaps which end is paid for:
+    d(L, n) = d(n, L) - cost[L] + cost[n], and one table per landmark covers
+    both directions.
+
+    Landmarks are picked farthest-first: each new one is the reachable cell
+    farthest from all landmarks so far, which puts them in dead ends and
+    corners where they bound the most queries.
+
+    Usage::
+
+        L = Landmarks.from_dungeon(D, cost_dict, k=8)
+        came_from, cost = astar.a_star_search(cost_dict, [], D.grid, s, g, heuristic=L)
+        path = astar.GridAStar(D.grid).search(cost_dict, [], s, g, heuristic=L.table(g))
+        print(L.stats())
+
+    The tables describe the grid as it was built; rebuild after edits
+    (stale tables can overestimate).
+
+    Attributes
+    ----------
+    cells : List[GridLocation]
+        the landmarks
+    to_landmark : np.ndarray
+        (K, height * width) float32, d(n, L) per landmark (inf if
+        unreachable); exact for whole-number costs up to 2**24
+    '''
+
+    def __init__(self, graph: grid.Grid, cost_dict: Optional[dict] = None,
+                 impassable: Iterable[str] = (), k: int = 8, seed: Optional[GridLocation] = None):
+        self.graph = graph
+        self.cost_dict = cost_dict
+        self.impassable = tuple(impassable)
+        self.k = k
+        self.seed = seed
+        self.build()
+
+    @classmethod
+    def from_dungeon(cls, dungeon, cost_dict: Optional[dict] = None, **kwargs) -> "Landmarks":
+        ''' Landmarks for a finished DungeonGenerator, seeded in its first room '''
+        room = dungeon.rooms[0]
+        seed = ((room.y1 + room.y2) // 2, (room.x1 + room.x2) // 2)
+        return cls(dungeon.grid, cost_dict, seed=seed, **kwargs)
+
+    def build(self) -> None:
+        t0 = time.perf_counter()
+        G = self.graph
+        width = G.width
+        self.version = G.version
+        self.cost = G.cost_layer(self.cost_dict).reshape(-1).astype(np.float32)
+        seed = self.seed
+        if seed is None:
+            ys, xs = G.layer("passable").nonzero()
+            seed = (int(ys[0]), int(xs[0]))
+
+        tables: List[np.ndarray] = []
+        self.cells: List[GridLocation] = []
+        # farthest-first: distance to the nearest landmark so far
+        nearest = dijkstra.DistanceMap(G, self.cost_dict, self.impassable).compute([seed]).dist.reshape(-1)
+        reachable = np.isfinite(nearest)
+        for _ in range(self.k):
+            i = int(np.argmax(np.where(reachable, nearest, -1.0)))
+            cell = divmod(i, width)
+            dist = dijkstra.DistanceMap(G, self.cost_dict, self.impassable).compute([cell]).dist.reshape(-1)
+            tables.append(dist)
+            self.cells.append(cell)
+            nearest = np.minimum(nearest, dist) if tables[1:] else dist.copy()
+        self.to_landmark = np.array(tables, dtype=np.float32).reshape(len(tables), -1)
+        self.build_time = time.perf_counter() - t0
+        self._goal = None
+        self._table = None
+
+    def table(self, goal: GridLocation) -> memoryview:
+        ''' Flat heuristic for every cell toward goal (last goal is cached) '''
+        if goal == self._goal:
+            return self._table
+        width = self.graph.width
+        g = goal[0] * width + goal[1]
+        D = self.to_landmark
+        to_goal = D[:, g : g + 1]
+        with np.errstate(invalid="ignore"):
+            # d(n, L) - d(goal, L)
+            forward = D - to_goal
+            # d(L, goal) - d(L, n) = (d(goal, L) + cost[goal]) - (d(n, L) + cost[n])
+            backward = (to_goal + self.cost[g]) - (D + self.cost)
+            h = np.fmax(forward, backward)
+        # inf - inf pairs (goal and cell both cut off from L) give no bound
+        h = np.nan_to_num(h, nan=0.0, posinf=INF).max(axis=0)
+        h = np.maximum(h, 0.0).astype(float)
+        self._goal, self._table = goal, memoryview(h)
+        return self._table
+
+    def __call__(self, loc: GridLocation, goal: GridLocation) -> float:
+        ''' ALT heuristic in the astar.heuristic signature '''
+        return self.table(goal)[loc[0] * self.graph.width + loc[1]]
+
+    def stats(self) -> dict:
+        return {
+            "landmarks": len(self.cells),
+            "bytes": self.to_landmark.nbytes,
+            "build_seconds": self.build_time,
+        }
+
+
+if __name__ == "__main__":
+    import random
+    import astar
+    from dungeon_gen import DungeonGenerator
+
+    random.seed(3)
+    D = DungeonGenerator(width=160, height=100, num_rooms=32)
+    cost_dict = {".": 1.0, "#": 99, "+": 0}
+    ys, xs = D.grid.layer("passable").nonzero()
+    cells = list(zip(ys.tolist(), xs.tolist()))
+    pairs = [(random.choice(cells), random.choice(cells)) for _ in range(10)]
+
+    for k in (0, 4, 16):
+        L = Landmarks.from_dungeon(D, cost_dict, k=k) if k else None
+        touched = 0
+        for s, g in pairs:
+            came_from, cost = astar.a_star_search(cost_dict, [], D.grid, s, g, max_length=10**9,
+                                                  heuristic=L or astar.heuristic)
+            touched += len(cost)
+        print(f"k={k:2d}: {touched / len(pairs):7.0f} cells touched per query"
+              + (f", {L.stats()}" if L else " (Manhattan)"))
@@ -0,0 +1,177 @@
+"lightmap.py - Light levels summed from many sources, updated one source at a time."
+
+from typing import Dict, Optional
+
+import numpy as np
+
+import fov
+import grid
+from grid import GridLocation
+
+_stencils = {}
+
+
+def stencil(radius: int, intensity: int) -> np.ndarray:
+    ''' (2r+1, 2r+1) int32 light levels around a source, falling off linearly
+
+    intensity at the source, down to intensity / (radius + 1) at the edge of
+    the disc, and 0 outside it.  Cached and read-only.
+    '''
+    key = (radius, intensity)
+    levels = _stencils.get(key)
+    if levels is None:
+        d = np.arange(-radius, radius + 1)
+        distance = np.sqrt(d[:, None] ** 2 + d[None, :] ** 2)
+        levels = np.floor(intensity * (1.0 - distance / (radius + 1))).astype(np.int32)
+        levels[~fov.disc(radius)] = 0
+        levels.flags.writeable = False
+        _stencils[key] = levels
+    return levels
+
+
+class _Source:
+    __slots__ = ("loc", "radius", "intensity", "box", "levels")
+
+    def __init__(self, loc, radius, intensity):
+        self.loc = loc
+        self.radius = radius
+        self.intensity = intensity
+        # what this source adds to LightMap.light over box
+        self.box = (0, 0, 0, 0)
+        self.levels = np.zeros((0, 0), dtype=np.int32)
+
+
+class LightMap:
+    ''' Light on every cell of a grid, summed over any number of sources
+
+    Each source lights what it can see (ArrayFOV shadowcasting on the
+    grid's blocks_vision layer) with a linear falloff, and its share is
+    kept, so moving, changing or removing one source subtracts its old
+    share and adds the new one without touching the others.  Levels are
+    integers, so adding and subtracting never drifts.
+
+    Grid writes are picked up by update(): only sources whose disc reaches
+    a dirty cell are re-cast.
+
+    Usage::
+
+        lights = LightMap(G)
+        torch = lights.add((12, 40), radius=8, intensity=200)
+        ...
+        lights.move(torch, (12, 41))
+        lights.update()              # after doors open, walls fall...
+        level = lights.light[y, x]   # read by the renderer
+
+    Attributes
+    ----------
+    light : np.ndarray
+        (height, width) int32 light level, kept current in place
+    recast : int
+        sources cast since the last stats()
+    '''
+
+    def __init__(self, graph: grid.Grid):
+        self.graph = graph
+        self.fov = fov.ArrayFOV.from_grid(graph)
+        self.light = np.zeros((graph.height, graph.width), dtype=np.int32)
+        self.sources: Dict[int, _Source] = {}
+        self.version = graph.version
+        self.next_key = 0
+        self.recast = 0
+
+    #------------------------------
+    # Sources
+    #------------------------------
+    def add(self, loc: GridLocation, radius: int, intensity: int = 100) -> int:
+        ''' Light a new source; returns its key '''
+        key = self.next_key
+        self.next_key += 1
+        source = self.sources[key] = _Source(tuple(loc), radius, intensity)
+        self._cast(source)
+        return key
+
+    def move(self, key: int, loc: GridLocation) -> None:
+        source = self.sources[key]
+        if tuple(loc) != source.loc:
+            source.loc = tuple(loc)
+            self._cast(source)
+
+    def change(self, key: int, radius: Optional[int] = None, intensity: Optional[int] = None) -> None:
+        ''' New radius and/or intensity for a source '''
+        source = self.sources[key]
+        source.radius = source.radius if radius is None else radius
+        source.intensity = source.intensity if intensity is None else intensity
+        self._cast(source)
+
+    def remove(self, key: int) -> None:
+        ''' Put a source out '''
+        self._clear(self.sources.pop(key))
+
+    def update(self) -> int:
+        ''' Re-cast the sources the grid writes since the last update can reach; returns how many '''
+        G = self.graph
+        if self.version == G.version:
+            return 0
+        rects = G.changes_since(self.version)
+        self.version = G.version
+        if rects is None:
+            stale = list(self.sources.values())
+        else:
+            stale = [s for s in self.sources.values() if self._reaches(s, rects)]
+        for source in stale:
+            self._cast(source)
+        return len(stale)
+
+    def stats(self) -> dict:
+        recast, self.recast = self.recast, 0
+        return {"sources": len(self.sources), "recast": recast}
+
+    #------------------------------
+    # Internals
+    #------------------------------
+    @staticmethod
+    def _reaches(source: _Source, rects) -> bool:
+        y, x = source.loc
+        r = source.radius
+        reach = r * r + r
+        for y1, y2, x1, x2 in rects:
+            # offset from the source to the nearest cell of the rect
+            dy = max(y1 - y, 0, y - (y2 - 1))
+            dx = max(x1 - x, 0, x - (x2 - 1))
+            if dy * dy + dx * dx <= reach:
+                return True
+        return False
+
+    def _clear(self, source: _Source) -> None:
+        y1, y2, x1, x2 = source.box
+        self.light[y1:y2, x1:x2] -= source.levels
+
+    def _cast(self, source: _Source) -> None:
+        self._clear(source)
+        y, x = source.loc
+        r = source.radius
+        visible = self.fov.compute(source.loc, r)
+        y1, y2, x1, x2 = box = self.fov.box
+        levels = stencil(r, source.intensity)[y1 - y + r : y2 - y + r, x1 - x + r : x2 - x + r]
+        source.levels = np.where(visible[y1:y2, x1:x2], levels, 0).astype(np.int32)
+        source.box = box
+        self.light[y1:y2, x1:x2] += source.levels
+        self.recast += 1
+
+
+if __name__ == "__main__":
+    G = grid.ArrayGrid(11, 40, ".")
+    G[5, 0:40] = "#"
+    G[5, 20] = "+"
+    lights = LightMap(G)
+    lights.add((3, 17), radius=6, intensity=90)
+    lights.add((8, 30), radius=6, intensity=90)
+
+    def show():
+        print("\n".join("".join(str(min(v // 10, 9)) if v >= 10 else G[y, x] for x, v in enumerate(row))
+                        for y, row in enumerate(lights.light.tolist())))
+
+    show()
+    G[5, 20] = "."
+    print(f"door opened, recast {lights.update()} source(s)")
+    show()
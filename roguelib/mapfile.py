@@ -0,0 +1,293 @@
+"mapfile.py - Binary save/load of maps, memory-mapped on load."
+
+import gc
+import mmap
+import struct
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+import grid
+from dungeon_gen import Room
+
+# ------------------------------------------------------------------
+# Level record (little endian), every section starts 64-byte aligned
+# relative to the start of the record:
+#
+#   header   : magic, version, height, width, palette_len, num_rooms,
+#              tiles_offset
+#   palette  : palette_len x (u8 length, utf-8 tile)
+#   rooms    : num_rooms x (y1, y2, x1, x2) int32
+#   tiles    : height * width uint8 palette codes, row major
+#
+# Archive: magic, version, count, count x u64 record offsets, records.
+# ------------------------------------------------------------------
+MAGIC = b"RLMP"
+ARCHIVE_MAGIC = b"RLMA"
+VERSION = 1
+ALIGN = 64
+
+_HEADER = struct.Struct("<4sHxxIIIIQ")
+_ARCHIVE_HEADER = struct.Struct("<4sHxxI")
+_ROOM = struct.Struct("<4i")
+_OFFSET = struct.Struct("<Q")
+
+_ACCESS = {"r": mmap.ACCESS_READ, "c": mmap.ACCESS_COPY, "r+": mmap.ACCESS_WRITE}
+
+
+def _align(n: int) -> int:
+    return -(-n // ALIGN) * ALIGN
+
+
+def _as_array_grid(G: grid.Grid) -> grid.ArrayGrid:
+    if isinstance(G, grid.ArrayGrid):
+        return G
+    if isinstance(G, grid.ChunkedGrid):
+        return grid.ArrayGrid.from_array(G.read(0, G.height, 0, G.width), G.palette)
+    return grid.ArrayGrid.from_grid(G)
+
+
+def _encode(G: grid.Grid, rooms: Iterable[Room] = ()) -> Tuple[bytes, np.ndarray]:
+    ''' Build a level record
+
+    Returns
+    -------
+    head : bytes
+        header, palette and rooms, padded so the tiles start aligned
+    tiles : np.ndarray
+        contiguous tile codes to write straight after head
+    '''
+    A = _as_array_grid(G)
+    palette = b"".join(
+        bytes([len(t.encode())]) + t.encode() for t in A.palette
+    )
+    rooms = list(rooms)
+    room_bytes = b"".join(_ROOM.pack(r.y1, r.y2, r.x1, r.x2) for r in rooms)
+    meta = palette + room_bytes
+    tiles_offset = _align(_HEADER.size + len(meta))
+    head = _HEADER.pack(
+        MAGIC, VERSION, A.height, A.width, len(A.palette), len(rooms), tiles_offset
+    ) + meta
+    head += b"\0" * (tiles_offset - len(head))
+    return head, np.ascontiguousarray(A.tiles)
+
+
+def _decode(buf, offset: int = 0, frozen: bool = False) -> Tuple[grid.ArrayGrid, List[Room]]:
+    ''' Parse the level record at offset; tiles are a view on buf
+
+    frozen: the palette refuses new tiles, for mappings written back to the
+    file, whose palette section can't grow
+    '''
+    magic, version, height, width, palette_len, num_rooms, tiles_offset = (
+        _HEADER.unpack_from(buf, offset)
+    )
+    if magic != MAGIC:
+        raise ValueError(f"Not a map record: magic {magic!r}")
+    if version > VERSION:
+        raise ValueError(f"Unsupported map version {version}")
+
+    pos = offset + _HEADER.size
+    palette = grid.Palette()
+    for i in range(palette_len):
+        n = buf[pos]
+        palette.encode(bytes(buf[pos + 1 : pos + 1 + n]).decode())
+        pos += 1 + n
+    palette.frozen = frozen
+
+    rooms = []
+    for i in range(num_rooms):
+        rooms.append(Room(*_ROOM.unpack_from(buf, pos)))
+        pos += _ROOM.size
+
+    tiles = np.frombuffer(
+        buf, dtype=np.uint8, count=height * width, offset=offset + tiles_offset
+    ).reshape(height, width)
+    return grid.ArrayGrid.from_array(tiles, palette), rooms
+
+
+def _open(path: str, mode: str):
+    with open(path, "r+b" if mode == "r+" else "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=_ACCESS[mode])
+
+
+def _close(buf, mode: str) -> None:
+    if buf.closed:
+        return
+    if mode == "r+":
+        buf.flush()
+    try:
+        buf.close()
+    except BufferError:
+        # ArrayGrids refer to themselves, so dropped ones may wait for the collector
+        gc.collect()
+        try:
+            buf.close()
+        except BufferError:
+            raise BufferError("grids loaded from this file are still in use") from None
+
+
+def save(path: str, G: grid.Grid, rooms: Iterable[Room] = ()) -> None:
+    ''' Write a single level '''
+    head, tiles = _encode(G, rooms)
+    with open(path, "wb") as f:
+        f.write(head)
+        f.write(tiles.data)
+
+
+class MapLevel:
+    ''' A level mapped by load(); unpacks as (grid, rooms)
+
+    close() (or leaving a with block) flushes 'r+' edits and unmaps the
+    file.  The mapping can only go once nothing refers to the grid, its
+    views or its tiles any more, so close() raises BufferError while they
+    are still in use; without close() the file is unmapped whenever the
+    last of them is dropped.
+
+    Usage::
+
+        with mapfile.load("level.rlib", "r+") as level:
+            level.grid[3, 4] = "."
+    '''
+
+    def __init__(self, buf, mode: str):
+        self.buf = buf
+        self.mode = mode
+        self.grid, self.rooms = _decode(buf, frozen=mode == "r+")
+
+    def __iter__(self):
+        yield self.grid
+        yield self.rooms
+
+    def flush(self) -> None:
+        ''' Write 'r+' edits through to the file now '''
+        self.buf.flush()
+
+    def close(self) -> None:
+        self.grid = None
+        _close(self.buf, self.mode)
+
+    def __enter__(self) -> "MapLevel":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def load(path: str, mode: str = "c") -> MapLevel:
+    ''' Memory-map a level written by save()
+
+    Parameters
+    ----------
+    path : str
+        file to open
+    mode : str
+        'c' copy-on-write (edits stay in memory), 'r' read-only, or
+        'r+' edits are written back to the file; only tiles already in the
+        saved palette can be written (others raise ValueError)
+
+    Returns
+    -------
+    MapLevel
+        unpacks as (grid, rooms): an ArrayGrid whose tiles are backed
+        directly by the mapping, nothing is copied, and the rooms saved
+        with the level
+    '''
+    return MapLevel(_open(path, mode), mode)
+
+
+def save_archive(path: str, levels: Iterable[Tuple[grid.Grid, Iterable[Room]]]) -> None:
+    ''' Write many (grid, rooms) levels into one file '''
+    levels = list(levels)
+    index_size = _ARCHIVE_HEADER.size + _OFFSET.size * len(levels)
+    offsets = []
+    with open(path, "wb") as f:
+        f.write(b"\0" * _align(index_size))
+        for G, rooms in levels:
+            offsets.append(f.tell())
+            head, tiles = _encode(G, rooms)
+            f.write(head)
+            f.write(tiles.data)
+            f.write(b"\0" * (_align(f.tell()) - f.tell()))
+        f.seek(0)
+        f.write(_ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, VERSION, len(levels)))
+        for offset in offsets:
+            f.write(_OFFSET.pack(offset))
+
+
+class MapArchive:
+    ''' Read-side of save_archive; levels are decoded lazily from one mapping
+
+    Decoded levels are kept, so edits made to a level in copy-on-write mode
+    are seen (with a consistent palette) by later lookups of the same level.
+    In 'r+' mode palettes are frozen, as with load().  close() works as
+    MapLevel.close(), for every level of the archive.
+
+    Usage::
+
+        with MapArchive("levels.rlib") as archive:
+            G, rooms = archive[3]
+            ...
+            del G
+    '''
+
+    def __init__(self, path: str, mode: str = "c"):
+        self.buf = _open(path, mode)
+        self.mode = mode
+        magic, version, count = _ARCHIVE_HEADER.unpack_from(self.buf, 0)
+        if magic != ARCHIVE_MAGIC:
+            raise ValueError(f"Not a map archive: magic {magic!r}")
+        if version > VERSION:
+            raise ValueError(f"Unsupported archive version {version}")
+        self.offsets = [
+            _OFFSET.unpack_from(self.buf, _ARCHIVE_HEADER.size + i * _OFFSET.size)[0]
+            for i in range(count)
+        ]
+        self._levels = {}
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, idx: int) -> Tuple[grid.ArrayGrid, List[Room]]:
+        idx = range(len(self))[idx]
+        if idx not in self._levels:
+            self._levels[idx] = _decode(self.buf, self.offsets[idx], frozen=self.mode == "r+")
+        return self._levels[idx]
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def close(self) -> None:
+        self._levels.clear()
+        _close(self.buf, self.mode)
+
+    def __enter__(self) -> "MapArchive":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import tempfile
+    import time
+    from dungeon_gen import DungeonGenerator
+
+    parser = argparse.ArgumentParser("")
+    parser.add_argument("--width", default=2000, type=int)
+    parser.add_argument("--height", default=2000, type=int)
+    parser.add_argument("--num_rooms", default=256, type=int)
+    args = parser.parse_args()
+
+    D = DungeonGenerator(width=args.width, height=args.height, num_rooms=args.num_rooms)
+    path = os.path.join(tempfile.mkdtemp(), "level.rlib")
+
+    t0 = time.perf_counter()
+    save(path, D.grid, D.rooms)
+    t1 = time.perf_counter()
+    G, rooms = load(path)
+    t2 = time.perf_counter()
+    assert str(G) == str(D.grid) and len(rooms) == len(D.rooms)
+    print(f"{os.path.getsize(path)} bytes, save {t1 - t0:.4f}s, load {t2 - t1:.6f}s")
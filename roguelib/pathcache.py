@@ -0,0 +1,202 @@
+"pathcache.py - LRU cache of A* paths that repairs entries instead of re-searching."
+
+import weakref
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+
+import astar
+import grid
+from grid import GridLocation
+
+
+class _Entry:
+    __slots__ = ("start", "goal", "profile", "cells", "version", "repairs")
+
+    def __init__(self, start, goal, profile, cells, version, repairs=0):
+        self.start = start
+        self.goal = goal
+        self.profile = profile
+        # start, path..., goal
+        self.cells = cells
+        self.version = version
+        self.repairs = repairs
+
+
+class PathCache:
+    ''' Paths on one grid keyed by (start, goal, cost profile, grid version)
+
+    An exact key at the current grid version is a hit.  Otherwise the cache
+    looks for an entry with the same profile whose path passes through start
+    and whose goal is at most one step from the new goal, and repairs it:
+
+    - the prefix before start is trimmed (the agent walked along the path)
+    - the goal is extended or trimmed by one step (the target moved)
+    - if the grid changed since the entry was stored, only the cells inside
+      the dirty rects are re-validated, and the stretch between the first
+      and last dirty cell is searched again
+
+    Repaired paths are walkable and within max_length but not always the
+    cheapest, so an entry is searched from scratch once it has been
+    repaired max_repairs times.
+
+    The cache is for callers that want one agent's own path, e.g. a
+    monster with a cost profile nobody shares.  ui.py's monsters chase the
+    player with a shared dijkstra.DistanceMap instead and don't use it.
+
+    Usage::
+
+        cache = PathCache(G)
+        path = cache.path(cost_dict, impassable_list, monster.loc, player.loc, max_length=999)
+        print(cache.stats())
+    '''
+
+    def __init__(self, graph: grid.Grid, max_entries: int = 256, max_repairs: int = 8):
+        self.graph = graph
+        self.max_entries = max_entries
+        self.max_repairs = max_repairs
+        self.engine = astar.GridAStar(graph)
+        self.entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        # (profile, goal) -> keys, to find repair candidates near a goal
+        self.by_goal: Dict[tuple, Set[tuple]] = {}
+        self.hits = self.repairs = self.misses = self.evictions = 0
+
+    @staticmethod
+    def profile(cost_dict, impassable_list, max_length) -> tuple:
+        return (tuple(sorted(cost_dict.items())), tuple(impassable_list), max_length)
+
+    def path(self, cost_dict, impassable_list, start: GridLocation, goal: GridLocation,
+             max_length=100) -> List[GridLocation]:
+        ''' Same result contract as astar.a_star_path: start exclusive, goal inclusive '''
+        profile = self.profile(cost_dict, impassable_list, max_length)
+        key = (start, goal, profile)
+        entry = self.entries.get(key)
+        if entry is not None and entry.version == self.graph.version:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry.cells[1:]
+
+        for candidate in self._candidates(profile, start, goal):
+            cells = self._repair(candidate, cost_dict, impassable_list, start, goal, max_length)
+            if cells is not None:
+                self.repairs += 1
+                self._store(key, _Entry(start, goal, profile, cells, self.graph.version,
+                                        candidate.repairs + 1))
+                return cells[1:]
+
+        self.misses += 1
+        path = self.engine.search(cost_dict, impassable_list, start, goal, max_length)
+        if path or start == goal:
+            self._store(key, _Entry(start, goal, profile, [start] + path, self.graph.version))
+        return path
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.by_goal.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.repairs + self.misses
+        return {
+            "hits": self.hits,
+            "repairs": self.repairs,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "hit_rate": (self.hits + self.repairs) / lookups if lookups else 0.0,
+        }
+
+    #------------------------------
+    # Internals
+    #------------------------------
+    def _store(self, key: tuple, entry: _Entry) -> None:
+        if key in self.entries:
+            self._forget(key)
+        self.entries[key] = entry
+        self.by_goal.setdefault((entry.profile, entry.goal), set()).add(key)
+        while len(self.entries) > self.max_entries:
+            self._forget(next(iter(self.entries)))
+            self.evictions += 1
+
+    def _forget(self, key: tuple) -> None:
+        entry = self.entries.pop(key)
+        keys = self.by_goal[(entry.profile, entry.goal)]
+        keys.discard(key)
+        if not keys:
+            del self.by_goal[(entry.profile, entry.goal)]
+
+    def _candidates(self, profile, start, goal):
+        ''' Entries whose goal is within one step of goal and whose path holds start '''
+        gy, gx = goal
+        for dy in (0, -1, 1):
+            for dx in (0, -1, 1):
+                for key in list(self.by_goal.get((profile, (gy + dy, gx + dx)), ())):
+                    entry = self.entries[key]
+                    if entry.repairs < self.max_repairs and start in entry.cells:
+                        yield entry
+
+    def _repair(self, entry: _Entry, cost_dict, impassable_list, start, goal,
+                max_length) -> Optional[List[GridLocation]]:
+        ''' Repaired [start, ..., goal] from entry, or None if it cannot be reused '''
+        G = self.graph
+        cells = entry.cells[entry.cells.index(start):]
+
+        if entry.version != G.version:
+            rects = G.changes_since(entry.version)
+            if rects is None:
+                return None
+            dirty = [
+                n for n, (y, x) in enumerate(cells)
+                if any(y1 <= y < y2 and x1 <= x < x2 for y1, y2, x1, x2 in rects)
+            ]
+            if dirty:
+                first, last = max(dirty[0] - 1, 0), min(dirty[-1] + 1, len(cells) - 1)
+                segment = self.engine.search(cost_dict, impassable_list, cells[first], cells[last],
+                                             max_length)
+                if not segment and first != last:
+                    return None
+                cells = cells[: first + 1] + segment + cells[last + 1 :]
+
+        if goal != cells[-1]:
+            if goal in cells:
+                cells = cells[: cells.index(goal) + 1]
+            elif G.get_tile(goal) in impassable_list:
+                return None
+            else:
+                cells = cells + [goal]
+
+        if sum(cost_dict.get(G[c], 1.0) for c in cells[1:]) > max_length:
+            return None
+        return cells
+
+
+_caches = weakref.WeakKeyDictionary()
+
+def cached_path(cost_dict, impassable_list, graph: grid.Grid, start: GridLocation,
+                goal: GridLocation, max_length=100) -> List[GridLocation]:
+    ''' astar.a_star_path through a per-grid PathCache '''
+    cache = _caches.get(graph)
+    if cache is None:
+        cache = _caches[graph] = PathCache(graph)
+    return cache.path(cost_dict, impassable_list, start, goal, max_length)
+
+
+def cache_stats(graph: grid.Grid) -> dict:
+    ''' Hit/miss counters of the PathCache behind cached_path for graph '''
+    cache = _caches.get(graph)
+    return cache.stats() if cache is not None else {}
+
+
+if __name__ == "__main__":
+    G = grid.ArrayGrid(12, 30, ".")
+    G[5, 1:28] = "#"
+    cost_dict = {".": 1.0, "#": 99}
+    cache = PathCache(G)
+
+    me, you = (1, 2), (9, 4)
+    for turn in range(6):
+        path = cache.path(cost_dict, [], me, you, max_length=999)
+        print(f"turn {turn}: {me} -> {you} in {len(path)} steps")
+        me, you = path[0], (you[0], you[1] + 1)
+    G[2, 5:9] = "#"
+    path = cache.path(cost_dict, [], me, you, max_length=999)
+    print(f"after wall: {len(path)} steps")
+    print(cache.stats())
@@ -0,0 +1,220 @@
+"queues.py - Priority queues for the searches, pluggable by class."
+
+# Every queue has the interface of astar.PriorityQueue:
+#
+#   put(item, priority)  insert, or lower/raise the priority of a queued item
+#   get() -> item        remove an item with the lowest priority
+#   empty() -> bool
+#
+# astar.PriorityQueue never updates in place, so a re-queued item leaves a
+# stale copy behind and get() may return an item more than once; the queues
+# here return each queued item once, at its latest priority.
+
+from typing import Dict, Generic, Hashable, List, Tuple, TypeVar
+
+T = TypeVar("T", bound=Hashable)
+
+
+def _integer(priority: float) -> int:
+    p = int(priority)
+    if p != priority or p < 0:
+        raise ValueError(f"priority must be a non-negative integer, got {priority!r}")
+    return p
+
+
+def integer_costs(cost_dict: dict) -> bool:
+    ''' Are all costs whole numbers >= 0, so BucketQueue/RadixHeap can be used? '''
+    return all(float(c).is_integer() and c >= 0 for c in cost_dict.values())
+
+
+class BucketQueue(Generic[T]):
+    ''' Dial's bucket queue for small non-negative integer priorities
+
+    One list per priority value and a cursor at the lowest non-empty one:
+    put is O(1), get is O(1) amortised over a monotone search.  Priorities
+    below the cursor (an inconsistent heuristic) move the cursor back.
+    Items of equal priority come out last-in first-out, which makes A*
+    prefer the cells it found most recently.
+    '''
+
+    def __init__(self):
+        self.buckets: List[List[T]] = []
+        self.cursor = 0
+        self.priority: Dict[T, int] = {}
+
+    def empty(self) -> bool:
+        return not self.priority
+
+    def put(self, item: T, priority: float):
+        p = _integer(priority)
+        buckets = self.buckets
+        if p >= len(buckets):
+            buckets.extend([] for _ in range(p + 1 - len(buckets)))
+        buckets[p].append(item)
+        # an older copy in another bucket goes stale and is skipped by get
+        self.priority[item] = p
+        if p < self.cursor:
+            self.cursor = p
+
+    def get(self) -> T:
+        buckets, priority = self.buckets, self.priority
+        cursor = self.cursor
+        while True:
+            bucket = buckets[cursor]
+            while bucket:
+                item = bucket.pop()
+                if priority.get(item) == cursor:
+                    del priority[item]
+                    self.cursor = cursor
+                    return item
+            cursor += 1
+
+
+class RadixHeap(Generic[T]):
+    ''' Radix heap for monotone non-negative integer priorities
+
+    Items sit in bucket b = bit length of (priority xor last popped
+    priority); when bucket 0 runs dry the lowest non-empty bucket is
+    redistributed, and every item moves down at most ~64 times.  Priorities
+    must never be below the last one popped (put raises ValueError), which
+    holds for Dijkstra but not for a_star_search's inconsistent heuristic.
+    '''
+
+    def __init__(self):
+        self.last = 0
+        self.buckets: List[List[Tuple[int, T]]] = [[] for _ in range(65)]
+        self.priority: Dict[T, int] = {}
+
+    def empty(self) -> bool:
+        return not self.priority
+
+    def put(self, item: T, priority: float):
+        p = _integer(priority)
+        if p < self.last:
+            raise ValueError(f"priority {p} is below the last popped {self.last}")
+        self.buckets[(p ^ self.last).bit_length()].append((p, item))
+        self.priority[item] = p
+
+    def get(self) -> T:
+        buckets, priority = self.buckets, self.priority
+        while True:
+            bucket = buckets[0]
+            while bucket:
+                p, item = bucket.pop()
+                if priority.get(item) == p:
+                    del priority[item]
+                    return item
+            b = 1
+            while not buckets[b]:
+                b += 1
+            live = [(p, item) for p, item in buckets[b] if priority.get(item) == p]
+            buckets[b] = []
+            if not live:
+                continue
+            last = self.last = min(live)[0]
+            for entry in live:
+                buckets[(entry[0] ^ last).bit_length()].append(entry)
+
+
+class IndexedHeap(Generic[T]):
+    ''' Binary heap with a position index, so put() can change a priority in place
+
+    No stale copies, so the heap never holds more than one entry per item;
+    works with any float priorities.  Ties go to the item that was queued
+    first.
+    '''
+
+    def __init__(self):
+        # heap entries are [priority, order, item]
+        self.heap: List[list] = []
+        self.pos: Dict[T, int] = {}
+        self.counter = 0
+
+    def empty(self) -> bool:
+        return not self.heap
+
+    def put(self, item: T, priority: float):
+        pos = self.pos.get(item)
+        if pos is None:
+            self.counter += 1
+            self.heap.append([priority, self.counter, item])
+            self._up(len(self.heap) - 1)
+            return
+        entry = self.heap[pos]
+        old, entry[0] = entry[0], priority
+        if priority < old:
+            self._up(pos)
+        else:
+            self._down(pos)
+
+    def get(self) -> T:
+        heap, pos = self.heap, self.pos
+        top = heap[0]
+        last = heap.pop()
+        del pos[top[2]]
+        if heap:
+            heap[0] = last
+            pos[last[2]] = 0
+            self._down(0)
+        return top[2]
+
+    def _up(self, i: int):
+        heap, pos = self.heap, self.pos
+        entry = heap[i]
+        while i:
+            parent = (i - 1) >> 1
+            above = heap[parent]
+            if above < entry:
+                break
+            heap[i] = above
+            pos[above[2]] = i
+            i = parent
+        heap[i] = entry
+        pos[entry[2]] = i
+
+    def _down(self, i: int):
+        heap, pos = self.heap, self.pos
+        n = len(heap)
+        entry = heap[i]
+        while True:
+            child = 2 * i + 1
+            if child >= n:
+                break
+            if child + 1 < n and heap[child + 1] < heap[child]:
+                child += 1
+            below = heap[child]
+            if entry < below:
+                break
+            heap[i] = below
+            pos[below[2]] = i
+            i = child
+        heap[i] = entry
+        pos[entry[2]] = i
+
+
+def for_costs(cost_dict: dict):
+    ''' BucketQueue when every cost is a whole number, else IndexedHeap '''
+    return BucketQueue if integer_costs(cost_dict) else IndexedHeap
+
+
+if __name__ == "__main__":
+    import random
+
+    rng = random.Random(0)
+    for Q in (BucketQueue, RadixHeap, IndexedHeap):
+        q = Q()
+        expected = {}
+        for item in range(200):
+            p = rng.randrange(100)
+            q.put(item, p)
+            expected[item] = p
+        for item in rng.sample(range(200), 50):
+            # lower only, so the radix heap stays monotone
+            p = rng.randrange(expected[item] + 1)
+            q.put(item, p)
+            expected[item] = p
+        out = []
+        while not q.empty():
+            out.append(expected[q.get()])
+        assert out == sorted(expected.values()), Q.__name__
+        print(f"{Q.__name__}: {len(out)} items out in order")
@@ -0,0 +1,26 @@
+"conftest.py - Put roguelib's modules on the path, as the scripts see them."
+
+# stdlib
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def dungeon():
+    from dungeon_gen import DungeonGenerator
+    random.seed(0)
+    return DungeonGenerator(width=60, height=30, num_rooms=8)
+
+
+@pytest.fixture
+def pairs(dungeon):
+    """40 (start, goal) pairs of floor cells"""
+    ys, xs = dungeon.grid.mask(["."]).nonzero()
+    cells = list(zip(ys.tolist(), xs.tolist()))
+    rng = random.Random(1)
+    return [(rng.choice(cells), rng.choice(cells)) for _ in range(40)]
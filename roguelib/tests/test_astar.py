@@ -0,0 +1,94 @@
+"test_astar.py - GridAStar against a_star_search, and path costs against Dijkstra."
+
+# project
+import astar
+import dijkstra
+import grid
+
+MONSTER_COSTS = {".": 1.0, "#": 99, "+": 0}
+# every tile costs at least 1, so Chebyshev distance is admissible
+WALKER_COSTS = {".": 1.0, "#": 99, "+": 1.0}
+
+
+def path_cost(G, cost_dict, path):
+    return sum(cost_dict[G[p]] for p in path)
+
+
+def test_grid_astar_matches_dict_search(dungeon, pairs):
+    G = dungeon.grid
+    for s, g in pairs:
+        came_from, _ = astar.a_star_search(MONSTER_COSTS, [], G, s, g, max_length=999)
+        assert astar.a_star_path(MONSTER_COSTS, [], G, s, g, max_length=999) == \
+            astar.reconstruct_path(came_from, s, g)
+
+
+def test_chebyshev_costs_are_optimal(dungeon, pairs):
+    G = dungeon.grid
+    for s, g in pairs:
+        exact = dijkstra.DistanceMap(G, WALKER_COSTS).compute([g])[s]
+        came_from, cost = astar.a_star_search(WALKER_COSTS, [], G, s, g, max_length=10**9,
+                                              heuristic=astar.chebyshev)
+        assert cost[g] == exact
+        assert path_cost(G, WALKER_COSTS, astar.reconstruct_path(came_from, s, g)) == exact
+
+
+def test_lazy_adjacency_matches_dense_table(dungeon):
+    A = dungeon.grid
+    dense = A.adjacency(MONSTER_COSTS, ["#"])
+    L = grid.Grid(A.height, A.width)
+    L.data = [list(row) for row in str(A).split("\n")]
+    lazy = L.adjacency(MONSTER_COSTS, ["#"])
+    assert isinstance(lazy, grid.LazyAdjacency)
+    n = A.height * A.width
+    for writes in ([], [((5, 10), "#"), ((6, 11), "."), ((0, 0), "+")]):
+        for loc, tile in writes:
+            A[loc] = L[loc] = tile
+        index, cost, count = lazy.views()
+        for i in range(n):
+            k = i * grid.Adjacency.SLOTS
+            assert [(index[j], cost[j]) for j in range(k, k + count[i])] == \
+                [(int(dense.index[j]), float(dense.cost[j])) for j in range(k, k + int(dense.count[i]))]
+
+
+def test_list_and_chunked_grids_search_like_array_grid(dungeon, pairs):
+    A = dungeon.grid
+    L = grid.Grid(A.height, A.width)
+    L.data = [list(row) for row in str(A).split("\n")]
+    C = grid.ChunkedGrid(A.height, A.width, "#", chunk_size=16)
+    for y, x in zip(*(~A.mask(["#"])).nonzero()):
+        C[int(y), int(x)] = A[y, x]
+    for s, g in pairs:
+        path = astar.a_star_path(MONSTER_COSTS, [], A, s, g, max_length=999)
+        assert astar.a_star_path(MONSTER_COSTS, [], L, s, g, max_length=999) == path
+        assert astar.a_star_path(MONSTER_COSTS, [], C, s, g, max_length=999) == path
+
+
+def test_sliced_budgeted_search_matches_one_run(dungeon, pairs):
+    G = dungeon.grid
+    for s, g in pairs:
+        whole = astar.BudgetedSearch(MONSTER_COSTS, ["#"], G, s, g, max_length=999)
+        assert whole.run()
+        sliced = astar.BudgetedSearch(MONSTER_COSTS, ["#"], G, s, g, max_length=999)
+        done = False
+        while not done:
+            before = sliced.expanded
+            done = sliced.run(max_expansions=7)
+            assert sliced.expanded - before <= 7
+        assert (sliced.found, sliced.path(), sliced.expanded) == \
+            (whole.found, whole.path(), whole.expanded)
+
+
+def test_unreachable_goal_gives_path_to_closest_cell(dungeon, pairs):
+    G = dungeon.grid
+    s, (gy, gx) = pairs[0]
+    G[gy - 1:gy + 2, gx - 1:gx + 2] = "#"
+    G[gy, gx] = "."
+    search = astar.BudgetedSearch(MONSTER_COSTS, ["#"], G, s, (gy, gx), max_length=999)
+    assert search.run() and not search.found
+    path = search.path()
+    end = path[-1] if path else s
+
+    def rank(i):
+        y, x = divmod(i, G.width)
+        return (abs(y - gy) + abs(x - gx), search.cost_so_far[i])
+    assert rank(end[0] * G.width + end[1]) == min(map(rank, search.cost_so_far))
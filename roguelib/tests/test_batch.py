@@ -0,0 +1,26 @@
+"test_batch.py - BatchPathfinder workers against serial a_star_path."
+
+# project
+import astar
+import batch
+
+MONSTER_COSTS = {".": 1.0, "#": 99, "+": 0}
+WALL_COSTS = {".": 1.0, "+": 1.0}
+
+
+def test_workers_match_serial_paths(dungeon, pairs):
+    G = dungeon.grid
+    queries = [(s, g, MONSTER_COSTS) for s, g in pairs] + \
+              [(s, g, WALL_COSTS, ["#"]) for s, g in pairs[:10]]
+
+    def serial():
+        return [astar.a_star_path(q[2], q[3] if len(q) > 3 else [], G, q[0], q[1], max_length=999)
+                for q in queries]
+
+    with batch.BatchPathfinder(G, workers=2) as B:
+        assert B.solve(queries) == serial()
+        # workers pick up the new tiles on the next batch
+        G[pairs[0][0]] = "#"
+        G[10:12, 5:40] = "#"
+        assert B.solve(queries) == serial()
+    assert batch.solve_batch(G, queries, workers=0) == serial()
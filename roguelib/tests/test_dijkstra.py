@@ -0,0 +1,43 @@
+"test_dijkstra.py - DistanceMap against a_star_search costs, before and after grid writes."
+
+# project
+import astar
+import dijkstra
+
+MONSTER_COSTS = {".": 1.0, "#": 99, "+": 0}
+
+
+def no_heuristic(a, b):
+    return 0
+
+
+def check_costs(G, chase, pairs, goal):
+    for s, _ in pairs:
+        _, cost = astar.a_star_search(MONSTER_COSTS, [], G, s, goal, max_length=10**9,
+                                      heuristic=no_heuristic)
+        assert chase[s] == cost[goal]
+        # every step down the gradient pays exactly what the map drops by
+        # (it may stop short of the goal on a plateau of zero-cost doors)
+        loc, walked = s, 0.0
+        while True:
+            step = chase.next_step(loc)
+            if step is None:
+                break
+            loc = step
+            walked += MONSTER_COSTS[G[loc]]
+        assert walked + chase[loc] == chase[s]
+
+
+def test_distance_map_matches_search_costs(dungeon, pairs):
+    G = dungeon.grid
+    goal = pairs[0][1]
+    chase = dijkstra.DistanceMap(G, MONSTER_COSTS).compute([goal])
+    check_costs(G, chase, pairs, goal)
+
+    G[goal[0] - 1:goal[0] + 2, goal[1] - 1:goal[1] + 2] = "#"
+    G[goal] = "."
+    G[5:25, 30] = "+"
+    assert chase.version != G.version
+    chase.compute([goal])
+    assert chase.version == G.version
+    check_costs(G, chase, pairs, goal)
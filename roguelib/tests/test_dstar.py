@@ -0,0 +1,71 @@
+"test_dstar.py - D* Lite plan costs against Dijkstra while agent, target and grid change."
+
+import random
+
+import pytest
+
+# project
+import dijkstra
+import dstar
+import grid
+
+PROFILES = [({".": 1.0, "+": 1.0, "#": 99}, ("#",)), ({".": 1.0, "+": 1.0, "#": 99}, ())]
+
+
+@pytest.mark.parametrize("costs, impassable", PROFILES)
+def test_chase_costs_match_dijkstra(dungeon, pairs, costs, impassable):
+    G = dungeon.grid
+    ys, xs = G.mask(["."]).nonzero()
+    cells = list(zip(ys.tolist(), xs.tolist()))
+    rng = random.Random(3)
+    for me, you in pairs[:8]:
+        planner = dstar.DStarLite(G, costs, impassable, me, you)
+        for turn in range(30):
+            if turn % 5 == 2:
+                G[rng.choice(cells)] = rng.choice(".#")
+            step = planner.next_step(me, you)
+            # nobody can step onto a wall, but one may be written under either of them
+            if G[me] not in impassable and G[you] not in impassable:
+                exact = dijkstra.DistanceMap(G, costs, impassable).compute([you])[me]
+                assert planner.cost_to_goal() == pytest.approx(exact)
+                path = planner.path()
+                if path:
+                    assert sum(costs[G[p]] for p in path) == pytest.approx(exact)
+                else:
+                    assert exact in (0.0, float("inf"))
+            if step is not None and step != you:
+                me = step
+            you = rng.choice([c for c in G.neighbors(you) if G[c] == "."] or [you])
+
+
+def test_wall_written_on_the_plan_cuts_it():
+    G = grid.ArrayGrid(7, 12, ".")
+    G[3, 0:12] = "#"
+    G[3, 6] = "."
+    costs = {".": 1.0, "#": 99}
+    planner = dstar.DStarLite(G, costs, ["#"], (1, 1), (5, 10))
+    planner.next_step()
+    assert (3, 6) in planner.path()
+    G[3, 6] = "#"
+    assert planner.next_step() is None
+    assert planner.cost_to_goal() == float("inf")
+
+
+def test_list_grid_plans_like_array_grid(dungeon, pairs):
+    A = dungeon.grid
+    L = grid.Grid(A.height, A.width)
+    L.data = [list(row) for row in str(A).split("\n")]
+    costs = {".": 1.0, "+": 1.0, "#": 99}
+    rng = random.Random(4)
+    for me, you in pairs[:4]:
+        planners = [dstar.DStarLite(G, costs, ["#"], me, you) for G in (A, L)]
+        for turn in range(20):
+            if turn % 4 == 1:
+                loc, tile = rng.choice(pairs)[0], rng.choice(".#")
+                A[loc] = L[loc] = tile
+            steps = [p.next_step(me, you) for p in planners]
+            assert steps[0] == steps[1]
+            assert planners[0].cost_to_goal() == planners[1].cost_to_goal()
+            if steps[0] is not None and steps[0] != you:
+                me = steps[0]
+            you = rng.choice([c for c in A.neighbors(you) if A[c] == "."] or [you])
@@ -0,0 +1,27 @@
+"test_dungeon_gen.py - Seeded dungeons are the same ones the anytree version made."
+
+import hashlib
+import random
+
+import pytest
+
+# project
+from dungeon_gen import DungeonGenerator
+
+# sha1 of the map, the rooms and the next random() after generating, taken
+# with the anytree-based generator this replaced
+EXPECTED = [
+    ((0, 60, 30, 8), "58d1a4d3bdb73c6637bc67d71ec19247ad6c87bc"),
+    ((1, 80, 40, 16), "efcec361c42b5e5563203c462342862da4484947"),
+    ((2, 200, 200, 64), "b1be2322fa8a0862498fdc4cf46f672ddc0ed7fb"),
+    ((3, 40, 20, 2), "17c100dc05cc5676a2ba9311eee9e6aa8dc8cd14"),
+]
+
+
+@pytest.mark.parametrize("case, digest", EXPECTED)
+def test_seeded_dungeon_unchanged(case, digest):
+    seed, width, height, num_rooms = case
+    random.seed(seed)
+    D = DungeonGenerator(width=width, height=height, num_rooms=num_rooms)
+    state = str(D.grid) + repr(D.rooms) + repr(random.random())
+    assert hashlib.sha1(state.encode()).hexdigest() == digest
@@ -0,0 +1,118 @@
+"test_fov.py - ArrayFOV, FOVMask and the shared tables against FOVMap as it was."
+
+import random
+
+import pytest
+
+# project
+import fov
+
+
+def fov_map(G):
+    blocks = G.layer("blocks_vision")
+    W, H = G.width, G.height
+    return fov.FOVMap(W, H, lambda x, y: not (0 <= x < W and 0 <= y < H) or blocks[y, x])
+
+
+@pytest.fixture
+def origins(dungeon):
+    ys, xs = dungeon.grid.layer("passable").nonzero()
+    return random.Random(0).sample(list(zip(ys.tolist(), xs.tolist())), 30)
+
+
+@pytest.mark.parametrize("radius", [1, 2, 4, 8, 16, 40])
+def test_array_fov_matches_fov_list(dungeon, origins, radius):
+    G = dungeon.grid
+    old, new = fov_map(G), fov.ArrayFOV.from_grid(G)
+    for y, x in origins:
+        want = {(y, x) for x, y in old.FOVList(x, y, radius)}
+        got = set(zip(*(a.tolist() for a in new.compute((y, x), radius).nonzero())))
+        assert got == want
+
+
+def test_array_fov_follows_writes(dungeon, origins):
+    G = dungeon.grid
+    new = fov.ArrayFOV.from_grid(G)
+    for y, x in origins[:10]:
+        G[y, x] = "#"
+    old = fov_map(G)
+    for y, x in origins[10:]:
+        want = {(y, x) for x, y in old.FOVList(x, y, 8)}
+        assert set(zip(*(a.tolist() for a in new.compute((y, x), 8).nonzero()))) == want
+
+
+def test_line_of_sight_exact_matches_los_exists(dungeon):
+    G = dungeon.grid
+    H, W = G.height, G.width
+    rng = random.Random(0)
+    ys, xs = G.layer("passable").nonzero()
+    cells = list(zip(ys.tolist(), xs.tolist()))
+    sources, targets = [], []
+    for _ in range(2000):
+        y, x = rng.choice(cells)
+        sources.append((y, x))
+        # some targets off the map, which are never seen
+        targets.append((y + rng.randint(-20, 20), x + rng.randint(-20, 20)))
+    old = fov_map(G)
+    want = [0 <= ty < H and 0 <= tx < W and bool(old.LOSExists(x, y, tx, ty))
+            for (y, x), (ty, tx) in zip(sources, targets)]
+    assert fov.LineOfSight.from_grid(G).check(sources, targets, exact=True).tolist() == want
+
+
+def random_cells(rng, y, x, n):
+    return {(y + rng.randrange(12), x + rng.randrange(15)) for _ in range(n)}
+
+
+def test_mask_operators_match_sets():
+    rng = random.Random(3)
+    for _ in range(200):
+        # overlapping, disjoint and empty boxes
+        a = random_cells(rng, rng.randrange(20), rng.randrange(20), rng.randrange(0, 40))
+        b = random_cells(rng, rng.randrange(20), rng.randrange(20), rng.randrange(0, 40))
+        A, B = fov.FOVMask.from_cells(a), fov.FOVMask.from_cells(b)
+        assert set(A) == a and len(A) == len(a) and bool(A) == bool(a)
+        assert set(A | B) == a | b
+        assert set(A & B) == a & b
+        assert set(A ^ B) == a ^ b
+        assert set(A - B) == a - b
+        shown, hidden = A.diff(B)
+        assert (set(shown), set(hidden)) == (b - a, a - b)
+        assert (A == B) == (a == b)
+        assert all(loc in A for loc in a) and not any(loc in A for loc in b - a)
+
+
+class OldFOVMap(fov.FOVMap):
+    """FOVMap with its own slope table built the way __init__ used to, for more rows"""
+
+    def __init__(self, width, height, blocked_function, rows):
+        super().__init__(width, height, blocked_function)
+        self.slopes = [[((i + 0.5) / (j - 0.5), (i - 0.5) / (j + 0.5)) for i in range(j + 2)]
+                       for j in range(rows)]
+
+
+def test_radius_past_the_old_table():
+    # the old table stopped at row 81
+    rng = random.Random(4)
+    W = H = 260
+    blocks = {(rng.randrange(W), rng.randrange(H)) for _ in range(300)}
+    blocked = lambda x, y: not (0 <= x < W and 0 <= y < H) or (x, y) in blocks
+    radius = 120
+    old, new = OldFOVMap(W, H, blocked, W + H), fov.FOVMap(W, H, blocked)
+    for x, y in [(130, 130), (20, 240), (200, 60)]:
+        assert set(new.FOVList(x, y, radius)) == set(old.FOVList(x, y, radius))
+        radius_squared = (radius + 0.5) ** 2
+        assert set(new.Ball(x, y, radius, ignore_walls=True)) == {
+            (i, j) for i in range(W) for j in range(H) if (x - i) ** 2 + (y - j) ** 2 <= radius_squared}
+        for _ in range(20):
+            X, Y = rng.randrange(W), rng.randrange(H)
+            assert new.LOSExists(x, y, X, Y) == old.LOSExists(x, y, X, Y)
+    # smaller radii read the grown table
+    assert set(new.FOVList(130, 130, 30)) == set(OldFOVMap(W, H, blocked, 82).FOVList(130, 130, 30))
+
+
+def test_cached_discs_are_capped():
+    for radius in range(fov.TABLE_CACHE + 10):
+        fov.disc(radius)
+        fov.row_limits(radius)
+    assert len(fov._discs) <= fov.TABLE_CACHE and len(fov._limits) <= fov.TABLE_CACHE
+    assert fov.disc(3).sum() == 37
@@ -0,0 +1,129 @@
+"test_fovalgos.py - Symmetry, and the permissive view against a brute-force line search."
+
+from fractions import Fraction
+import random
+
+import pytest
+
+# project
+import fov
+import fovalgos
+
+
+@pytest.fixture(params=[0.0, 0.1, 0.3])
+def pillars(request, dungeon):
+    """(blocked(x, y), floor cells) of the dungeon with pillars on some of its floor"""
+    G = dungeon.grid
+    W, H = G.width, G.height
+    blocks = G.layer("blocks_vision").copy()
+    ys, xs = G.layer("passable").nonzero()
+    cells = list(zip(xs.tolist(), ys.tolist()))
+    rng = random.Random(5)
+    for x, y in rng.sample(cells, int(request.param * len(cells))):
+        blocks[y, x] = True
+    floor = [(x, y) for x, y in cells if not blocks[y, x]]
+    return (lambda x, y: not (0 <= x < W and 0 <= y < H) or bool(blocks[y, x])), floor
+
+
+def clip(p, d, square):
+    """[t0, t1] where p + t * d lies in the closed square, t0 > t1 if it misses"""
+    X, Y = square
+    t0, t1 = Fraction(-10**9), Fraction(10**9)
+    for step, room in ((-d[0], p[0] - X), (d[0], X + 1 - p[0]), (-d[1], p[1] - Y), (d[1], Y + 1 - p[1])):
+        if step == 0:
+            if room < 0:
+                return 1, 0
+        elif step < 0:
+            t0 = max(t0, Fraction(room, step))
+        else:
+            t1 = min(t1, Fraction(room, step))
+    return t0, t1
+
+
+def line_exists(a, b, blocked):
+    """Is there a line from square a to square b that stays out of the walls?
+
+    Walls that share an edge are one solid block, so a line may graze a
+    corner but not run along that edge.  If there is a line, there is one
+    through two corners of a, b or the walls between them, so only those
+    lines are tried.
+    """
+    xs, ys = sorted((a[0], b[0])), sorted((a[1], b[1]))
+    walls = [(X, Y) for X in range(xs[0], xs[1] + 1) for Y in range(ys[0], ys[1] + 1)
+             if (X, Y) not in (a, b) and blocked(X, Y)]
+    corners = sorted({(X + i, Y + j) for X, Y in walls + [a, b] for i in (0, 1) for j in (0, 1)})
+    for n, p in enumerate(corners):
+        for e in corners[n + 1:]:
+            d = (e[0] - p[0], e[1] - p[1])
+            (a0, a1), (b0, b1) = clip(p, d, a), clip(p, d, b)
+            if a0 > a1 or b0 > b1:
+                continue
+            # the stretch of the line between the two squares
+            s, t = (a1, b0) if a1 <= b0 else (b1, a0)
+            if s < t and (runs_through(p, d, s, t, walls) or runs_along(p, d, s, t, blocked)):
+                continue
+            return True
+    return False
+
+
+def runs_through(p, d, s, t, walls):
+    """Does p + [s, t] * d pass through the inside of one of the walls?"""
+    for wall in walls:
+        w0, w1 = clip(p, d, wall)
+        lo, hi = max(w0, s), min(w1, t)
+        mid = (lo + hi) / 2
+        if lo < hi and all(v < p[k] + mid * d[k] < v + 1 for k, v in enumerate(wall)):
+            return True
+    return False
+
+
+def runs_along(p, d, s, t, blocked):
+    """Does p + [s, t] * d run along an edge between two walls?"""
+    for k in (0, 1):
+        if d[k] != 0:
+            continue
+        # the line is x = p[0] (k = 0) or y = p[1], between the rows or
+        # columns p[k] - 1 and p[k]
+        lo, hi = sorted((p[1 - k] + s * d[1 - k], p[1 - k] + t * d[1 - k]))
+        for v in range(int(lo), -int(-hi)):
+            near, far = [p[k], v], [p[k] - 1, v]
+            if k:
+                near.reverse()
+                far.reverse()
+            if blocked(*near) and blocked(*far):
+                return True
+    return False
+
+
+@pytest.mark.parametrize("name", ["symmetric", "permissive"])
+def test_views_are_symmetric(dungeon, pillars, name):
+    blocked, floor = pillars
+    engine = fovalgos.make(name, dungeon.grid.width, dungeon.grid.height, blocked)
+    for x, y in random.Random(6).sample(floor, 15):
+        for radius in (4, 9):
+            for X, Y in list(engine.FOVList(x, y, radius)):
+                if not blocked(X, Y):
+                    assert (x, y) in engine.FOVList(X, Y, radius), ((x, y), (X, Y))
+
+
+def test_permissive_sees_what_shadowcast_sees(dungeon, pillars):
+    blocked, floor = pillars
+    W, H = dungeon.grid.width, dungeon.grid.height
+    shadow, permissive = fov.FOVMap(W, H, blocked), fovalgos.make("permissive", W, H, blocked)
+    for x, y in random.Random(7).sample(floor, 40):
+        missed = set(shadow.FOVList(x, y, 8)) - set(permissive.FOVList(x, y, 8))
+        # all shadowcast leaks past a wall in the same row
+        assert not any(line_exists((x, y), cell, blocked) for cell in missed)
+
+
+def test_permissive_matches_line_search(dungeon, pillars):
+    blocked, floor = pillars
+    engine = fovalgos.make("permissive", dungeon.grid.width, dungeon.grid.height, blocked)
+    radius = 4
+    for x, y in random.Random(8).sample(floor, 3):
+        seen = set(engine.FOVList(x, y, radius))
+        for X in range(x - radius, x + radius + 1):
+            for Y in range(y - radius, y + radius + 1):
+                if (X - x) ** 2 + (Y - y) ** 2 <= radius * radius + radius and \
+                        0 <= X < dungeon.grid.width and 0 <= Y < dungeon.grid.height:
+                    assert ((X, Y) in seen) == line_exists((x, y), (X, Y), blocked), (x, y, X, Y)
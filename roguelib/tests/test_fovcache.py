@@ -0,0 +1,54 @@
+"test_fovcache.py - FOVCache invalidation and results against fresh FOV computations."
+
+import random
+
+# project
+import fov
+import fovcache
+
+
+def fov_map(G):
+    blocks = G.layer("blocks_vision")
+    W, H = G.width, G.height
+    return fov.FOVMap(W, H, lambda x, y: not (0 <= x < W and 0 <= y < H) or blocks[y, x])
+
+
+def floor_cells(G, n, seed):
+    ys, xs = G.layer("passable").nonzero()
+    return random.Random(seed).sample(list(zip(ys.tolist(), xs.tolist())), n)
+
+
+def test_write_drops_exactly_the_discs_it_reaches(dungeon):
+    G = dungeon.grid
+    cache = fovcache.FOVCache(G, fov.ArrayFOV.from_grid(G))
+    keys = [(loc, radius) for loc in floor_cells(G, 40, 0) for radius in (2, 5, 9)]
+    for loc, radius in keys:
+        cache.mask(loc, radius)
+    wy, wx = floor_cells(G, 1, 1)[0]
+    G[wy, wx] = "#"
+    cache.mask(*keys[0])  # catches the cache up
+    reached = {(loc, r) for loc, r in keys
+               if (loc[0] - wy) ** 2 + (loc[1] - wx) ** 2 <= r * r + r}
+    assert cache.stats()["invalidations"] == len(reached)
+    left = {(loc, r) for _, loc, r in cache.entries}
+    assert left == (set(keys) - reached) | {keys[0]}
+    fresh = fov.ArrayFOV.from_grid(G)
+    for _, loc, radius in list(cache.entries):
+        fresh.compute(loc, radius)
+        assert cache.mask(loc, radius) == fresh.mask()
+
+
+def test_cached_fov_lists_match_fresh_ones(dungeon):
+    G = dungeon.grid
+    cache = fovcache.FOVCache(G, fov_map(G), max_entries=20)
+    rng = random.Random(2)
+    origins = floor_cells(G, 30, 3)
+    for turn in range(200):
+        y, x = rng.choice(origins)
+        radius = rng.choice((3, 6))
+        assert set(cache.FOVList(x, y, radius)) == set(fov_map(G).FOVList(x, y, radius))
+        if turn % 10 == 0:
+            wy, wx = rng.choice(origins)
+            G[wy, wx] = rng.choice(".#")
+    stats = cache.stats()
+    assert stats["hits"] and stats["evictions"] and stats["invalidations"]
@@ -0,0 +1,129 @@
+"test_grid.py - ArrayGrid views, layers and journal, and ChunkedGrid against an ArrayGrid."
+
+# stdlib
+import random
+
+import numpy as np
+import pytest
+
+# project
+import grid
+
+
+def random_writes(G, A, n, seed):
+    rng = random.Random(seed)
+    for _ in range(n):
+        y, x = rng.randrange(G.height), rng.randrange(G.width)
+        h, w = rng.randint(1, 20), rng.randint(1, 20)
+        tile = rng.choice(".+~#")
+        G[y:y + h, x:x + w] = tile
+        A[y:y + h, x:x + w] = tile
+
+
+def test_chunks_allocated_on_first_write():
+    C = grid.ChunkedGrid(1000, 1000, "#", chunk_size=32)
+    assert C.nbytes == 0
+    C[5, 5] = "#"  # the fill tile over an untouched chunk
+    assert C.nbytes == 0
+    C[40:42, 30:34] = "."
+    assert sorted(C.chunks) == [(1, 0), (1, 1)]
+    assert C.nbytes == 2 * 32 * 32
+    assert C[41, 31] == "." and C[0, 0] == "#" and C[999, 999] == "#"
+
+
+def test_paged_chunks_read_and_write_back(tmp_path):
+    C = grid.ChunkedGrid(200, 300, "#", chunk_size=16, swap_path=str(tmp_path / "swap"),
+                         max_resident=3)
+    A = grid.ArrayGrid(200, 300, "#")
+    random_writes(C, A, 60, seed=2)
+    assert len(C.chunks) == 3 and C.paged
+    assert str(C) == str(A)
+    assert len(C.chunks) == 3
+    # writing into a paged chunk brings it back and pages another out
+    key = next(iter(C.paged))
+    y, x = key[0] * 16, key[1] * 16
+    C[y, x] = A[y, x] = "+"
+    assert key in C.chunks and key not in C.paged
+    assert len(C.chunks) == 3
+    random_writes(C, A, 30, seed=3)
+    assert str(C) == str(A)
+    assert np.array_equal(C[10:150, 20:280].tiles, C.read(10, 150, 20, 280))
+    assert str(C[10:150, 20:280]) == str(A[10:150, 20:280])
+
+
+def test_whole_map_layers_need_a_window():
+    C = grid.ChunkedGrid(4000, 4000, ".", chunk_size=64)
+    C[2000:2010, 2000:2010] = "#"
+    with pytest.raises(ValueError):
+        C.mask(["#"])
+    window = C[1990:2020, 1990:2020]
+    assert window.mask(["#"]).sum() == 100
+    assert window.cost_layer({".": 1.0, "#": 5.0}).sum() == 800 + 500
+    assert len(C.chunks) == 1
+
+
+def test_views_share_storage():
+    A = grid.ArrayGrid(20, 30, "#")
+    V = A[2:12, 5:25]
+    W = V[1:9:2, 3:15]
+    assert np.shares_memory(A.tiles, V.tiles) and np.shares_memory(A.tiles, W.tiles)
+    W[0:2, 0:4] = "."
+    assert all(A[y, x] == "." for y in (3, 5) for x in range(8, 12))
+    A[3, 8] = "+"
+    assert V[1, 3] == "+" and W[0, 0] == "+"
+    # a row index on a view still gives a one-row grid
+    assert V[4, 0:5].tiles.shape == (1, 5)
+    # slice writes agree with the list-of-lists Grid
+    L = grid.Grid(20, 30, "#")
+    L[3:4, 8:12] = L[5:6, 8:12] = "."
+    L[3, 8] = "+"
+    assert str(A) == str(L)
+    assert A.palette.tiles[:2] == ["#", "."]
+
+
+def test_cached_layers_follow_writes():
+    A = grid.ArrayGrid(30, 40, ".")
+    V = A[5:25, 10:30]
+    costs = {".": 1.0, "~": 3.0}
+    held = [A.layer("passable"), A.layer("blocks_vision"), A.cost_layer(), A.cost_layer(costs, 9.0),
+            V.layer("passable")]
+    random_writes(V, A[5:25, 10:30], 40, seed=4)
+    # through views, and a tile the palette has not seen yet
+    V[2:6, 3:8] = "#"
+    V[0:20:3, 1:15:2][1:4, 2:5] = "~"
+    A[7:9, 0:40] = "%"
+    fresh = grid.ArrayGrid.from_array(A.tiles.copy(), A.palette)
+    want = [fresh.layer("passable"), fresh.layer("blocks_vision"), fresh.cost_layer(),
+            fresh.cost_layer(costs, 9.0), fresh.layer("passable")[5:25, 10:30]]
+    for got, expected in zip(held, want):
+        assert np.array_equal(got, expected)
+    assert held[3][8, 0] == 9.0 and not held[0][8, 0]
+
+
+@pytest.mark.parametrize("make", [grid.Grid, grid.ArrayGrid, grid.ChunkedGrid])
+def test_writes_bump_version_and_record_rects(make):
+    G = make(20, 30, "#")
+    cursor = grid.ChangeCursor(G)
+    assert G.version == 0 and cursor.drain() == []
+    G[3, 4] = "."
+    G[5:7, 2:9] = "."
+    assert G.version == 2
+    assert cursor.drain() == [(3, 4, 4, 5), (5, 7, 2, 9)]
+    assert cursor.drain() == [] and G.changes_since(1) == [(5, 7, 2, 9)]
+
+
+def test_view_writes_land_in_root_coordinates():
+    A = grid.ArrayGrid(20, 30, "#")
+    A.journal = grid.Journal(max_entries=3)
+    cursor = grid.ChangeCursor(A)
+    V = A[4:16, 6:26]
+    V[1, 2] = "."
+    V[2:10:3, 0:20:5] = "."
+    V[-1, -1] = "."
+    assert A.version == V.version == 3
+    # the bounding rect of a strided write
+    assert cursor.drain() == [(5, 6, 8, 9), (6, 13, 6, 22), (15, 16, 25, 26)]
+    A[0, 0] = "."
+    # the log only holds three writes, so version 0 is too far back
+    assert A.changes_since(0) is None
+    assert A.changes_since(1) == [(6, 13, 6, 22), (15, 16, 25, 26), (0, 1, 0, 1)]
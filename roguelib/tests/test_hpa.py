@@ -0,0 +1,39 @@
+"test_hpa.py - RoomGraph paths against Dijkstra, before and after grid writes."
+
+import random
+
+# project
+import dijkstra
+import hpa
+
+
+def check_optimal(G, rooms, pairs):
+    for s, g in pairs:
+        exact = dijkstra.DistanceMap(G, impassable=["#"]).compute([g])[s]
+        path = rooms.path(s, g)
+        if s == g or exact == float("inf"):
+            assert path == []
+            continue
+        assert all(max(abs(a[0] - b[0]), abs(a[1] - b[1])) == 1 for a, b in zip([s] + path, path))
+        assert path[-1] == g
+        assert sum(G.cost_layer()[p] for p in path) == exact
+
+
+def edges(rooms):
+    return sorted((d, sorted(e)) for d, e in rooms.edges.items())
+
+
+def test_paths_are_optimal(dungeon, pairs):
+    check_optimal(dungeon.grid, hpa.RoomGraph.from_dungeon(dungeon), pairs)
+
+
+def test_update_matches_fresh_build(dungeon, pairs):
+    G = dungeon.grid
+    rooms = hpa.RoomGraph.from_dungeon(dungeon)
+    rng = random.Random(2)
+    for _ in range(20):
+        y, x = rng.randrange(1, G.height - 1), rng.randrange(1, G.width - 1)
+        G[y, x] = rng.choice(".#+")
+        rooms.update()
+        assert edges(rooms) == edges(hpa.RoomGraph(G))
+    check_optimal(G, rooms, pairs)
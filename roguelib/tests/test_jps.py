@@ -0,0 +1,34 @@
+"test_jps.py - JPS and JPS+ path costs against Dijkstra."
+
+# project
+import astar
+import dijkstra
+import jps
+
+COSTS, IMPASSABLE = {".": 1.0, "+": 1.0, "#": 99}, ["#"]
+
+
+def check_optimal(G, pairs, **kw):
+    for s, g in pairs:
+        exact = dijkstra.DistanceMap(G, COSTS, IMPASSABLE).compute([g])[s]
+        came_from, cost = jps.jump_point_search(COSTS, IMPASSABLE, G, s, g, max_length=10**9, **kw)
+        assert cost.get(g, float("inf")) == exact
+        if exact < float("inf") and s != g:
+            path = astar.reconstruct_path(came_from, s, g)
+            assert len(path) == exact and all(G[p] not in IMPASSABLE for p in path)
+
+
+def test_jps_costs_are_optimal(dungeon, pairs):
+    check_optimal(dungeon.grid, pairs)
+
+
+def test_jps_plus_costs_are_optimal(dungeon, pairs):
+    check_optimal(dungeon.grid, pairs, plus=True)
+
+
+def test_jps_plus_tables_follow_writes(dungeon, pairs):
+    G = dungeon.grid
+    check_optimal(G, pairs[:5], plus=True)
+    for s, g in pairs[:10]:
+        G[s] = "#"
+    check_optimal(G, pairs[10:], plus=True)
@@ -0,0 +1,33 @@
+"test_landmarks.py - The ALT heuristic is admissible and A* with it stays optimal."
+
+import numpy as np
+import pytest
+
+# project
+import astar
+import dijkstra
+import landmarks
+
+PROFILES = [{".": 1.0, "#": 99, "+": 0}, {".": 1.0, "#": 99, "+": 1.0}]
+
+
+@pytest.mark.parametrize("costs", PROFILES)
+def test_heuristic_is_admissible(dungeon, pairs, costs):
+    G = dungeon.grid
+    L = landmarks.Landmarks.from_dungeon(dungeon, costs, k=8)
+    for _, g in pairs[:10]:
+        exact = dijkstra.DistanceMap(G, costs).compute([g]).dist.reshape(-1)
+        assert (np.asarray(L.table(g)) <= exact).all()
+
+
+@pytest.mark.parametrize("costs", PROFILES)
+def test_astar_costs_are_optimal(dungeon, pairs, costs):
+    G = dungeon.grid
+    L = landmarks.Landmarks.from_dungeon(dungeon, costs, k=8)
+    engine = astar.GridAStar(G)
+    for s, g in pairs:
+        exact = dijkstra.DistanceMap(G, costs).compute([g])[s]
+        _, cost = astar.a_star_search(costs, [], G, s, g, max_length=10**9, heuristic=L)
+        assert cost[g] == exact
+        path = engine.search(costs, [], s, g, max_length=10**9, heuristic=L.table(g))
+        assert sum(costs[G[p]] for p in path) == exact
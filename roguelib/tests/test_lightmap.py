@@ -0,0 +1,46 @@
+"test_lightmap.py - LightMap kept up incrementally against one built from scratch."
+
+import random
+
+import numpy as np
+
+# project
+import lightmap
+
+
+def test_incremental_light_matches_fresh_map(dungeon):
+    G = dungeon.grid
+    ys, xs = G.layer("passable").nonzero()
+    cells = list(zip(ys.tolist(), xs.tolist()))
+    rng = random.Random(4)
+    lights = lightmap.LightMap(G)
+    placed = {}
+    for turn in range(150):
+        action = rng.random()
+        if action < 0.3 or not placed:
+            loc, radius, intensity = rng.choice(cells), rng.randint(1, 8), rng.randint(10, 200)
+            placed[lights.add(loc, radius, intensity)] = [loc, radius, intensity]
+        elif action < 0.6:
+            key = rng.choice(list(placed))
+            placed[key][0] = rng.choice(cells)
+            lights.move(key, placed[key][0])
+        elif action < 0.7:
+            key = rng.choice(list(placed))
+            placed[key][1:] = [rng.randint(1, 8), rng.randint(10, 200)]
+            lights.change(key, *placed[key][1:])
+        elif action < 0.8:
+            key = rng.choice(list(placed))
+            lights.remove(key)
+            del placed[key]
+        else:
+            y, x = rng.choice(cells)
+            G[y, x] = rng.choice("#+.")
+            lights.update()
+        if turn % 10 == 0:
+            fresh = lightmap.LightMap(G)
+            for loc, radius, intensity in placed.values():
+                fresh.add(loc, radius, intensity)
+            assert np.array_equal(lights.light, fresh.light)
+    for key in list(placed):
+        lights.remove(key)
+    assert not lights.light.any()
@@ -0,0 +1,78 @@
+"test_mapfile.py - save/load round trips."
+
+import pytest
+
+# project
+import grid
+import mapfile
+
+
+def test_round_trip(tmp_path, dungeon):
+    path = str(tmp_path / "level.rlib")
+    mapfile.save(path, dungeon.grid, dungeon.rooms)
+    G, rooms = mapfile.load(path)
+    assert str(G) == str(dungeon.grid)
+    assert [repr(r) for r in rooms] == [repr(r) for r in dungeon.rooms]
+
+
+def test_archive_round_trip(tmp_path, dungeon):
+    path = str(tmp_path / "levels.rlib")
+    other = grid.ArrayGrid(5, 7, ".")
+    mapfile.save_archive(path, [(dungeon.grid, dungeon.rooms), (other, [])])
+    archive = mapfile.MapArchive(path)
+    assert len(archive) == 2
+    assert str(archive[0][0]) == str(dungeon.grid)
+    assert str(archive[1][0]) == str(other) and archive[1][1] == []
+
+
+def test_write_back_known_tile(tmp_path, dungeon):
+    path = str(tmp_path / "level.rlib")
+    mapfile.save(path, dungeon.grid, dungeon.rooms)
+    G, _ = mapfile.load(path, "r+")
+    G[1, 1] = "."
+    del G
+    H, _ = mapfile.load(path)
+    assert H[1, 1] == "."
+
+
+def test_write_back_new_tile_refused(tmp_path, dungeon):
+    path = str(tmp_path / "level.rlib")
+    mapfile.save(path, dungeon.grid, dungeon.rooms)
+    G, _ = mapfile.load(path, "r+")
+    before = G[2, 2]
+    with pytest.raises(ValueError):
+        G[2, 2] = "X"
+    assert G[2, 2] == before
+    del G
+    H, _ = mapfile.load(path)
+    assert str(H) == str(dungeon.grid)
+
+
+def test_close_unmaps(tmp_path, dungeon):
+    path = str(tmp_path / "level.rlib")
+    mapfile.save(path, dungeon.grid, dungeon.rooms)
+    with mapfile.load(path, "r+") as level:
+        level.grid[1, 1] = "."
+        buf = level.buf
+    assert buf.closed and level.grid is None
+    level = mapfile.load(path)
+    G, rooms = level
+    view = G[0:5, 0:5]
+    del G
+    # the view still reads the mapping
+    with pytest.raises(BufferError):
+        level.close()
+    del view
+    level.close()
+    assert level.buf.closed
+    level.close()
+    with mapfile.load(path) as level:
+        assert level.grid[1, 1] == "."
+
+
+def test_archive_close(tmp_path, dungeon):
+    path = str(tmp_path / "levels.rlib")
+    mapfile.save_archive(path, [(dungeon.grid, dungeon.rooms), (grid.ArrayGrid(5, 7, "."), [])])
+    with mapfile.MapArchive(path) as archive:
+        assert [str(G) for G, _ in archive][0] == str(dungeon.grid)
+    assert archive.buf.closed
@@ -0,0 +1,60 @@
+"test_pathcache.py - PathCache hits, repairs and evictions against fresh searches."
+
+# project
+import astar
+import pathcache
+
+MONSTER_COSTS = {".": 1.0, "#": 99, "+": 0}
+
+
+def walkable(G, start, goal, path, max_length):
+    cells = [start] + path
+    steps_ok = all(max(abs(a[0] - b[0]), abs(a[1] - b[1])) == 1 for a, b in zip(cells, cells[1:]))
+    cost = sum(MONSTER_COSTS[G[p]] for p in path)
+    return steps_ok and cells[-1] == goal and cost <= max_length
+
+
+def test_walking_along_a_path_trims_the_prefix(dungeon, pairs):
+    G = dungeon.grid
+    cache = pathcache.PathCache(G)
+    for s, g in pairs:
+        path = cache.path(MONSTER_COSTS, [], s, g, max_length=999)
+        if len(path) < 3:
+            continue
+        before = cache.stats()
+        assert cache.path(MONSTER_COSTS, [], path[1], g, max_length=999) == path[2:]
+        assert cache.stats()["repairs"] == before["repairs"] + 1
+        assert cache.stats()["misses"] == before["misses"]
+        assert cache.path(MONSTER_COSTS, [], s, g, max_length=999) == path
+        assert cache.stats()["hits"] == before["hits"] + 1
+
+
+def test_least_recently_used_entry_is_evicted(dungeon, pairs):
+    G = dungeon.grid
+    cache = pathcache.PathCache(G, max_entries=3)
+    (a, b, c, d) = [(s, g) for s, g in pairs if s != g][:4]
+    for s, g in (a, b, c, a, d):
+        cache.path(MONSTER_COSTS, [], s, g, max_length=999)
+    assert cache.stats()["evictions"] == 1
+    starts = {key[:2] for key in cache.entries}
+    assert starts == {a, c, d}
+    assert sum(len(keys) for keys in cache.by_goal.values()) == 3
+
+
+def test_repairs_after_writes_stay_walkable(dungeon, pairs):
+    G = dungeon.grid
+    cache = pathcache.PathCache(G)
+    fresh = pathcache.PathCache(G, max_repairs=0)
+    paths = {(s, g): cache.path(MONSTER_COSTS, [], s, g, max_length=999) for s, g in pairs}
+    for n, ((s, g), path) in enumerate(paths.items()):
+        if len(path) > 4:
+            y, x = path[len(path) // 2]
+            G[y, x] = "#" if n % 2 else "+"
+    for (s, g), path in paths.items():
+        # the agent has taken the first step
+        start = path[0] if len(path) > 1 else s
+        repaired = cache.path(MONSTER_COSTS, [], start, g, max_length=999)
+        assert walkable(G, start, g, repaired, 999)
+        expected = astar.a_star_path(MONSTER_COSTS, [], G, start, g, max_length=999)
+        assert fresh.path(MONSTER_COSTS, [], start, g, max_length=999) == expected
+    assert cache.stats()["repairs"] > 0
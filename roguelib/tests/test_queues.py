@@ -0,0 +1,43 @@
+"test_queues.py - The queues.py queues give the searches the same costs as PriorityQueue."
+
+import pytest
+
+# project
+import astar
+import dijkstra
+import queues
+
+# whole numbers >= 1: the integer queues apply and Chebyshev distance is consistent
+WALKER_COSTS = {".": 1.0, "#": 99, "+": 2}
+
+
+@pytest.mark.parametrize("queue", [queues.BucketQueue, queues.IndexedHeap])
+def test_a_star_costs_match_priority_queue(dungeon, pairs, queue):
+    G = dungeon.grid
+    for s, g in pairs:
+        _, expected = astar.a_star_search(WALKER_COSTS, [], G, s, g, max_length=10**9,
+                                          heuristic=astar.chebyshev)
+        _, cost = astar.a_star_search(WALKER_COSTS, [], G, s, g, max_length=10**9,
+                                      queue=queue, heuristic=astar.chebyshev)
+        assert cost[g] == expected[g]
+
+
+@pytest.mark.parametrize("queue", [queues.BucketQueue, queues.RadixHeap, queues.IndexedHeap])
+def test_distance_map_matches_heap(dungeon, pairs, queue):
+    G = dungeon.grid
+    goals = [g for _, g in pairs[:3]]
+    expected = dijkstra.DistanceMap(G, WALKER_COSTS).compute(goals)
+    chase = dijkstra.DistanceMap(G, WALKER_COSTS, queue=queue).compute(goals)
+    assert (chase.dist == expected.dist).all()
+
+
+def test_radix_heap_rejects_priorities_below_the_last_popped():
+    q = queues.RadixHeap()
+    q.put("a", 5)
+    q.put("b", 9)
+    assert q.get() == "a"
+    q.put("c", 5)
+    with pytest.raises(ValueError):
+        q.put("d", 4)
+    with pytest.raises(ValueError):
+        queues.BucketQueue().put("e", 1.5)
@@ -0,0 +1,52 @@
+"test_tilememory.py - TileMemory bit packing against a plain bool array."
+
+import random
+
+import numpy as np
+import pytest
+
+# project
+import fov
+import grid
+import tilememory
+
+
+@pytest.mark.parametrize("width", [1, 7, 8, 9, 13, 17, 63, 65])
+def test_packed_memory_matches_bool_array(width):
+    height = 6
+    rng = random.Random(width)
+    memory = tilememory.TileMemory(height, width)
+    other = tilememory.TileMemory(height, width)
+    seen = np.zeros((height, width), dtype=bool)
+    for turn in range(40):
+        # boxes that start before, straddle and run past the map edges
+        y, x = rng.randrange(-3, height), rng.randrange(-9, width)
+        h, w = rng.randint(1, 5), rng.randint(1, 19)
+        bits = np.array([[rng.random() < 0.5 for _ in range(w)] for _ in range(h)])
+        padded = np.zeros((height + 16, width + 48), dtype=bool)
+        padded[y + 8 : y + 8 + h, x + 24 : x + 24 + w] = bits
+        seen |= padded[8 : 8 + height, 24 : 24 + width]
+        if turn % 4:
+            memory.remember(fov.FOVMask(bits, y, x))
+        else:
+            # learned through another faction's memory
+            other.remember(fov.FOVMask(bits, y, x))
+            memory.merge(other)
+            other.clear()
+    assert np.array_equal(memory.viewport(), seen)
+    assert len(memory) == seen.sum()
+    assert all((y, x) in memory for y, x in zip(*seen.nonzero()))
+    assert (0, width) not in memory and (-1, 0) not in memory
+    # every padding bit past the last column stays clear
+    assert not np.unpackbits(memory.bits, axis=1)[:, width:].any()
+    for x1 in range(width):
+        for x2 in (x1 + 1, x1 + 9, width + 3):
+            rect = (1, 5, x1, x2)
+            assert np.array_equal(memory.viewport(rect), seen[1:5, x1:x2])
+            assert list(memory.cells(rect)) == \
+                [(y + 1, x + x1) for y, x in zip(*seen[1:5, x1:x2].nonzero())]
+    G = grid.ArrayGrid(height, width, ".")
+    G[2, 0:width] = "#"
+    rows = ["".join(t if s else " " for t, s in zip(row, seen_row))
+            for row, seen_row in zip(str(G).split("\n"), seen)]
+    assert memory.snapshot(G) == rows
@@ -0,0 +1,146 @@
+"tilememory.py - Which cells an actor has seen, one bit per cell."
+
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+import fov
+import grid
+from grid import GridLocation
+
+# (y1, y2, x1, x2), half-open
+Rect = Tuple[int, int, int, int]
+
+# set bits per byte value
+_popcount = np.array([bin(b).count("1") for b in range(256)], dtype=np.uint8)
+
+
+class TileMemory:
+    ''' Explored cells for one actor or faction, packed 8 to a byte
+
+    Each row is packed on its own (np.packbits along x), so a viewport is a
+    slice of whole rows and a run of bytes, and ORing a field of view in
+    only touches the bytes under its box.  A 1000x1000 map costs 125 kB per
+    memory; merging what two factions know is one array OR.
+
+    Only whether a cell was seen is kept, so snapshot() draws remembered
+    cells as they are now, not as they were last seen.
+
+    Usage::
+
+        memory = TileMemory(G.height, G.width)
+        memory.remember(view.mask())         # every turn
+        rows = memory.snapshot(G, (y1, y2, x1, x2))
+        if (y, x) in memory: ...
+
+    Attributes
+    ----------
+    bits : np.ndarray
+        (height, ceil(width / 8)) uint8, bit 7 of byte b is x = 8 * b
+    '''
+
+    def __init__(self, height: int, width: int):
+        self.height, self.width = height, width
+        self.bits = np.zeros((height, (width + 7) // 8), dtype=np.uint8)
+
+    @classmethod
+    def for_grid(cls, G: grid.Grid) -> "TileMemory":
+        return cls(G.height, G.width)
+
+    #------------------------------
+    # Updates
+    #------------------------------
+    def remember(self, visible) -> None:
+        ''' OR a FOVMask, or a (height, width) bool array, into the memory '''
+        if isinstance(visible, fov.FOVMask):
+            bits, y, x = visible.bits, visible.y, visible.x
+        else:
+            bits, y, x = np.asarray(visible, dtype=bool), 0, 0
+        h, w = bits.shape
+        # clip to the map
+        y1, y2 = max(y, 0), min(y + h, self.height)
+        x1, x2 = max(x, 0), min(x + w, self.width)
+        if y1 >= y2 or x1 >= x2:
+            return
+        bits = bits[y1 - y : y2 - y, x1 - x : x2 - x]
+        b1, b2 = x1 >> 3, (x2 + 7) >> 3
+        shift = x1 - 8 * b1
+        if shift or x2 - x1 != 8 * (b2 - b1):
+            # pad out to whole bytes
+            padded = np.zeros((y2 - y1, 8 * (b2 - b1)), dtype=bool)
+            padded[:, shift : shift + x2 - x1] = bits
+            bits = padded
+        self.bits[y1:y2, b1:b2] |= np.packbits(bits, axis=1)
+
+    def merge(self, other: "TileMemory") -> None:
+        ''' Learn everything other has seen '''
+        self.bits |= other.bits
+
+    def clear(self) -> None:
+        self.bits[:] = 0
+
+    #------------------------------
+    # Queries
+    #------------------------------
+    def __contains__(self, loc: GridLocation) -> bool:
+        y, x = loc
+        if not (0 <= y < self.height and 0 <= x < self.width):
+            return False
+        return bool(self.bits[y, x >> 3] >> (7 - (x & 7)) & 1)
+
+    def __len__(self) -> int:
+        ''' Number of cells remembered '''
+        return int(_popcount[self.bits].sum(dtype=np.int64))
+
+    def viewport(self, rect: Optional[Rect] = None) -> np.ndarray:
+        ''' (y2 - y1, x2 - x1) bool array of the remembered cells in rect (default the whole map) '''
+        y1, y2, x1, x2 = self._clip(rect)
+        b1 = x1 >> 3
+        row = np.unpackbits(self.bits[y1:y2, b1 : (x2 + 7) >> 3], axis=1)
+        return row[:, x1 - 8 * b1 : x2 - 8 * b1].astype(bool)
+
+    def cells(self, rect: Optional[Rect] = None) -> Iterator[GridLocation]:
+        ''' Remembered (y, x) cells in rect, row-major '''
+        y1, y2, x1, x2 = self._clip(rect)
+        ys, xs = self.viewport((y1, y2, x1, x2)).nonzero()
+        return zip((ys + y1).tolist(), (xs + x1).tolist())
+
+    def snapshot(self, G: grid.Grid, rect: Optional[Rect] = None, blank: str = " ") -> List[str]:
+        ''' Rows of G's tiles in rect, with blank for cells never seen '''
+        y1, y2, x1, x2 = self._clip(rect)
+        seen = self.viewport((y1, y2, x1, x2))
+        if isinstance(G, grid.ArrayGrid):
+            tiles = np.array(G.palette.tiles, dtype=object)[G.tiles[y1:y2, x1:x2]]
+        else:
+            tiles = np.array([[G[y, x] for x in range(x1, x2)] for y in range(y1, y2)], dtype=object)
+        return ["".join(row) for row in np.where(seen, tiles, blank).tolist()]
+
+    @property
+    def nbytes(self) -> int:
+        return self.bits.nbytes
+
+    def _clip(self, rect: Optional[Rect]) -> Rect:
+        if rect is None:
+            return 0, self.height, 0, self.width
+        y1, y2, x1, x2 = rect
+        y1, x1 = max(y1, 0), max(x1, 0)
+        return y1, max(min(y2, self.height), y1), x1, max(min(x2, self.width), x1)
+
+
+if __name__ == "__main__":
+    import random
+    from dungeon_gen import DungeonGenerator
+
+    random.seed(0)
+    D = DungeonGenerator(width=60, height=20, num_rooms=6)
+    G = D.grid
+    view = fov.ArrayFOV.from_grid(G)
+    memory = TileMemory.for_grid(G)
+    ys, xs = G.layer("passable").nonzero()
+    loc = (int(ys[0]), int(xs[0]))
+    for _ in range(40):
+        view.compute(loc, 6)
+        memory.remember(view.mask())
+        loc = random.choice([c for c in G.neighbors(loc) if G.layer("passable")[c]] or [loc])
+    print("\n".join(memory.snapshot(G)))
+    print(f"{len(memory)} cells remembered in {memory.nbytes} bytes")
@@ -145,7 +145,10 @@ import dungeon_gen
 import fov
 import random
 import astar
+import dijkstra
 import grid
+import fovcache
+import tilememory
 
 class PlayerCharacter:
     def __init__(self):
@@ -160,25 +163,31 @@ class Monster:
 
     def get_path(self, G: grid.Grid, goal: grid.Location):
         
-        came_from, path_so_far = astar.a_star_search( self.cost_dict,
-                                                      self.impassable_list,
-                                                      G,
-                                                      self.loc,
-                                                      goal, max_length=999)
-        path = astar.reconstruct_path(came_from, start=self.loc, goal=goal)
+        path = astar.a_star_path( self.cost_dict,
+                                  self.impassable_list,
+                                  G,
+                                  self.loc,
+                                  goal, max_length=999)
 
         return path
 
 
 class GameEngine:
-    def __init__(self, width, height):
+    def __init__(self, width, height, fog_of_war=False):
         self.MAP = dungeon_gen.DungeonGenerator(width-1, height-1)
         self.PC  = PlayerCharacter()
         pc_loc = self.find_empty_square()
         self.PC.loc = pc_loc
-        self.FOV = fov.FOVMap(self.MAP.grid.width,
-                              self.MAP.grid.height,
-                              self.BlocksVision)
+        # cached layers are patched in place on writes, so hold on to them
+        self.blocks_vision = self.MAP.grid.layer('blocks_vision')
+        self.passable = self.MAP.grid.layer('passable')
+        self.FOV = fov.ArrayFOV(self.blocks_vision,
+                                self.MAP.grid.width,
+                                self.MAP.grid.height)
+        self.fov_cache = fovcache.FOVCache(self.MAP.grid, self.FOV)
+        # cells the PC has seen; with fog_of_war only those are drawn
+        self.memory = tilememory.TileMemory.for_grid(self.MAP.grid)
+        self.fog_of_war = fog_of_war
         
         # TEST
         sample_monster = Monster()
@@ -190,12 +199,14 @@ class GameEngine:
         sample_monster.loc = (y,x)
         
         self.monsters = [sample_monster]
+        # one distance map to the PC per monster cost profile, shared by all
+        self.chase_maps = {}
 
     def BlocksVision(self, x, y):
-        return self.MAP.grid[y,x] in ['+', '#']
+        return self.blocks_vision[y,x]
 
     def PathfindPass(self, x, y):
-        return self.MAP.grid[y,x] in ['.', ' ', '+']
+        return self.passable[y,x]
 
     def find_empty_square(self):
         while True:
@@ -207,13 +218,34 @@ class GameEngine:
     def get_tile(self, y, x):
         return self.MAP.grid[y,x]
 
+    def seen(self, loc):
+        ''' Is this loc drawn?  Everything is, unless fog_of_war is on '''
+        return not self.fog_of_war or loc in self.memory
+
+    def seen_cells(self, rect):
+        ''' The drawn (y, x) cells in rect '''
+        y1, y2, x1, x2 = rect
+        if self.fog_of_war:
+            return self.memory.cells(rect)
+        return ((y, x) for y in range(y1, y2) for x in range(x1, x2))
+
+    def chase_map(self, monster):
+        ''' Distance map to the PC for this monster's costs, rebuilt when the PC or map changes '''
+        key = tuple(sorted(monster.cost_dict.items()))
+        chase = self.chase_maps.get(key)
+        if chase is None:
+            chase = self.chase_maps[key] = dijkstra.DistanceMap(self.MAP.grid,
+                                                                monster.cost_dict,
+                                                                max_distance=999)
+        if self.PC.loc not in chase.sources or chase.version != self.MAP.grid.version:
+            chase.compute([self.PC.loc])
+        return chase
+
     def move_monster(self, monster_idx):
         monster = self.monsters[monster_idx]
-        path = monster.get_path( self.MAP.grid, self.PC.loc) #self.PC.y, self.PC.x, self.PathfindPass)
+        new_pos = self.chase_map(monster).next_step(monster.loc)
         old_pos = monster.loc
-        if path:
-            dx, dy = path[0][1] - monster.loc[1], path[0][0] - monster.loc[0]
-            new_pos = ( monster.loc[0] + dy, monster.loc[1] + dx )
+        if new_pos:
             tile = self.MAP.grid[new_pos]
             if tile in monster.impassable_list: 
                 return old_pos, old_pos
@@ -232,22 +264,17 @@ class GameEngine:
         old_y, old_x = self.PC.loc
 
         moved = False
-        if self.MAP.grid[(new_y, new_x)] not in [' ', '.', '+']:
+        if not self.passable[new_y, new_x]:
             pass
         else:
             self.PC.loc = (new_y, new_x)
             moved = True
         return self.PC.loc[0], self.PC.loc[1], old_y, old_x, moved
 
-    def calc_fov(self, loc):
-        new_fov = set()
-        y, x = loc
-        for i, j in self.FOV.Ball(x, y, 2):
-            distance_squared = (i - x) ** 2 + (j - y) ** 2
-            if distance_squared <= 3**2:
-                new_fov.add((i, j))
-            new_fov.add((i,j))
-        return new_fov
+    def calc_fov(self, loc) -> fov.FOVMask:
+        visible = self.fov_cache.mask(loc, 2)
+        self.memory.remember(visible)
+        return visible
 
 #@profile
 def main(stdscr):
@@ -255,14 +282,16 @@ def main(stdscr):
     UI = GameUI(stdscr)
     Engine = GameEngine(UI.pad_width, UI.pad_height)
     
-    for y in range(Engine.MAP.height):
-        for x in range(Engine.MAP.width):
-            UI.PutChar((y,x),Engine.MAP.grid[y,x], curses.color_pair(1))
+    if not Engine.fog_of_war:
+        for y in range(Engine.MAP.height):
+            for x in range(Engine.MAP.width):
+                UI.PutChar((y,x),Engine.MAP.grid[y,x], curses.color_pair(1))
+    map_changes = grid.ChangeCursor(Engine.MAP.grid)
 
 
-    fov = Engine.calc_fov(Engine.PC.loc)
-    for pt in fov:
-        UI.PutChar((pt[1], pt[0]), Engine.MAP.grid[pt[1], pt[0]], 'BOLD')
+    visible = Engine.calc_fov(Engine.PC.loc)
+    for pt in visible:
+        UI.PutChar(pt, Engine.MAP.grid[pt], 'BOLD')
 
     UI.PutChar(Engine.PC.loc, '@', 'BOLD')
     UI.center_on(Engine.PC.loc)
@@ -284,24 +313,40 @@ def main(stdscr):
                 #---------------------------------------------------
                 # FOV Example
                 #---------------------------------------------------
-                new_fov = Engine.calc_fov(Engine.PC.loc)
+                new_visible = Engine.calc_fov(Engine.PC.loc)
+                shown, hidden = visible.diff(new_visible)
+
+                for pt in hidden:
+                    UI.PutChar(pt, Engine.MAP.grid[pt], '')
 
-                for pt in fov ^ new_fov:
-                    UI.PutChar((pt[1], pt[0]), Engine.MAP.grid[pt[1], pt[0]], '')
+                for pt in shown:
+                    UI.PutChar(pt, Engine.MAP.grid[pt], 'BOLD')
 
-                for pt in new_fov:
-                    UI.PutChar((pt[1], pt[0]), Engine.MAP.grid[pt[1], pt[0]], 'BOLD')
+                # the old position was cleared above but may still be in view
+                if (old_y, old_x) in new_visible:
+                    UI.PutChar((old_y, old_x), Engine.MAP.grid[old_y, old_x], 'BOLD')
 
                 UI.PutChar((new_y, new_x), '@', 'BOLD')
 
-                fov = new_fov
+                visible = new_visible
+
+                #-------------------------------------------------
+                # Repaint map tiles that changed since last turn
+                #-------------------------------------------------
+                dirty = map_changes.drain()
+                if dirty is None:
+                    dirty = [(0, Engine.MAP.height, 0, Engine.MAP.width)]
+                for y1, y2, x1, x2 in dirty:
+                    for y, x in Engine.seen_cells((y1, y2, x1, x2)):
+                        attr = 'BOLD' if (y, x) in visible else ''
+                        UI.PutChar((y, x), Engine.MAP.grid[y, x], attr)
 
                 #-------------------------------------------------
                 # Move Monsters
                 #-------------------------------------------------
                 for idx, monster in enumerate(Engine.monsters):
                     old_pos, new_pos = Engine.move_monster(0) 
-                    UI.PutChar(old_pos, Engine.MAP.grid[old_pos[0], old_pos[1]], 'BOLD')
+                    UI.PutChar(old_pos, Engine.MAP.grid[old_pos] if Engine.seen(old_pos) else ' ', 'BOLD')
                     UI.PutChar(monster.loc, monster.symbol, 'BOLD')
                         
 